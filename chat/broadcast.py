@@ -0,0 +1,54 @@
+"""Channel-layer fan-out shared by the per-pair chat sockets and the per-user inbox sockets.
+
+Every message and read receipt goes to the legacy pair room (chat_<low>_<high>)
+and to the user_<id> group of both participants, so clients on either kind of
+socket see the same conversation.
+"""
+
+
+def room_group_name(user_a_id, user_b_id):
+    low, high = sorted((int(user_a_id), int(user_b_id)))
+    return f"chat_{low}_{high}"
+
+
+def user_group_name(user_id):
+    return f"user_{int(user_id)}"
+
+
+def _participant_groups(user_a_id, user_b_id):
+    return {user_group_name(user_a_id), user_group_name(user_b_id)}
+
+
+async def broadcast_message(channel_layer, message, conversation_id):
+    await channel_layer.group_send(room_group_name(message.sender_id, message.receiver_id), {
+        "type": "chat_message",
+        "sender": str(message.sender_id),
+        "message": message.message,
+    })
+    event = {
+        "type": "inbox_message",
+        "conversation_id": conversation_id,
+        "id": message.id,
+        "sender": message.sender_id,
+        "receiver": message.receiver_id,
+        "message": message.message,
+        "timestamp": message.timestamp.isoformat(),
+    }
+    for group in _participant_groups(message.sender_id, message.receiver_id):
+        await channel_layer.group_send(group, event)
+
+
+async def broadcast_read(channel_layer, reader_id, other_user_id, up_to, conversation_id):
+    await channel_layer.group_send(room_group_name(reader_id, other_user_id), {
+        "type": "read_receipt",
+        "reader": reader_id,
+        "up_to": up_to,
+    })
+    event = {
+        "type": "inbox_read",
+        "conversation_id": conversation_id,
+        "reader": reader_id,
+        "up_to": up_to,
+    }
+    for group in _participant_groups(reader_id, other_user_id):
+        await channel_layer.group_send(group, event)
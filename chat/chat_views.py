@@ -4,10 +4,12 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from django.apps import apps  # Add this import
-from django.db.models import Q
+from django.db.models import F, Q
 import json
 
-from .models import Chat
+from .conversations import save_message
+from .models import Chat, Conversation, conversation_key
+from .serializer import ChatHistoryQuerySerializer
 
 User = get_user_model()
 
@@ -15,24 +17,50 @@ User = get_user_model()
 def get_appointment_model():
     return apps.get_model('full_emr', 'Appointment')
 
+def serialize_message(msg):
+    return {
+        'id': msg.id,
+        'sender': msg.sender_id,
+        'receiver': msg.receiver_id,
+        'message': msg.message,
+        'timestamp': msg.timestamp.isoformat()
+    }
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_chat_history(request, user1_id, user2_id):
+    """One page of a conversation, oldest first.
+
+    Without a cursor this is the latest `limit` messages. Pass `before=<id>` (the
+    page's `before`) to go further back, or `after=<id>` (its `after`) to fetch
+    messages that arrived since.
+    """
+    if request.user.id not in (user1_id, user2_id):
+        return Response({'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
+    query = ChatHistoryQuerySerializer(data=request.query_params)
+    query.is_valid(raise_exception=True)
+    limit = query.validated_data['limit']
     try:
-        messages = Chat.objects.filter(
-            Q(sender_id=user1_id, receiver_id=user2_id) |
-            Q(sender_id=user2_id, receiver_id=user1_id)
-        ).order_by('timestamp')
-
-        message_data = [{
-            'id': msg.id,
-            'sender': msg.sender_id,
-            'receiver': msg.receiver_id,
-            'message': msg.message,
-            'timestamp': msg.timestamp.isoformat()
-        } for msg in messages]
-
-        return Response(message_data)
+        # Both directions share a conversation_key, so each page is one range scan of (conversation_key, id).
+        messages = Chat.objects.filter(conversation_key=conversation_key(user1_id, user2_id))
+        if 'after' in query.validated_data:
+            page = list(messages.filter(id__gt=query.validated_data['after']).order_by('id')[:limit + 1])
+            has_more = len(page) > limit
+            page = page[:limit]
+        else:
+            if 'before' in query.validated_data:
+                messages = messages.filter(id__lt=query.validated_data['before'])
+            page = list(messages.order_by('-id')[:limit + 1])
+            has_more = len(page) > limit
+            page = page[:limit][::-1]
+
+        return Response({
+            'messages': [serialize_message(msg) for msg in page],
+            'has_more': has_more,
+            'before': page[0].id if page else query.validated_data.get('before'),
+            'after': page[-1].id if page else query.validated_data.get('after'),
+        })
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -91,19 +119,10 @@ def send_message(request):
         if request.user.id != sender_id:
             return Response({'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
 
-        chat_message = Chat.objects.create(
-            sender=User.objects.get(id=sender_id),
-            receiver=User.objects.get(id=receiver_id),
-            message=message
-        )
+        receiver = User.objects.get(id=receiver_id)
+        chat_message = save_message(sender_id, receiver.id, message)
 
-        return Response({
-            'id': chat_message.id,
-            'sender': chat_message.sender_id,
-            'receiver': chat_message.receiver_id,
-            'message': chat_message.message,
-            'timestamp': chat_message.timestamp.isoformat()
-        })
+        return Response(serialize_message(chat_message))
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -130,15 +149,27 @@ def get_user_profile(request, user_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_conversations(request):
-    """List all chat conversations for a user"""
-    user = request.user
-    chats = Chat.objects.filter(Q(sender=user) | Q(receiver=user))
-    participants = set()
-    for chat in chats:
-        participants.add(chat.sender)
-        participants.add(chat.receiver)
-    participants.discard(user)
-    data = [{'id': u.id, 'first_name': u.first_name, 'last_name': u.last_name} for u in participants]
+    """List the user's conversations, most recent first, with a preview and unread count"""
+    user_id = request.user.id
+    conversations = Conversation.objects.filter(
+        Q(user_low_id=user_id) | Q(user_high_id=user_id)
+    ).select_related('user_low', 'user_high').order_by(F('last_message_at').desc(nulls_last=True))
+    data = []
+    for conversation in conversations:
+        other = conversation.other_user(user_id)
+        data.append({
+            'id': other.id,
+            'first_name': other.first_name,
+            'last_name': other.last_name,
+            'conversation_id': conversation.id,
+            'last_message': {
+                'id': conversation.last_message_id,
+                'sender': conversation.last_sender_id,
+                'preview': conversation.last_message_preview,
+                'timestamp': conversation.last_message_at.isoformat() if conversation.last_message_at else None,
+            },
+            'unread_count': conversation.unread_for(user_id),
+        })
     return Response(data)
 
 @api_view(['GET'])
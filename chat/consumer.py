@@ -1,140 +1,253 @@
 import json
+import time
+
+from urllib.parse import parse_qs
+
+from django.conf import settings
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
-from .models import Chat
+from rest_framework_simplejwt.settings import api_settings
+from full_emr.authentication import get_cached_user
+from full_emr.revocation import is_token_revoked
+from .broadcast import broadcast_message, broadcast_read, room_group_name, user_group_name
+from .conversations import conversation_id, mark_read
+from .receipts import ReadReceiptCoalescer
+from .tracing import tracer
+from .writebehind import store_message
 
 User = get_user_model()
 
-print("🔍 DEBUG CONSUMER LOADED - WebSocket consumer is being imported!")
+def user_from_token(token_key):
+    """The active user a JWT access token belongs to, or AnonymousUser."""
+    try:
+        access_token = AccessToken(token_key)
+        user = get_cached_user(access_token[api_settings.USER_ID_CLAIM])
+    except (TokenError, InvalidToken, KeyError, User.DoesNotExist):
+        return AnonymousUser()
+    if not user.is_active or is_token_revoked(access_token, user):
+        return AnonymousUser()
+    return user
+
+
+async def send_and_trace(channel_layer, sender_id, receiver_id, text, get_conversation_id):
+    """Store a message and fan it out, timing the store and the fan-out separately."""
+    started = time.perf_counter()
+    chat_message = await store_message(sender_id, receiver_id, text)
+    stored = time.perf_counter()
+    # Send to the pair's room and to both participants' inbox sockets
+    await broadcast_message(channel_layer, chat_message, await get_conversation_id())
+    done = time.perf_counter()
+    tracer.timing("store", stored - started)
+    tracer.timing("fanout", done - stored)
+    tracer.count("messages")
+    tracer.event("message", id=chat_message.id, sender=sender_id, receiver=receiver_id,
+                 store_ms=f"{(stored - started) * 1000:.1f}", fanout_ms=f"{(done - stored) * 1000:.1f}")
+    tracer.payload("message", id=chat_message.id, text=json.dumps(text))
+
 
 class PrivateChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
+        started = time.perf_counter()
         # 1. Get user IDs from URL and create room name
         self.user1_id = self.scope["url_route"]["kwargs"]["user1_id"]
         self.user2_id = self.scope["url_route"]["kwargs"]["user2_id"]
-        print(f"[WS CONSUMER] Connecting to chat between users {self.user1_id} and {self.user2_id}")
-
-        user_ids = sorted([int(self.user1_id), int(self.user2_id)])
-        self.room_group_name = f"chat_{user_ids[0]}_{user_ids[1]}"
-        print(f"[WS CONSUMER] Room group name: {self.room_group_name}")
+        self.room_group_name = room_group_name(self.user1_id, self.user2_id)
 
         # 2. Check for JWT Token in query string (e.g., ?token=xyz)
-        query_string = self.scope.get("query_string", b"").decode("utf-8")
-        print(f"[WS CONSUMER] Query string: {query_string}")
-
-        token_key = None
-        for part in query_string.split('&'):
-            if part.startswith('token='):
-                token_key = part.split('=')[1]
-                break
-
-        print(f"[WS CONSUMER] Token found: {token_key is not None}")
-        print(f"[WS CONSUMER] Token length: {len(token_key) if token_key else 0}")
-
+        token_key = parse_qs(self.scope.get("query_string", b"").decode("utf-8")).get("token", [None])[0]
         if not token_key:
-            print("[WS CONSUMER] No token provided - closing connection")
+            tracer.count("connect.rejected.no_token")
             await self.close(code=4403)  # Custom code for "No Token"
             return
 
         # 3. Validate JWT Token and get user
-        print("[WS CONSUMER] Validating JWT token...")
-        user = await self.get_user_from_token(token_key)
-        print(f"[WS CONSUMER] User from token: {user}")
-        print(f"[WS CONSUMER] User ID: {user.id if user and not isinstance(user, AnonymousUser) else 'None'}")
-
-        if user is None or isinstance(user, AnonymousUser):
-            print("[WS CONSUMER] Invalid token - closing connection")
+        user = await database_sync_to_async(user_from_token)(token_key)
+        if isinstance(user, AnonymousUser):
+            tracer.count("connect.rejected.invalid_token")
             await self.close(code=4401)  # Custom code for "Invalid Token"
             return
 
         # 4. AUTHORIZATION: Check if the authenticated user is one of the chat participants
-        print(f"[WS CONSUMER] Checking authorization for user {user.id} in chat between {self.user1_id} and {self.user2_id}")
         if user.id != int(self.user1_id) and user.id != int(self.user2_id):
-            print(f"[WS CONSUMER] User {user.id} not authorized for chat between {self.user1_id} and {self.user2_id}")
+            tracer.count("connect.rejected.not_participant")
             await self.close(code=4403)  # Custom code for "Not a Participant"
             return
 
-        print(f"[WS CONSUMER] Authentication successful for user {user.id}")
         # 5. All checks passed, store user and accept connection
         self.scope["user"] = user
+        self.read_receipts = ReadReceiptCoalescer(settings.CHAT_READ_RECEIPT_WINDOW_MS / 1000, self.apply_read_receipt)
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
-        print("[WS CONSUMER] WebSocket connection accepted!")
+        elapsed = time.perf_counter() - started
+        tracer.timing("connect", elapsed)
+        tracer.count("connect")
+        tracer.event("connect", consumer="room", user=user.id, room=self.room_group_name, ms=f"{elapsed * 1000:.1f}")
 
     async def disconnect(self, close_code):
-        print(f"[WS CONSUMER] Disconnecting with code: {close_code}")
-        # Leave room group
-        if hasattr(self, 'room_group_name'):
-            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        try:
+            if hasattr(self, 'read_receipts'):
+                await self.read_receipts.close()
+        finally:
+            # Leave room group
+            if hasattr(self, 'room_group_name'):
+                await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+            tracer.count("disconnect")
 
     async def receive(self, text_data):
         """Receive a message from WebSocket, save it, then broadcast"""
-        print(f"[WS CONSUMER] Received message: {text_data}")
         try:
             data = json.loads(text_data)
+            if data.get("type") == "read":
+                # {"type": "read", "up_to": <message id>}: everything up to that message has been seen.
+                self.read_receipts.add(self.other_user_id(), int(data["up_to"]))
+                tracer.count("frames.read")
+                return
             message_text = data["message"]
-            sender_id = str(self.scope["user"].id)  # Use the authenticated user's ID
-
-            print(f"[WS CONSUMER] Processing message from user {sender_id}: {message_text}")
-
-            # Save message in DB
-            await self.save_message(sender_id, self.user2_id if sender_id == self.user1_id else self.user1_id, message_text)
-
-            # Send to group
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "chat_message",
-                    "sender": sender_id,
-                    "message": message_text,
-                }
-            )
-            print("[WS CONSUMER] Message broadcasted to group")
-        except json.JSONDecodeError as e:
-            print(f"[WS CONSUMER] JSON decode error: {e}")
-            # Handle invalid JSON
-            pass
-        except KeyError as e:
-            print(f"[WS CONSUMER] Missing key error: {e}")
-            # Handle missing 'message' key
-            pass
+        except (json.JSONDecodeError, AttributeError, KeyError, TypeError, ValueError):
+            # Invalid JSON, a missing 'message' key or a read receipt without a numeric message id
+            tracer.count("frames.malformed")
+            return
+        await send_and_trace(self.channel_layer, self.scope["user"].id, self.other_user_id(), message_text,
+                             self.get_conversation_id)
 
     async def chat_message(self, event):
         """Receive message from group and send to WebSocket"""
-        print(f"[WS CONSUMER] Broadcasting message to WebSocket: {event}")
         await self.send(text_data=json.dumps({
             "sender": event["sender"],
             "message": event["message"],
         }))
 
-    @database_sync_to_async
-    def get_user_from_token(self, token_key):
-        print(f"[WS CONSUMER] Decoding token: {token_key[:50]}...")
+    async def read_receipt(self, event):
+        """Tell both participants how far the reader has read"""
+        await self.send(text_data=json.dumps({
+            "type": "read",
+            "reader": event["reader"],
+            "up_to": event["up_to"],
+        }))
+
+    def other_user_id(self):
+        user_id = self.scope["user"].id
+        return int(self.user2_id) if user_id == int(self.user1_id) else int(self.user1_id)
+
+    async def apply_read_receipt(self, other_user_id, up_to):
+        reader_id = self.scope["user"].id
+        marked = await database_sync_to_async(mark_read)(reader_id, other_user_id, up_to)
+        if marked:
+            await broadcast_read(self.channel_layer, reader_id, other_user_id, up_to, await self.get_conversation_id())
+
+    async def get_conversation_id(self):
+        if getattr(self, 'conversation_id', None) is None:
+            self.conversation_id = await database_sync_to_async(conversation_id)(self.user1_id, self.user2_id)
+        return self.conversation_id
+
+
+class InboxConsumer(AsyncWebsocketConsumer):
+    """One socket per user for all of their conversations (ws/inbox/?token=<access token>).
+
+    Client frames:
+        {"type": "message", "to": <user id>, "message": "..."}
+        {"type": "read", "with": <user id>, "up_to": <message id>}
+    Server frames carry the conversation_id they belong to:
+        {"type": "message", "conversation_id", "id", "sender", "receiver", "message", "timestamp"}
+        {"type": "read", "conversation_id", "reader", "up_to"}
+        {"type": "error", "error": "..."}
+    """
+
+    async def connect(self):
+        started = time.perf_counter()
+        token_key = parse_qs(self.scope.get("query_string", b"").decode("utf-8")).get("token", [None])[0]
+        if not token_key:
+            tracer.count("connect.rejected.no_token")
+            await self.close(code=4403)
+            return
+        user = await database_sync_to_async(user_from_token)(token_key)
+        if isinstance(user, AnonymousUser):
+            tracer.count("connect.rejected.invalid_token")
+            await self.close(code=4401)
+            return
+
+        self.scope["user"] = user
+        self.group_name = user_group_name(user.id)
+        self.conversation_ids = {}
+        self.read_receipts = ReadReceiptCoalescer(settings.CHAT_READ_RECEIPT_WINDOW_MS / 1000, self.apply_read_receipt)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        elapsed = time.perf_counter() - started
+        tracer.timing("connect", elapsed)
+        tracer.count("connect")
+        tracer.event("connect", consumer="inbox", user=user.id, ms=f"{elapsed * 1000:.1f}")
+
+    async def disconnect(self, close_code):
         try:
-            access_token = AccessToken(token_key)
-            user_id = access_token['user_id']
-            print(f"[WS CONSUMER] Token decoded successfully, user_id: {user_id}")
-            user = User.objects.get(id=user_id)
-            print(f"[WS CONSUMER] User found: {user}")
-            return user
-        except (TokenError, InvalidToken) as e:
-            print(f"[WS CONSUMER] Token validation error: {e}")
-            return AnonymousUser()
-        except User.DoesNotExist as e:
-            print(f"[WS CONSUMER] User not found: {e}")
-            return AnonymousUser()
-
-    @database_sync_to_async
-    def save_message(self, sender_id, receiver_id, message):
-        print(f"[WS CONSUMER] Saving message from {sender_id} to {receiver_id}")
-        chat_message = Chat.objects.create(
-            sender_id=int(sender_id),
-            receiver_id=int(receiver_id),
-            message=message
-        )
-        print(f"[WS CONSUMER] Message saved with ID: {chat_message.id}")
-        return chat_message
\ No newline at end of file
+            if hasattr(self, 'read_receipts'):
+                await self.read_receipts.close()
+        finally:
+            if hasattr(self, 'group_name'):
+                await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            tracer.count("disconnect")
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+            kind = data.get("type")
+            if kind == "message":
+                await self.send_chat(int(data["to"]), data["message"])
+            elif kind == "read":
+                other_user_id = int(data["with"])
+                if other_user_id == self.scope["user"].id:
+                    await self.send_error("Cannot send a read receipt to yourself")
+                    return
+                self.read_receipts.add(other_user_id, int(data["up_to"]))
+                tracer.count("frames.read")
+            else:
+                tracer.count("frames.malformed")
+                await self.send_error("Unknown frame type")
+        except (json.JSONDecodeError, AttributeError, KeyError, TypeError, ValueError):
+            tracer.count("frames.malformed")
+            await self.send_error("Malformed frame")
+
+    async def send_chat(self, receiver_id, text):
+        if not isinstance(text, str) or not text.strip():
+            await self.send_error("Message text is required")
+            return
+        if receiver_id == self.scope["user"].id:
+            await self.send_error("Cannot send a message to yourself")
+            return
+        if not await database_sync_to_async(self.user_exists)(receiver_id):
+            await self.send_error("Recipient not found")
+            return
+        await send_and_trace(self.channel_layer, self.scope["user"].id, receiver_id, text,
+                             lambda: self.get_conversation_id(receiver_id))
+
+    async def apply_read_receipt(self, other_user_id, up_to):
+        reader_id = self.scope["user"].id
+        marked = await database_sync_to_async(mark_read)(reader_id, other_user_id, up_to)
+        if marked:
+            await broadcast_read(self.channel_layer, reader_id, other_user_id, up_to,
+                                 await self.get_conversation_id(other_user_id))
+
+    async def get_conversation_id(self, other_user_id):
+        if self.conversation_ids.get(other_user_id) is None:
+            self.conversation_ids[other_user_id] = await database_sync_to_async(conversation_id)(
+                self.scope["user"].id, other_user_id)
+        return self.conversation_ids[other_user_id]
+
+    @staticmethod
+    def user_exists(user_id):
+        try:
+            return get_cached_user(user_id).is_active
+        except User.DoesNotExist:
+            return False
+
+    async def send_error(self, error):
+        await self.send(text_data=json.dumps({"type": "error", "error": error}))
+
+    async def inbox_message(self, event):
+        await self.send(text_data=json.dumps({**event, "type": "message"}))
+
+    async def inbox_read(self, event):
+        await self.send(text_data=json.dumps({**event, "type": "read"}))
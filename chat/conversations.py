@@ -0,0 +1,130 @@
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+
+from .models import Chat, Conversation, conversation_key
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_LENGTH = 140
+
+
+def save_message(sender_id, receiver_id, text):
+    """Insert a message and update its conversation's inbox row in one transaction."""
+    with transaction.atomic():
+        message = Chat.objects.create(sender_id=int(sender_id), receiver_id=int(receiver_id), message=text)
+        record_messages([message])
+    return message
+
+
+def record_messages(messages):
+    """Fold saved messages into their Conversation rows; call it in the transaction that saved them.
+
+    Each conversation gets one UPDATE however many of its messages are in the batch.
+    Unread counters are incremented in SQL, and the last-message fields only move
+    forward, so concurrent writers cannot lose counts or step back to an older message.
+    """
+    by_key = {}
+    for message in messages:
+        by_key.setdefault(message.conversation_key, []).append(message)
+
+    for key, group in by_key.items():
+        low, high = (int(part) for part in key.split(':'))
+        latest = max(group, key=lambda message: message.id)
+        unread = {
+            'unread_low': sum(1 for message in group if message.receiver_id == low and not message.is_read),
+            'unread_high': sum(1 for message in group if message.receiver_id == high and not message.is_read),
+        }
+        latest_fields = {
+            'last_message': latest.id,
+            'last_sender': latest.sender_id,
+            'last_message_at': latest.timestamp,
+            'last_message_preview': latest.message[:PREVIEW_LENGTH],
+        }
+        if _apply(key, latest.id, latest_fields, unread):
+            continue
+        try:
+            with transaction.atomic():
+                Conversation.objects.create(
+                    key=key, user_low_id=low, user_high_id=high,
+                    **{f"{field}_id" if field in ('last_message', 'last_sender') else field: value
+                       for field, value in latest_fields.items()},
+                    **unread,
+                )
+        except IntegrityError:
+            # Another writer created the row first.
+            _apply(key, latest.id, latest_fields, unread)
+
+
+def conversation_id(user_a_id, user_b_id):
+    """Id of the Conversation between two users, or None before their first message."""
+    return Conversation.objects.filter(key=conversation_key(user_a_id, user_b_id)).values_list('id', flat=True).first()
+
+
+def mark_read(reader_id, other_user_id, up_to):
+    """Mark messages to `reader_id` up to message `up_to` as read; returns how many changed.
+
+    One UPDATE flips the rows and the reader's unread counter drops by exactly
+    that many, so concurrent receipts for overlapping ranges cannot double count.
+    The reader's watermark is kept on the Conversation row, locked first, so a
+    write-behind flush of older messages (see apply_read_watermarks) either
+    commits before this UPDATE sees its rows or inserts them already read.
+    Receipts for a conversation with no row yet, or with no message to the
+    reader, change nothing.
+    """
+    key = conversation_key(reader_id, other_user_id)
+    low = int(key.split(':')[0])
+    side = 'low' if int(reader_id) == low else 'high'
+    with transaction.atomic():
+        conversation = Conversation.objects.select_for_update().filter(key=key).first()
+        if conversation is None:
+            # Rows are only created by saved messages; a receipt never adds an empty conversation to the inbox.
+            return 0
+        marked = Chat.objects.filter(
+            conversation_key=key, receiver_id=reader_id, is_read=False, id__lte=up_to,
+        ).update(is_read=True)
+        watermark, counter = f"read_up_to_{side}", f"unread_{side}"
+        if not marked and (up_to <= getattr(conversation, watermark)
+                           or not Chat.objects.filter(conversation_key=key, receiver_id=reader_id).exists()):
+            # Nothing new was read, or the reader has never been sent a message here.
+            return 0
+        Conversation.objects.filter(pk=conversation.pk).update(**{
+            watermark: Greatest(F(watermark), up_to),
+            counter: Greatest(F(counter) - marked, 0),
+        })
+    return marked
+
+
+def apply_read_watermarks(messages):
+    """Set is_read on unsaved messages their receiver has already read past.
+
+    Call it in the transaction that inserts them. It locks their Conversation
+    rows, in key order, until that transaction commits.
+    """
+    keys = sorted({message.conversation_key for message in messages})
+    watermarks = {
+        key: {low: read_low, high: read_high}
+        for key, low, high, read_low, read_high in Conversation.objects.select_for_update().filter(key__in=keys)
+        .order_by('key').values_list('key', 'user_low_id', 'user_high_id', 'read_up_to_low', 'read_up_to_high')
+    }
+    for message in messages:
+        read_up_to = watermarks.get(message.conversation_key, {}).get(message.receiver_id, 0)
+        if message.id <= read_up_to:
+            message.is_read = True
+
+
+def _apply(key, latest_id, latest_fields, unread):
+    newer = Q(last_message__isnull=True) | Q(last_message__lt=latest_id)
+    changes = {
+        field: Case(When(newer, then=Value(value)), default=F(field), output_field=_column_type(field))
+        for field, value in latest_fields.items()
+    }
+    changes.update({field: F(field) + count for field, count in unread.items() if count})
+    return Conversation.objects.filter(key=key).update(**changes)
+
+
+def _column_type(name):
+    field = Conversation._meta.get_field(name)
+    return field.target_field if field.is_relation else field
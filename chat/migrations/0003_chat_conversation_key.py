@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:10
+
+from django.db import migrations, models
+
+
+def fill_conversation_keys(apps, schema_editor):
+    """One UPDATE per (sender, receiver) pair rather than one per message."""
+    Chat = apps.get_model('chat', 'Chat')
+    pairs = Chat.objects.filter(conversation_key='').values_list('sender_id', 'receiver_id').distinct()
+    for sender_id, receiver_id in list(pairs):
+        low, high = sorted((sender_id, receiver_id))
+        Chat.objects.filter(sender_id=sender_id, receiver_id=receiver_id).update(conversation_key=f"{low}:{high}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_chat_is_read_alter_chat_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='conversation_key',
+            field=models.CharField(default='', editable=False, max_length=41),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_conversation_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['conversation_key', 'id'], name='chat_conversation_id_idx'),
+        ),
+    ]
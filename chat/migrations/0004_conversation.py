@@ -0,0 +1,62 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+BATCH_SIZE = 500
+
+
+def build_conversations(apps, schema_editor):
+    """One Conversation per existing conversation_key, with its latest message and unread counts."""
+    Chat = apps.get_model('chat', 'Chat')
+    Conversation = apps.get_model('chat', 'Conversation')
+    unread = {}
+    for key, receiver_id, count in (Chat.objects.filter(is_read=False).values_list('conversation_key', 'receiver_id')
+                                    .annotate(count=Count('id')).order_by()):
+        unread[(key, receiver_id)] = count
+    latest_ids = list(Chat.objects.values('conversation_key').annotate(last_id=Max('id'))
+                      .order_by().values_list('last_id', flat=True))
+    for start in range(0, len(latest_ids), BATCH_SIZE):
+        rows = []
+        for message in Chat.objects.filter(id__in=latest_ids[start:start + BATCH_SIZE]):
+            low, high = (int(part) for part in message.conversation_key.split(':'))
+            rows.append(Conversation(
+                key=message.conversation_key, user_low_id=low, user_high_id=high,
+                last_message_id=message.id, last_sender_id=message.sender_id,
+                last_message_at=message.timestamp, last_message_preview=message.message[:140],
+                unread_low=unread.get((message.conversation_key, low), 0),
+                unread_high=unread.get((message.conversation_key, high), 0),
+            ))
+        Conversation.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_chat_conversation_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=41, unique=True)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('last_message_preview', models.CharField(blank=True, max_length=140)),
+                ('unread_low', models.PositiveIntegerField(default=0)),
+                ('unread_high', models.PositiveIntegerField(default=0)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.chat')),
+                ('last_sender', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_low', '-last_message_at'], name='conversation_low_recent_idx'), models.Index(fields=['user_high', '-last_message_at'], name='conversation_high_recent_idx')],
+            },
+        ),
+        migrations.RunPython(build_conversations, migrations.RunPython.noop),
+    ]
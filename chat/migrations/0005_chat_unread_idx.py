@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_conversation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['conversation_key', 'receiver', 'id'], name='chat_unread_idx'),
+        ),
+    ]
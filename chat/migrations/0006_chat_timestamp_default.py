@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:03
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_chat_unread_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chat',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:17
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_watermarks(apps, schema_editor):
+    """Each side's watermark is the highest message to that user already marked read."""
+    Chat = apps.get_model('chat', 'Chat')
+    Conversation = apps.get_model('chat', 'Conversation')
+
+    def highest_read(receiver):
+        read = (Chat.objects.filter(conversation_key=OuterRef('key'), receiver_id=OuterRef(receiver), is_read=True)
+                .order_by().values('conversation_key').annotate(highest=Max('id')).values('highest'))
+        return Coalesce(Subquery(read), 0)
+
+    Conversation.objects.update(read_up_to_low=highest_read('user_low_id'), read_up_to_high=highest_read('user_high_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_chat_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='read_up_to_high',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='read_up_to_low',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_watermarks, migrations.RunPython.noop),
+    ]
@@ -1,19 +1,72 @@
 # In your chat app models.py
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 User = settings.AUTH_USER_MODEL
 
+def conversation_key(user_a_id, user_b_id):
+    """The same key for both directions of a conversation between two users."""
+    low, high = sorted((int(user_a_id), int(user_b_id)))
+    return f"{low}:{high}"
+
+
 class Chat(models.Model):
     id = models.AutoField(primary_key=True)
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name="sent_messages")
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name="received_messages")
+    # "<lower user id>:<higher user id>", so a conversation is one index range instead of an OR of two directions
+    conversation_key = models.CharField(max_length=41, editable=False)
     message = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # not auto_now_add: write-behind sets it before saving
     is_read = models.BooleanField(default=False)  # Add for read receipts
 
     class Meta:
         ordering = ["timestamp"]
+        indexes = [
+            # History pages walk this with id cursors.
+            models.Index(fields=["conversation_key", "id"], name="chat_conversation_id_idx"),
+            # Read receipts only touch unread rows.
+            models.Index(fields=["conversation_key", "receiver", "id"], condition=models.Q(is_read=False),
+                         name="chat_unread_idx"),
+        ]
 
     def __str__(self):
-        return f"{self.sender} -> {self.receiver}: {self.message[:20]}"
\ No newline at end of file
+        return f"{self.sender} -> {self.receiver}: {self.message[:20]}"
+
+    def save(self, *args, **kwargs):
+        if not self.conversation_key:
+            self.conversation_key = conversation_key(self.sender_id, self.receiver_id)
+        super().save(*args, **kwargs)
+
+
+class Conversation(models.Model):
+    """Inbox row for a pair of users, updated in the transaction that saves each message (see chat.conversations)."""
+    key = models.CharField(max_length=41, unique=True)  # Chat.conversation_key
+    user_low = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    user_high = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    last_message = models.ForeignKey(Chat, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    last_sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_preview = models.CharField(max_length=140, blank=True)
+    # Messages not yet read by user_low / user_high.
+    unread_low = models.PositiveIntegerField(default=0)
+    unread_high = models.PositiveIntegerField(default=0)
+    # Highest message id each user has marked read; write-behind flushes insert older messages as read.
+    read_up_to_low = models.PositiveBigIntegerField(default=0)
+    read_up_to_high = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user_low", "-last_message_at"], name="conversation_low_recent_idx"),
+            models.Index(fields=["user_high", "-last_message_at"], name="conversation_high_recent_idx"),
+        ]
+
+    def __str__(self):
+        return f"Conversation {self.key}"
+
+    def other_user(self, user_id):
+        return self.user_high if self.user_low_id == user_id else self.user_low
+
+    def unread_for(self, user_id):
+        return self.unread_low if self.user_low_id == user_id else self.unread_high
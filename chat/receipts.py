@@ -0,0 +1,51 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ReadReceiptCoalescer:
+    """Collects "read up to message X" watermarks and applies the highest one per conversation once per window.
+
+    A client scrolling through a thread may report dozens of watermarks a second;
+    `flush(other_user_id, up_to)` runs at most once per conversation per window.
+    A watermark whose flush fails is logged and retried in the next window while
+    the socket is open; failures while closing are only logged.
+    """
+
+    def __init__(self, window, flush):
+        self.window = window
+        self.flush = flush
+        self.pending = {}
+        self.task = None
+
+    def add(self, other_user_id, up_to):
+        if up_to > self.pending.get(other_user_id, 0):
+            self.pending[other_user_id] = up_to
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self.task = None
+        for other_user_id, up_to in await self.flush_now():
+            self.add(other_user_id, up_to)
+
+    async def flush_now(self):
+        """Apply every pending watermark; returns the (other_user_id, up_to) pairs that failed."""
+        pending, self.pending = self.pending, {}
+        failed = []
+        for other_user_id, up_to in pending.items():
+            try:
+                await self.flush(other_user_id, up_to)
+            except Exception as e:
+                logger.error(f"Read receipt up to {up_to} with user {other_user_id} failed: {e}", exc_info=True)
+                failed.append((other_user_id, up_to))
+        return failed
+
+    async def close(self):
+        """Apply whatever is still waiting, e.g. when the socket disconnects."""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        await self.flush_now()
@@ -4,4 +4,6 @@ from . import consumer  # <- FIXED THE IMPORT (lowercase 'c')
 # Use this improved regex to only match digits for user IDs
 websocket_urlpatterns = [
     re_path(r"ws/chat/(?P<user1_id>\d+)/(?P<user2_id>\d+)/$", consumer.PrivateChatConsumer.as_asgi()),
+    # One socket per user carrying every conversation; prefer this over a socket per pair.
+    re_path(r"ws/inbox/$", consumer.InboxConsumer.as_asgi()),
 ]
\ No newline at end of file
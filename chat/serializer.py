@@ -0,0 +1,12 @@
+from rest_framework import serializers
+
+
+class ChatHistoryQuerySerializer(serializers.Serializer):
+    before = serializers.IntegerField(min_value=1, required=False)
+    after = serializers.IntegerField(min_value=0, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=200, required=False, default=50)
+
+    def validate(self, data):
+        if 'before' in data and 'after' in data:
+            raise serializers.ValidationError("Use either 'before' or 'after', not both.")
+        return data
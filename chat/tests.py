@@ -1,3 +1,76 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
 
-# Create your tests here.
+from .conversations import mark_read, save_message
+from .models import Chat, Conversation, conversation_key
+from .receipts import ReadReceiptCoalescer
+from .writebehind import persist_messages
+
+
+class ReadReceiptCoalescerTests(SimpleTestCase):
+    async def test_highest_watermark_per_conversation_is_flushed_once(self):
+        flushed = []
+
+        async def flush(other_user_id, up_to):
+            flushed.append((other_user_id, up_to))
+
+        receipts = ReadReceiptCoalescer(60, flush)
+        for other_user_id, up_to in [(2, 10), (2, 12), (3, 5), (2, 11)]:
+            receipts.add(other_user_id, up_to)
+        await receipts.close()
+        self.assertEqual(sorted(flushed), [(2, 12), (3, 5)])
+
+    async def test_a_failing_conversation_does_not_stop_the_others(self):
+        flushed = []
+
+        async def flush(other_user_id, up_to):
+            if other_user_id == 2:
+                raise RuntimeError("database unavailable")
+            flushed.append((other_user_id, up_to))
+
+        receipts = ReadReceiptCoalescer(0, flush)
+        receipts.add(2, 10)
+        receipts.add(3, 5)
+        with self.assertLogs('chat.receipts', 'ERROR'):
+            failed = await receipts.flush_now()
+        self.assertEqual((failed, flushed), ([(2, 10)], [(3, 5)]))
+        receipts.add(2, 10)
+        with self.assertLogs('chat.receipts', 'ERROR'):
+            await receipts.close()  # logged, not raised, so disconnect() can still leave its groups
+
+
+class WriteBehindReadReceiptTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.sender = User.objects.create_user(username='s', email='s@example.com', password='Secret-pass-1')
+        self.reader = User.objects.create_user(username='r', email='r@example.com', password='Secret-pass-1',
+                                               phone_number='5550001')
+
+    def buffered(self, message_id):
+        """A message as the write-behind buffer holds it: id reserved, row not inserted yet."""
+        return Chat(id=message_id, sender=self.sender, receiver=self.reader, message='hi', timestamp=timezone.now(),
+                    conversation_key=conversation_key(self.sender.id, self.reader.id))
+
+    def unread(self):
+        conversation = Conversation.objects.get(key=conversation_key(self.sender.id, self.reader.id))
+        return conversation.unread_for(self.reader.id)
+
+    def test_message_read_before_its_flush_is_inserted_read(self):
+        saved = save_message(self.sender.id, self.reader.id, 'first')
+        pending = self.buffered(saved.id + 100)
+        self.assertEqual(mark_read(self.reader.id, self.sender.id, pending.id), 1)
+        persist_messages([pending, self.buffered(saved.id + 101)])
+        self.assertTrue(Chat.objects.get(id=pending.id).is_read)
+        self.assertFalse(Chat.objects.get(id=saved.id + 101).is_read)
+        self.assertEqual(self.unread(), 1)
+
+    def test_receipt_does_not_create_an_empty_conversation(self):
+        self.assertEqual(mark_read(self.reader.id, self.sender.id, 500), 0)
+        self.assertFalse(Conversation.objects.exists())
+
+    def test_receipt_from_a_participant_who_was_never_written_to_is_ignored(self):
+        save_message(self.sender.id, self.reader.id, 'hello?')
+        self.assertEqual(mark_read(self.sender.id, self.reader.id, 10 ** 6), 0)
+        conversation = Conversation.objects.get()
+        self.assertEqual((conversation.read_up_to_low, conversation.read_up_to_high), (0, 0))
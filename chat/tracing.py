@@ -0,0 +1,66 @@
+"""Cheap, sampled tracing for the chat consumers.
+
+Hot paths only bump counters and record timings in memory. Once every
+CHAT_STATS_INTERVAL seconds one INFO line summarises them, e.g.
+
+    chat stats interval=60s connect=112 disconnect=97 messages=5120 connect_ms(n=112 avg=4.1 max=38.0) ...
+
+Per-event DEBUG lines are sampled at CHAT_TRACE_SAMPLE_RATE and carry ids only.
+Message text is logged only when CHAT_TRACE_PAYLOADS is on: it is PHI, so keep
+that flag for local debugging.
+"""
+import logging
+import random
+import time
+from collections import Counter
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ChatTracer:
+    def __init__(self, sample_rate, payloads, interval):
+        self.sample_rate = sample_rate
+        self.payloads = payloads
+        self.interval = interval
+        self.counters = Counter()
+        self.timings = {}
+        self.window_start = time.monotonic()
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+        self._maybe_report()
+
+    def timing(self, name, seconds):
+        count, total, peak = self.timings.get(name, (0, 0.0, 0.0))
+        self.timings[name] = (count + 1, total + seconds, max(peak, seconds))
+
+    def event(self, name, **fields):
+        """Sampled DEBUG line with ids and numbers; never pass message text here."""
+        if self.sample_rate and logger.isEnabledFor(logging.DEBUG) and random.random() < self.sample_rate:
+            logger.debug(f"chat.{name} {_format(fields)}")
+
+    def payload(self, name, **fields):
+        """Unsampled DEBUG line that may include message text; off unless CHAT_TRACE_PAYLOADS is set."""
+        if self.payloads and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"chat.{name} payload {_format(fields)}")
+
+    def _maybe_report(self):
+        now = time.monotonic()
+        elapsed = now - self.window_start
+        if elapsed < self.interval:
+            return
+        counters, timings = self.counters, self.timings
+        self.counters, self.timings, self.window_start = Counter(), {}, now
+        parts = [f"{name}={value}" for name, value in sorted(counters.items())]
+        parts += [f"{name}_ms(n={count} avg={total / count * 1000:.1f} max={peak * 1000:.1f})"
+                  for name, (count, total, peak) in sorted(timings.items())]
+        logger.info(f"chat stats interval={elapsed:.0f}s {' '.join(parts)}")
+
+
+def _format(fields):
+    return ' '.join(f"{key}={value}" for key, value in fields.items())
+
+
+tracer = ChatTracer(settings.CHAT_TRACE_SAMPLE_RATE, settings.CHAT_TRACE_PAYLOADS, settings.CHAT_STATS_INTERVAL)
@@ -0,0 +1,163 @@
+"""Optional write-behind persistence for chat messages (CHAT_WRITE_BEHIND).
+
+By default each message is inserted, together with its Conversation update,
+before it is broadcast (write-through). In write-behind mode a message gets its
+id from a block reserved in advance from the chat_chat id sequence, is broadcast
+at once, and is queued in a per-process buffer. The buffer writes everything
+queued with one bulk_create and one Conversation update per conversation when
+it holds CHAT_WRITE_BEHIND_BATCH messages or CHAT_WRITE_BEHIND_DELAY_MS after
+the first one was queued.
+
+Guarantees in write-behind mode:
+
+* Ids are unique and increase within a process. Across processes they are
+  drawn from different blocks, so they are only roughly in time order, and a
+  message can become visible in history after messages with higher ids. Live
+  sockets see every message; history readers using `after` may miss a message
+  that was flushed late.
+* A message is acknowledged (broadcast) before it is durable. A failed flush is
+  retried CHAT_WRITE_BEHIND_RETRIES times; after that the batch is logged at
+  ERROR level and dropped.
+* The buffer lives in process memory and there is no replay log. A clean exit
+  flushes it (atexit). A crash or SIGKILL loses whatever was buffered, at most
+  one batch or one delay window per process, even though recipients may
+  already have seen those messages live.
+* The first message of a new conversation is broadcast with conversation_id
+  null, because its Conversation row is created by the flush.
+* Unread counters stay exact even if a recipient reads a message before it is
+  flushed. mark_read keeps each reader's highest read id on the Conversation
+  row. A flush locks the rows and inserts messages at or below the watermark
+  as already read, so it does not count them as unread. A receipt that
+  arrives during a flush waits on the lock and then sees the inserted rows.
+* mark_read never creates a Conversation row. A receipt for a brand-new
+  conversation whose first flush has not landed is ignored. The receipt
+  window (CHAT_READ_RECEIPT_WINDOW_MS) is longer than the flush delay, so this
+  is rare, and the reader's next receipt marks those messages read.
+
+Block reservation needs a PostgreSQL sequence. On other databases the setting
+is ignored and messages are written through.
+"""
+import asyncio
+import atexit
+import logging
+from collections import deque
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .conversations import apply_read_watermarks, record_messages, save_message
+from .models import Chat, conversation_key
+
+logger = logging.getLogger(__name__)
+
+
+def reserve_message_ids(count):
+    """`count` ids from the chat_chat id sequence, in ascending order (PostgreSQL only)."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [Chat._meta.db_table, count],
+        )
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def persist_messages(messages):
+    with transaction.atomic():
+        apply_read_watermarks(messages)
+        Chat.objects.bulk_create(messages)
+        record_messages(messages)
+
+
+class WriteBehindBuffer:
+    def __init__(self, batch_size, delay, retries):
+        self.batch_size = batch_size
+        self.delay = delay
+        self.retries = retries
+        self.ids = deque()
+        self.pending = []
+        self.flush_task = None
+        self._id_lock = asyncio.Lock()
+
+    async def next_id(self):
+        async with self._id_lock:
+            if not self.ids:
+                # One database round trip per batch's worth of ids rather than per message.
+                self.ids.extend(await database_sync_to_async(reserve_message_ids)(self.batch_size))
+            return self.ids.popleft()
+
+    async def submit(self, sender_id, receiver_id, text):
+        """Queue a message and return it with its final id and timestamp; it is saved later."""
+        message = Chat(
+            id=await self.next_id(),
+            sender_id=int(sender_id),
+            receiver_id=int(receiver_id),
+            conversation_key=conversation_key(sender_id, receiver_id),
+            message=text,
+            timestamp=timezone.now(),
+        )
+        self.pending.append(message)
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self._flush_later())
+        return message
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.delay)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        for attempt in range(1, self.retries + 2):
+            try:
+                await database_sync_to_async(persist_messages)(batch)
+                return
+            except Exception as e:
+                logger.warning(f"Chat write-behind flush of {len(batch)} messages failed (attempt {attempt}): {e}")
+                if attempt <= self.retries:
+                    await asyncio.sleep(min(0.1 * 2 ** attempt, 2))
+        logger.error(f"Dropped {len(batch)} chat messages after {self.retries + 1} failed flushes: "
+                     f"ids {batch[0].id}..{batch[-1].id}")
+
+    def flush_at_exit(self):
+        # Runs after the event loop has stopped, so the synchronous ORM is usable here.
+        if self.pending:
+            batch, self.pending = self.pending, []
+            try:
+                persist_messages(batch)
+            except Exception as e:
+                logger.error(f"Lost {len(batch)} buffered chat messages at exit: {e}")
+
+
+_buffer = None
+
+
+def write_behind_enabled():
+    return settings.CHAT_WRITE_BEHIND and connection.vendor == 'postgresql'
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = WriteBehindBuffer(
+            settings.CHAT_WRITE_BEHIND_BATCH,
+            settings.CHAT_WRITE_BEHIND_DELAY_MS / 1000,
+            settings.CHAT_WRITE_BEHIND_RETRIES,
+        )
+        atexit.register(_buffer.flush_at_exit)
+    return _buffer
+
+
+async def store_message(sender_id, receiver_id, text):
+    """Persist a message (now, or later in write-behind mode) and return it for broadcasting."""
+    if write_behind_enabled():
+        return await get_buffer().submit(sender_id, receiver_id, text)
+    return await database_sync_to_async(save_message)(sender_id, receiver_id, text)
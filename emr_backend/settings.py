@@ -21,6 +21,16 @@ EMAIL_HOST_USER = config("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = config("DEFAULT_FROM_EMAIL", default=EMAIL_HOST_USER)
 
+# Campaign mailings: patients per batch, and emails per second
+CAMPAIGN_MAIL_BATCH_SIZE = config("CAMPAIGN_MAIL_BATCH_SIZE", default=500, cast=int)
+CAMPAIGN_MAIL_RATE = config("CAMPAIGN_MAIL_RATE", default=10, cast=float)
+# A 'sending' mailing whose run has not recorded progress for this long is taken over by the next run
+CAMPAIGN_MAIL_CLAIM_TIMEOUT_MINUTES = config("CAMPAIGN_MAIL_CLAIM_TIMEOUT_MINUTES", default=10, cast=int)
+# Outbox emails (e.g. scheduled reports) are retried this many times before being marked failed
+OUTBOX_MAX_ATTEMPTS = config("OUTBOX_MAX_ATTEMPTS", default=5, cast=int)
+# Outbox emails left in 'sending' this long (the sender died mid-send) are put back and sent again
+OUTBOX_CLAIM_TIMEOUT_MINUTES = config("OUTBOX_CLAIM_TIMEOUT_MINUTES", default=15, cast=int)
+
 SECRET_KEY = config("SECRET_KEY")
 DEBUG = config("DEBUG", default=False, cast=bool)
 
@@ -83,13 +93,46 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')  # required for Render
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Serve public media under MEDIA_URL from Django. Off in production by default, where the front proxy
+# should serve MEDIA_ROOT itself (excluding the protected prefixes in full_emr.file_delivery).
+SERVE_MEDIA = config('SERVE_MEDIA', default=DEBUG, cast=bool)
+
+# Who sends media bytes once a view has authorised the download: 'python' (Django itself, for local
+# runs), 'nginx' (X-Accel-Redirect to FILE_DELIVERY_INTERNAL_URL, an `internal` location aliased to
+# MEDIA_ROOT) or 'apache' (X-Sendfile with mod_xsendfile).
+FILE_DELIVERY_BACKEND = config('FILE_DELIVERY_BACKEND', default='python')
+FILE_DELIVERY_INTERNAL_URL = config('FILE_DELIVERY_INTERNAL_URL', default='/protected-media/')
+FILE_DELIVERY_CHUNK_SIZE = config('FILE_DELIVERY_CHUNK_SIZE', default=64 * 1024, cast=int)
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Report generation is queued and rendered by `manage.py run_report_worker`.
+# Set REPORT_JOBS_EAGER=True to render inside the request instead (local runs, tests).
+REPORT_JOBS_EAGER = config('REPORT_JOBS_EAGER', default=False, cast=bool)
+# Rows fetched per database round trip when streaming report data
+REPORT_EXPORT_CHUNK_SIZE = config('REPORT_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Rendered reports are cached under MEDIA_ROOT/report_cache; least recently used files go first.
+REPORT_CACHE_MAX_BYTES = config('REPORT_CACHE_MAX_BYTES', default=512 * 1024 * 1024, cast=int)
+REPORT_CACHE_MAX_ENTRIES = config('REPORT_CACHE_MAX_ENTRIES', default=500, cast=int)
+# Seconds a process reuses its data freshness check for the report cache; 0 checks on every request.
+REPORT_CACHE_WATERMARK_SECONDS = config('REPORT_CACHE_WATERMARK_SECONDS', default=10, cast=int)
+
+# Scheduled reports are only queued inside this local-time window ("HH:MM-HH:MM", may wrap midnight;
+# empty = any time). Runs that fall due outside it wait for the window to open.
+REPORT_SCHEDULER_WINDOW = config('REPORT_SCHEDULER_WINDOW', default='22:00-06:00')
+
+# Days a generated report is kept, per Report.format; 0 keeps it forever. Enforced by `purge_reports`.
+REPORT_RETENTION_DAYS = {
+    'pdf': config('REPORT_RETENTION_DAYS_PDF', default=90, cast=int),
+    'excel': config('REPORT_RETENTION_DAYS_EXCEL', default=90, cast=int),
+    'csv': config('REPORT_RETENTION_DAYS_CSV', default=30, cast=int),
+}
+
 # REST Framework Configuration - UPDATED FOR JSON RESPONSES
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'full_emr.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     # Force JSON responses in production, allow browsable API in development
@@ -110,11 +153,17 @@ if DEBUG:
         'rest_framework.renderers.BrowsableAPIRenderer',
     )
 
+# Per-process cache of the slim user row behind each JWT (see full_emr.authentication). Saves clear the
+# entry locally; other processes may serve the old row for up to the TTL.
+AUTH_USER_CACHE_SIZE = config('AUTH_USER_CACHE_SIZE', default=2048, cast=int)
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', default=60, cast=int)  # seconds
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
-    'BLACKLIST_AFTER_ROTATION': True,
+    'BLACKLIST_AFTER_ROTATION': True,  # done by full_emr.revocation, not the token_blacklist app
+    'TOKEN_REFRESH_SERIALIZER': 'full_emr.serializer.RevocableTokenRefreshSerializer',
     'UPDATE_LAST_LOGIN': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
     'AUTH_HEADER_NAME': 'HTTP_AUTHORIZATION',
@@ -122,6 +171,13 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
 }
 
+# Revoked JWT IDs are held in a per-process Bloom filter (see full_emr.revocation), synced from the
+# RevokedToken table every few seconds and rebuilt periodically to drop expired entries.
+TOKEN_REVOCATION_CAPACITY = config('TOKEN_REVOCATION_CAPACITY', default=100_000, cast=int)
+TOKEN_REVOCATION_ERROR_RATE = config('TOKEN_REVOCATION_ERROR_RATE', default=0.001, cast=float)
+TOKEN_REVOCATION_SYNC_SECONDS = config('TOKEN_REVOCATION_SYNC_SECONDS', default=5, cast=int)
+TOKEN_REVOCATION_REBUILD_SECONDS = config('TOKEN_REVOCATION_REBUILD_SECONDS', default=3600, cast=int)
+
 # CORS Configuration - UPDATED FOR BETTER SECURITY
 CORS_ALLOW_ALL_ORIGINS = False  # Changed to False for security
 
@@ -175,11 +231,68 @@ TEMPLATES = [
 # Channels / WebSocket
 # ==============================
 ASGI_APPLICATION = "emr_backend.asgi.application"
+REDIS_URL = config('REDIS_URL', default='redis://127.0.0.1:6379/0')
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {"hosts": [("127.0.0.1", 6379)]},
+        "CONFIG": {"hosts": [REDIS_URL]},
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     },
+    # Shared by all processes: a code issued by one worker must verify on another.
+    'otp': {
+        'BACKEND': config('OTP_CACHE_BACKEND', default='django.core.cache.backends.redis.RedisCache'),
+        'LOCATION': REDIS_URL,
+    },
+}
+
+# One-time passwords (see full_emr.otp). The OTP table is only an audit trail when OTP_AUDIT_TRAIL is on;
+# `manage.py purge_otps` deletes rows older than OTP_AUDIT_RETENTION_DAYS.
+OTP_CACHE_ALIAS = 'otp'
+OTP_DIGITS = config('OTP_DIGITS', default=4, cast=int)
+OTP_TTL_MINUTES = config('OTP_TTL_MINUTES', default=10, cast=int)
+OTP_MAX_ATTEMPTS = config('OTP_MAX_ATTEMPTS', default=5, cast=int)
+OTP_AUDIT_TRAIL = config('OTP_AUDIT_TRAIL', default=False, cast=bool)
+OTP_AUDIT_RETENTION_DAYS = config('OTP_AUDIT_RETENTION_DAYS', default=30, cast=int)
+
+# Read receipts from a chat socket are coalesced for this long before one bulk UPDATE and broadcast.
+CHAT_READ_RECEIPT_WINDOW_MS = config('CHAT_READ_RECEIPT_WINDOW_MS', default=300, cast=int)
+
+# Write-behind chat persistence (see chat.writebehind for the durability trade-offs). PostgreSQL only.
+CHAT_WRITE_BEHIND = config('CHAT_WRITE_BEHIND', default=False, cast=bool)
+CHAT_WRITE_BEHIND_BATCH = config('CHAT_WRITE_BEHIND_BATCH', default=100, cast=int)
+CHAT_WRITE_BEHIND_DELAY_MS = config('CHAT_WRITE_BEHIND_DELAY_MS', default=200, cast=int)
+CHAT_WRITE_BEHIND_RETRIES = config('CHAT_WRITE_BEHIND_RETRIES', default=3, cast=int)
+
+# Chat consumer tracing (chat/tracing.py): a stats line every CHAT_STATS_INTERVAL seconds,
+# DEBUG lines for a sample of events, and message text only with CHAT_TRACE_PAYLOADS.
+CHAT_LOG_LEVEL = config('CHAT_LOG_LEVEL', default='INFO')
+CHAT_STATS_INTERVAL = config('CHAT_STATS_INTERVAL', default=60, cast=int)
+CHAT_TRACE_SAMPLE_RATE = config('CHAT_TRACE_SAMPLE_RATE', default=0.01, cast=float)
+CHAT_TRACE_PAYLOADS = config('CHAT_TRACE_PAYLOADS', default=False, cast=bool)
+
+# Token-bucket limits on the account endpoints (see full_emr.ratelimit). Each rule is
+# '<ip|email|user>:<requests>/<period>', e.g. 'email:5/15m'; a request must pass every rule of its scope.
+# Use the 'memory' backend only for tests and single-process local runs.
+RATE_LIMIT_ENABLED = config('RATE_LIMIT_ENABLED', default=True, cast=bool)
+RATE_LIMIT_BACKEND = config('RATE_LIMIT_BACKEND', default='redis')
+# Reverse proxies in front of the app that append the client address to X-Forwarded-For (e.g. 1 behind
+# Render's or a single nginx proxy). 0 keys 'ip' rules on REMOTE_ADDR. Too high a value lets clients
+# choose their own address; too low puts every client behind a proxy in one bucket.
+RATE_LIMIT_PROXY_HOPS = config('RATE_LIMIT_PROXY_HOPS', default=0, cast=int)
+RATE_LIMITS = {
+    # Shared by /api/login/ (email) and the simplejwt /api/token/ view (username), so neither bypasses the other.
+    'login': ['ip:30/m', 'email:10/15m', 'username:10/15m'],
+    'token_refresh': ['ip:60/m'],
+    'register': ['ip:10/h'],
+    'otp_request': ['ip:10/h', 'email:3/15m'],
+    'otp_verify': ['ip:30/h', 'email:5/15m'],
+    'password_reset': ['ip:30/h', 'email:5/15m'],
 }
 
 # CSRF and Security Settings
@@ -215,7 +328,7 @@ LOGGING = {
     },
     'handlers': {
         'console': {
-            'level': 'INFO',
+            # No handler level: each logger below sets its own.
             'class': 'logging.StreamHandler',
             'formatter': 'simple'
         },
@@ -235,5 +348,10 @@ LOGGING = {
             'level': 'DEBUG' if DEBUG else 'INFO',
             'propagate': False,
         },
+        'chat': {
+            'handlers': ['console'],
+            'level': CHAT_LOG_LEVEL,
+            'propagate': False,
+        },
     },
 }
\ No newline at end of file
@@ -1,9 +1,10 @@
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.http import JsonResponse
-from django.urls import path, include
-from rest_framework_simplejwt.views import TokenRefreshView, TokenObtainPairView
+from django.urls import path, include, re_path
+
+from full_emr.file_delivery import serve_media
+from full_emr.views import ThrottledTokenObtainPairView, ThrottledTokenRefreshView
 
 def home(request):
     return JsonResponse({"message": "EMR backend is running"})
@@ -13,9 +14,13 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('full_emr.urls')),
     path('api/', include('chat.urls')),
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/', ThrottledTokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/refresh/', ThrottledTokenRefreshView.as_view(), name='token_refresh'),
     # All urls from full_emr app will be prefixed with /api/
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# Reports and lab files are not public; they are served by views that check permissions first.
+if settings.SERVE_MEDIA:
+    urlpatterns += [
+        re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.*)$', serve_media, name='media'),
+    ]
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FullEmrConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'full_emr'
+
+    def ready(self):
+        from . import signals  # noqa: F401
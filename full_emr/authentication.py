@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .revocation import is_token_revoked
+
+User = get_user_model()
+
+# Columns loaded for request.user. Everything else stays deferred and costs a query per column read, so views
+# that need the rest of the row (e.g. UserProfileView) load the full user themselves.
+SLIM_USER_FIELDS = [
+    'id', 'password', 'username', 'first_name', 'last_name', 'email', 'role',
+    'is_active', 'is_staff', 'is_superuser', 'tokens_valid_after',
+]
+# Model.from_db() takes values in concrete field order.
+_SLIM_COLUMNS = [field.attname for field in User._meta.concrete_fields if field.attname in SLIM_USER_FIELDS]
+
+
+class UserCache:
+    """Thread-safe LRU of slim user rows, each valid for `ttl` seconds.
+
+    The cache is per process: signals clear entries in the process that saved
+    the user, and the TTL bounds how long other processes can serve a stale row.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, values = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return values
+
+    def set(self, user_id, values):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL)
+
+
+def get_cached_user(user_id):
+    """A fresh User instance with only SLIM_USER_FIELDS loaded. Raises User.DoesNotExist."""
+    user_id = int(user_id)
+    values = user_cache.get(user_id)
+    if values is None:
+        values = User.objects.filter(pk=user_id).values_list(*_SLIM_COLUMNS).first()
+        if values is None:
+            raise User.DoesNotExist(f"User {user_id} does not exist")
+        user_cache.set(user_id, values)
+    # A new instance per call, so nothing a request sets on its user leaks into the next one.
+    return User.from_db('default', _SLIM_COLUMNS, values)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that reads request.user from the process-local user cache and honours revocations."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        try:
+            user = get_cached_user(user_id)
+        except (User.DoesNotExist, TypeError, ValueError) as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        if is_token_revoked(validated_token, user):
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+
+        return user
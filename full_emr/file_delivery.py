@@ -0,0 +1,152 @@
+import logging
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from django.views.static import was_modified_since
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('python', 'nginx', 'apache')
+
+# Media prefixes that are only reachable through a view that checks permissions first.
+PROTECTED_MEDIA_PREFIXES = ('reports/', 'report_cache/', 'lab_reports/')
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+# Media whose file names are content hashes, so a URL's bytes never change.
+IMMUTABLE_MEDIA_PREFIXES = ('profile_images/',)
+
+
+def serve_file(request, name, as_attachment=False, filename=None, private=True, immutable=False):
+    """Respond with the media file `name` (a path relative to MEDIA_ROOT).
+
+    Call this only after the caller has checked the user may see the file.
+    Depending on FILE_DELIVERY_BACKEND the bytes are sent by nginx
+    (X-Accel-Redirect), Apache (X-Sendfile) or, for local runs, by Django.
+    """
+    backend = settings.FILE_DELIVERY_BACKEND
+    if backend not in BACKENDS:
+        raise ImproperlyConfigured(f"FILE_DELIVERY_BACKEND must be one of {', '.join(BACKENDS)}, not {backend!r}")
+
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        logger.error(f"Rejected media path outside MEDIA_ROOT: {name}")
+        raise Http404("File not found")
+    if not os.path.isfile(path):
+        logger.error(f"Media file missing: {path}")
+        raise Http404("File not found")
+
+    filename = filename or os.path.basename(name)
+    content_type, encoding = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+
+    if backend == 'python':
+        response = _python_response(request, path, content_type, as_attachment, filename)
+    else:
+        response = HttpResponse(content_type=content_type)
+        if backend == 'nginx':
+            internal_url = settings.FILE_DELIVERY_INTERNAL_URL.rstrip('/')
+            relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+            response['X-Accel-Redirect'] = f"{internal_url}/{relative}".encode('utf-8').decode('latin-1')
+        else:
+            response['X-Sendfile'] = path.encode('utf-8').decode('latin-1')
+        # The proxy replaces the empty body with the file and sets its length.
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if immutable:
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'private, no-cache' if private else 'public, max-age=3600'
+    return response
+
+
+def serve_media(request, path):
+    """Public media, e.g. educational resource files; replaces django.conf.urls.static."""
+    # Check the prefix on the normalized path: './reports/x' and 'a/../reports/x' name a report too.
+    try:
+        relative = os.path.relpath(safe_join(settings.MEDIA_ROOT, path), settings.MEDIA_ROOT)
+    except (SuspiciousFileOperation, ValueError):
+        raise Http404("File not found")
+    relative = os.path.normcase(relative).replace(os.sep, '/')
+    if relative == '.' or f"{relative}/".startswith(PROTECTED_MEDIA_PREFIXES):
+        raise Http404("File not found")
+    return serve_file(request, relative, private=False, immutable=relative.startswith(IMMUTABLE_MEDIA_PREFIXES))
+
+
+def _python_response(request, path, content_type, as_attachment, filename):
+    stat = os.stat(path)
+    last_modified = http_date(stat.st_mtime)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        return HttpResponseNotModified()
+
+    size = stat.st_size
+    byte_range = _requested_range(request, size, stat.st_mtime)
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return response
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, as_attachment=as_attachment, filename=filename, content_type=content_type)
+        response.block_size = settings.FILE_DELIVERY_CHUNK_SIZE
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(file, start, end - start + 1), status=206,
+                                         content_type=content_type)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = last_modified
+    return response
+
+
+def _requested_range(request, size, mtime):
+    """(start, end) of a single satisfiable byte range, None for the whole file, or 'unsatisfiable'.
+
+    Multi-range requests are answered with the whole file, which RFC 9110 allows.
+    """
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and parse_http_date_safe(if_range) != int(mtime):
+        return None  # The client's copy is stale; send the current file in full.
+
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the final N bytes.
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+def _read_range(file, start, length):
+    chunk_size = settings.FILE_DELIVERY_CHUNK_SIZE
+    with file:
+        file.seek(start)
+        while length > 0:
+            data = file.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
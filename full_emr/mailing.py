@@ -0,0 +1,356 @@
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F, Q
+from django.template import Context, Engine
+from django.utils import timezone
+
+from .models import AddPatients, CampaignMailing, HealthCampaign, OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+# Plain-text engine: emails are not HTML, so nothing should be escaped.
+_engine = Engine(autoescape=False)
+
+
+def compile_template(source):
+    return _engine.from_string(source)
+
+
+OTP_EMAIL_SUBJECT = "Password Reset Request - S10 Clinic"
+
+OTP_EMAIL_TEMPLATE = compile_template("""Dear {{ name }},
+
+   We received a request to reset your password for your S10 Clinic account.
+
+   Here is your One-Time Password (OTP):
+
+   • {{ otp_code }}
+
+   This OTP is valid for {{ expiry_minutes }} minutes. Please do not share it with anyone for your account security.
+
+   If you did not request a password reset, you can safely ignore this email and your account will remain secure.
+
+   Best regards,
+   S10 Clinic Support Team""")
+
+INVITATION_EMAIL_TEMPLATE = compile_template("""Dear {{ patient_name }},
+
+You have been invited to schedule an appointment at our clinic.
+
+The following dates have been suggested for your appointment:
+{{ dates_list }}
+
+Please log in to our patient portal to confirm your availability or suggest alternative dates.
+
+If you have any questions, please contact our office.
+
+Best regards,
+{{ sender_name }}
+{{ sender_role }}""")
+
+SCHEDULED_REPORT_SUBJECT = compile_template("Scheduled report: {{ schedule.name }}")
+
+SCHEDULED_REPORT_BODY = compile_template("""Hello,
+
+Attached is the latest "{{ schedule.name }}" report, generated on {{ generated|date:"F j, Y H:i" }}.
+
+This report is sent on the schedule "{{ schedule.cron_expression }}". Contact the clinic administrator to change
+the recipients or stop these emails.
+
+Best regards,
+S10 Clinic Reporting""")
+
+DEFAULT_CAMPAIGN_SUBJECT = "{{ campaign.title }} - S10 Clinic"
+
+DEFAULT_CAMPAIGN_BODY = """Dear {{ patient.first_name|default:"Patient" }},
+
+{{ campaign.description }}
+
+The campaign runs from {{ campaign.start_date|date:"F j, Y" }} to {{ campaign.end_date|date:"F j, Y" }}.
+
+Best regards,
+S10 Clinic Health Promotion Team"""
+
+
+def render_email(template, **context):
+    return template.render(Context(context, autoescape=False)).strip()
+
+
+class MailWorker:
+    """Sends messages over a single SMTP connection, at most `rate` per second."""
+
+    def __init__(self, rate=None, connection=None):
+        self.rate = rate if rate is not None else settings.CAMPAIGN_MAIL_RATE
+        self.connection = connection or get_connection(fail_silently=False)
+        self._next_send_at = 0.0
+        self.last_error = None
+
+    def __enter__(self):
+        self.connection.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.connection.close()
+
+    def _throttle(self):
+        if not self.rate:
+            return
+        now = time.monotonic()
+        if now < self._next_send_at:
+            time.sleep(self._next_send_at - now)
+            now = self._next_send_at
+        self._next_send_at = now + 1.0 / self.rate
+
+    def send(self, messages):
+        """Send each message, returning (sent, failed) counts."""
+        sent = failed = 0
+        for msg in messages:
+            self._throttle()
+            try:
+                sent += self.connection.send_messages([msg]) or 0
+            except Exception as e:
+                failed += 1
+                self.last_error = str(e)
+                logger.error(f"Failed to send email to {', '.join(msg.to)}: {e}")
+                # The server may have dropped us; reopen before the next message.
+                self.connection.close()
+                self.connection.open()
+        return sent, failed
+
+
+def campaign_audience(campaign):
+    """Patients with an email address who match the campaign's target audience."""
+    patients = AddPatients.objects.exclude(email__isnull=True).exclude(email='')
+    categories = {value.lower(): value for value, _ in AddPatients.CATEGORY_CHOICES}
+    category = categories.get((campaign.target_audience or '').strip().lower())
+    if category:
+        patients = patients.filter(category=category)
+    return patients
+
+
+class MailingClaimLost(Exception):
+    pass
+
+
+def claim_mailing(mailing, stale_after=None):
+    """Take `mailing` for this run and return a claim token, or None if another run holds it.
+
+    A run refreshes claimed_at at every progress checkpoint; a 'sending' mailing
+    whose claim has not been refreshed for CAMPAIGN_MAIL_CLAIM_TIMEOUT_MINUTES
+    is taken to belong to a run that died, and can be claimed again.
+    """
+    stale_after = stale_after or timedelta(minutes=settings.CAMPAIGN_MAIL_CLAIM_TIMEOUT_MINUTES)
+    now = timezone.now()
+    claimable = Q(status__in=['queued', 'failed']) | Q(
+        Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - stale_after), status='sending',
+    )
+    token = uuid.uuid4().hex
+    claimed = CampaignMailing.objects.filter(claimable, pk=mailing.pk).update(
+        status='sending', claim_token=token, claimed_at=now,
+    )
+    return token if claimed else None
+
+
+def run_mailing(mailing, batch_size=None, rate=None):
+    """Send a campaign mailing, resuming after the last patient already processed.
+
+    Returns the updated mailing, or None if another run is already sending it.
+    """
+    batch_size = batch_size or settings.CAMPAIGN_MAIL_BATCH_SIZE
+    campaign = mailing.campaign
+
+    token = claim_mailing(mailing)
+    if token is None:
+        logger.info(f"Mailing {mailing.id} is already being sent by another run")
+        return None
+    # Resume from the cursor as stored now, not as it was when `mailing` was loaded.
+    mailing.refresh_from_db()
+    mailing.claim_token = token
+    if mailing.started_at is None:
+        CampaignMailing.objects.filter(pk=mailing.pk).update(started_at=timezone.now())
+
+    audience = (
+        campaign_audience(campaign)
+        .filter(id__gt=mailing.last_patient_id)
+        .order_by('id')
+        .values_list('id', 'first_name', 'last_name', 'email')
+        .iterator(chunk_size=batch_size)
+    )
+
+    try:
+        with MailWorker(rate=rate) as worker:
+            batch = []
+            for row in audience:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    _send_batch(mailing, campaign, batch, worker)
+                    batch = []
+            if batch:
+                _send_batch(mailing, campaign, batch, worker)
+    except MailingClaimLost:
+        logger.error(f"Mailing {mailing.id} was taken over by another run; stopping")
+        raise
+    except Exception as e:
+        logger.error(f"Mailing {mailing.id} for campaign {campaign.id} stopped: {e}", exc_info=True)
+        CampaignMailing.objects.filter(pk=mailing.pk, claim_token=token).update(
+            status='failed', last_error=str(e), claim_token='', claimed_at=None,
+        )
+        raise
+
+    CampaignMailing.objects.filter(pk=mailing.pk, claim_token=token).update(
+        status='completed', completed_at=timezone.now(), claim_token='', claimed_at=None,
+    )
+    mailing.refresh_from_db()
+    logger.info(f"Mailing {mailing.id} completed: {mailing.sent_count} sent, {mailing.failed_count} failed")
+    return mailing
+
+
+# Fields of the campaign that mailing templates can use. Templates are written by staff, so
+# they get plain values rather than the model instance and its relations.
+CAMPAIGN_TEMPLATE_FIELDS = ('id', 'title', 'description', 'category', 'target_audience',
+                            'start_date', 'end_date', 'status', 'image_url')
+
+# Messages sent between progress checkpoints within a batch.
+PROGRESS_EVERY = 20
+
+
+def campaign_context(campaign):
+    return {field: getattr(campaign, field) for field in CAMPAIGN_TEMPLATE_FIELDS}
+
+
+def _send_batch(mailing, campaign, rows, worker):
+    # Compiled once per batch and reused for every recipient in it.
+    subject_template = compile_template(mailing.subject)
+    body_template = compile_template(mailing.body)
+    campaign_fields = campaign_context(campaign)
+
+    messages = []
+    for patient_id, first_name, last_name, email in rows:
+        context = {
+            'campaign': campaign_fields,
+            'patient': {'id': patient_id, 'first_name': first_name, 'last_name': last_name, 'email': email},
+        }
+        messages.append(EmailMessage(
+            subject=render_email(subject_template, **context),
+            body=render_email(body_template, **context),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[email],
+            connection=worker.connection,
+        ))
+
+    # Record progress every few messages, and for the messages already handled if sending
+    # stops with an error, so a restart resumes after the last recipient already mailed.
+    processed = recorded = sent = failed = 0
+    try:
+        for message in messages:
+            ok, error = worker.send([message])
+            processed, sent, failed = processed + 1, sent + ok, failed + error
+            if processed % PROGRESS_EVERY == 0:
+                _record_progress(mailing, campaign, rows[processed - 1][0], sent, failed)
+                recorded, sent, failed = processed, 0, 0
+    finally:
+        if processed > recorded:
+            _record_progress(mailing, campaign, rows[processed - 1][0], sent, failed)
+    logger.debug(f"Mailing {mailing.id}: batch up to patient {rows[-1][0]} processed")
+
+
+def _record_progress(mailing, campaign, last_patient_id, sent, failed):
+    # Also refreshes the claim; if another run has taken the mailing over, stop sending.
+    recorded = CampaignMailing.objects.filter(pk=mailing.pk, claim_token=mailing.claim_token).update(
+        last_patient_id=last_patient_id,
+        sent_count=F('sent_count') + sent,
+        failed_count=F('failed_count') + failed,
+        claimed_at=timezone.now(),
+    )
+    if not recorded:
+        raise MailingClaimLost(f"Mailing {mailing.id} is no longer claimed by this run")
+    if sent:
+        HealthCampaign.objects.filter(pk=campaign.pk).update(participants=F('participants') + sent)
+    mailing.last_patient_id = last_patient_id
+
+
+def requeue_stale_outbox(older_than=None):
+    """Put back emails claimed by a sender that died before finishing them.
+
+    An email whose sender died after the SMTP server accepted it is sent again:
+    delivery is at least once.
+    """
+    older_than = older_than or timedelta(minutes=settings.OUTBOX_CLAIM_TIMEOUT_MINUTES)
+    cutoff = timezone.now() - older_than
+    # Rows claimed before claimed_at existed have none; treat them as stale too.
+    stale = OutboxEmail.objects.filter(Q(claimed_at__lt=cutoff) | Q(claimed_at__isnull=True), status='sending')
+    count = stale.update(status='pending', claimed_at=None)
+    if count:
+        logger.warning(f"Requeued {count} outbox email(s) claimed before {cutoff.isoformat()}")
+    return count
+
+
+def deliver_outbox(batch_size=100, max_attempts=None, rate=None):
+    """Send pending outbox emails; those waiting on a report job go once it finishes.
+
+    Returns (sent, failed) counts for this pass.
+    """
+    max_attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+    requeue_stale_outbox()
+    ready = OutboxEmail.objects.filter(
+        Q(status='pending')
+        | Q(status='waiting', report_job__status__in=['completed', 'failed'])
+        | Q(status='waiting', report_job__isnull=True)
+    ).select_related('report_job__report').order_by('created_at')[:batch_size]
+    emails = list(ready)
+    if not emails:
+        return 0, 0
+
+    sent = failed = 0
+    with MailWorker(rate=rate) as worker:
+        for email in emails:
+            # Claim the row so a second scheduler process skips it.
+            claimed = OutboxEmail.objects.filter(pk=email.pk, status=email.status).update(
+                status='sending', claimed_at=timezone.now()
+            )
+            if not claimed:
+                continue
+            job = email.report_job
+            if job is None and email.status == 'waiting':
+                # The report job it was waiting for has been deleted.
+                OutboxEmail.objects.filter(pk=email.pk).update(status='failed', last_error="Report job was deleted")
+                failed += 1
+                continue
+            if job and job.status == 'failed':
+                OutboxEmail.objects.filter(pk=email.pk).update(
+                    status='failed', last_error=f"Report job {job.id} failed: {job.error}"
+                )
+                failed += 1
+                continue
+
+            message = EmailMessage(
+                subject=email.subject, body=email.body, from_email=settings.DEFAULT_FROM_EMAIL,
+                to=email.recipients, connection=worker.connection,
+            )
+            if job and job.report:
+                try:
+                    message.attach_file(job.report.file_path.path)
+                except OSError as e:
+                    OutboxEmail.objects.filter(pk=email.pk).update(status='failed', last_error=f"Attachment: {e}")
+                    failed += 1
+                    continue
+
+            ok, _ = worker.send([message])
+            attempts = email.attempts + 1
+            if ok:
+                OutboxEmail.objects.filter(pk=email.pk).update(status='sent', attempts=attempts,
+                                                               sent_at=timezone.now())
+                sent += 1
+            else:
+                OutboxEmail.objects.filter(pk=email.pk).update(
+                    status='failed' if attempts >= max_attempts else 'pending',
+                    attempts=attempts, last_error=worker.last_error or '',
+                )
+                failed += 1
+    logger.info(f"Outbox: {sent} sent, {failed} failed")
+    return sent, failed
@@ -0,0 +1,98 @@
+import os
+import resource
+import tempfile
+import time
+from datetime import date, datetime
+
+from django.core.management.base import BaseCommand
+from openpyxl import Workbook
+
+from full_emr.reports.excel import render_xlsx
+from full_emr.reports.renderers import render_pdf, PATIENT_SHEET_HEADERS
+
+
+def synthetic_demographics(count):
+    genders = ['Male', 'Female', 'Other']
+    for i in range(1, count + 1):
+        yield (i, f"Firstname{i} Lastname{i}", 18 + i % 70, genders[i % 3])
+
+
+def synthetic_details(count):
+    genders = ['Male', 'Female', 'Other']
+    categories = ['General', 'Emergency', 'OPD', 'VIP']
+    for i in range(1, count + 1):
+        yield (
+            i, f"Firstname{i} Lastname{i}", 18 + i % 70, genders[i % 3], categories[i % 4],
+            f"98{i:08d}", f"patient{i}@example.com", "Springfield", date(2025, 1 + i % 12, 1 + i % 28),
+        )
+
+
+def synthetic_patient_sheet(count):
+    genders = ['Male', 'Female', 'Other']
+    categories = ['General', 'Emergency', 'OPD', 'VIP']
+    for i in range(1, count + 1):
+        yield (
+            i, f"Firstname{i}", f"Lastname{i}", 18 + i % 70, genders[i % 3], categories[i % 4],
+            f"98{i:08d}", f"patient{i}@example.com", "Springfield", datetime(2025, 1 + i % 12, 1 + i % 28, 9, 30),
+        )
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = ("Time report rendering on synthetic rows and report peak RSS. "
+            "Run one format per process: peak RSS is a process-wide high-water mark.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+        parser.add_argument('--format', choices=['pdf', 'excel'], default='pdf')
+        parser.add_argument('--detailed', action='store_true', help="PDF: also render the detailed records table.")
+        parser.add_argument('--legacy', action='store_true',
+                            help="Excel: build a regular in-memory Workbook for comparison.")
+
+    def render_pdf(self, path, rows, detailed):
+        statistics = {
+            'total': rows, 'average_age': 52.0, 'youngest': 18, 'oldest': 87,
+            'by_gender': [('Female', rows // 3), ('Male', rows // 3), ('Other', rows - 2 * (rows // 3))],
+            'by_category': [('General', rows)],
+        }
+        pages = render_pdf(
+            path, 'Benchmark', {'department': 'all'}, statistics,
+            synthetic_demographics(rows),
+            synthetic_details(rows) if detailed else None,
+        )
+        return f"{pages} pages"
+
+    def render_excel(self, path, rows, legacy):
+        if legacy:
+            wb = Workbook()
+            ws = wb.active
+            ws.append(PATIENT_SHEET_HEADERS)
+            for row in synthetic_patient_sheet(rows):
+                ws.append(row)
+            wb.save(path)
+            return "regular workbook"
+        render_xlsx(path, [('Patients', PATIENT_SHEET_HEADERS, synthetic_patient_sheet(rows))])
+        return "write-only workbook"
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        extension = 'pdf' if options['format'] == 'pdf' else 'xlsx'
+        baseline = peak_rss_mb()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f"benchmark.{extension}")
+            started = time.perf_counter()
+            if options['format'] == 'pdf':
+                detail = self.render_pdf(path, rows, options['detailed'])
+            else:
+                detail = self.render_excel(path, rows, options['legacy'])
+            elapsed = time.perf_counter() - started
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+
+        self.stdout.write(
+            f"{options['format']}: {rows} rows, {detail}, {size_mb:.1f} MB in {elapsed:.1f}s "
+            f"({rows / elapsed:,.0f} rows/s); peak RSS {peak_rss_mb():.0f} MB (baseline {baseline:.0f} MB)"
+        )
@@ -0,0 +1,99 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+
+from full_emr.models import User
+from full_emr.serializer import CreateAccountSerializer
+
+PREFIX = 'bench_signup_'
+
+
+class LegacyCreateAccountSerializer(CreateAccountSerializer):
+    """The previous validation: a UniqueValidator plus an exists() query per field."""
+    email = serializers.EmailField(validators=[UniqueValidator(queryset=User.objects.all())])
+    username = serializers.CharField(validators=[UniqueValidator(queryset=User.objects.all())])
+
+    def validate_email(self, value):
+        if User.objects.filter(email=value).exists():
+            raise serializers.ValidationError("Email is already registered.")
+        return value
+
+    def validate_username(self, value):
+        if User.objects.filter(username=value).exists():
+            raise serializers.ValidationError("Username already taken.")
+        return value
+
+    def validate_phone_number(self, value):
+        value = super().validate_phone_number(value)
+        if User.objects.filter(phone_number=value).exists():
+            raise serializers.ValidationError("Phone number already registered.")
+        return value
+
+    def validate(self, data):
+        if data['password'] != data['password2']:
+            raise serializers.ValidationError({"password": "Passwords don't match."})
+        return data
+
+
+def signup_data(i, run):
+    return {
+        'username': f"{PREFIX}{run}_{i}", 'email': f"{PREFIX}{run}_{i}@example.com",
+        'password': 'Bench-pass-9431', 'password2': 'Bench-pass-9431',
+        'first_name': 'Bench', 'last_name': f"User{i}", 'role': 'patient',
+        'phone_number': f"{run % 1000:03d}{i:09d}", 'country_code': '+1',
+    }
+
+
+class Command(BaseCommand):
+    help = ("Time account creation through CreateAccountSerializer, optionally against the old "
+            "per-field uniqueness checks. Benchmark users are deleted afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=500)
+        parser.add_argument('--threads', type=int, default=1)
+        parser.add_argument('--legacy', action='store_true', help="Use the previous per-field uniqueness checks.")
+        parser.add_argument('--hash-passwords', action='store_true',
+                            help="Keep the real password hasher. By default a fast hasher is used so the "
+                                 "timings show validation and database work rather than PBKDF2.")
+
+    def handle(self, *args, **options):
+        serializer_class = LegacyCreateAccountSerializer if options['legacy'] else CreateAccountSerializer
+        run = int(time.time()) % 100_000
+        hashers = None if options['hash_passwords'] else ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+        # Query count for a single signup, measured on this thread's connection.
+        with override_settings(**({'PASSWORD_HASHERS': hashers} if hashers else {})):
+            with CaptureQueriesContext(connection) as queries:
+                self.create(serializer_class, signup_data(0, run))
+            queries_per_signup = len(queries)
+
+            def worker(indices):
+                try:
+                    for i in indices:
+                        self.create(serializer_class, signup_data(i, run))
+                finally:
+                    connections.close_all()
+
+            threads = max(1, options['threads'])
+            indices = list(range(1, options['count'] + 1))
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                list(executor.map(worker, [indices[t::threads] for t in range(threads)]))
+            elapsed = time.perf_counter() - started
+
+        deleted, _ = User.objects.filter(username__startswith=f"{PREFIX}{run}_").delete()
+        self.stdout.write(f"{'legacy' if options['legacy'] else 'current'} validation, {threads} thread(s)")
+        self.stdout.write(f"Queries per signup: {queries_per_signup}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['count']} signups in {elapsed:.2f}s ({options['count'] / elapsed:.0f}/s)"))
+        self.stdout.write(f"Removed {deleted} benchmark row(s)")
+
+    def create(self, serializer_class, data):
+        serializer = serializer_class(data=data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
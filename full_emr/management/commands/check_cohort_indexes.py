@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from full_emr.reports.cohort import SAMPLE_COHORT, CohortError, compile_cohort, explain_clauses
+
+
+class Command(BaseCommand):
+    help = ("EXPLAIN each table clause of a cohort and fail unless every EHR table is reached through an "
+            "index rather than a full scan. CohortIndexTests runs the same check for the sample cohort.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cohort', help="Cohort JSON to check (default: a sample covering every table).")
+        parser.add_argument('--verbose-plans', action='store_true', help="Print the full query plans.")
+
+    def handle(self, *args, **options):
+        spec = json.loads(options['cohort']) if options['cohort'] else SAMPLE_COHORT
+        try:
+            compile_cohort(spec)
+        except CohortError as e:
+            raise CommandError(f"Invalid cohort: {e}")
+
+        failures = []
+        for table, model, plan, uses_index in explain_clauses(spec):
+            if options['verbose_plans']:
+                self.stdout.write(plan)
+            if uses_index:
+                self.stdout.write(self.style.SUCCESS(f"{table}: index used"))
+            else:
+                failures.append(table)
+                self.stdout.write(self.style.ERROR(f"{table}: no index used for {model._meta.db_table}"))
+                self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f"Cohort clauses without an index: {', '.join(failures)}")
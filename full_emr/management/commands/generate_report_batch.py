@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from full_emr.models import User
+from full_emr.reports.batch import BATCH_FORMATS, department_choices, enqueue_batch
+from full_emr.reports.jobs import claim_job, default_workers, run_jobs_parallel
+
+
+class Command(BaseCommand):
+    help = "Render a report per department and format in parallel, e.g. for month-end reporting."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', required=True, help="Base report name; the department is appended.")
+        parser.add_argument('--user', required=True, help="Username recorded as the reports' author.")
+        parser.add_argument('--start', help="date_range_start, YYYY-MM-DD.")
+        parser.add_argument('--end', help="date_range_end, YYYY-MM-DD.")
+        parser.add_argument('--departments', nargs='+', choices=department_choices())
+        parser.add_argument('--formats', nargs='+', choices=BATCH_FORMATS)
+        parser.add_argument('--detailed', action='store_true', help="Include detailed records.")
+        parser.add_argument('--workers', type=int, default=0, help="Processes to use (default: one per CPU core).")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']}")
+
+        base = {
+            'name': options['name'],
+            'date_range_start': options['start'],
+            'date_range_end': options['end'],
+            'include_demographics': True,
+            'include_statistics': True,
+            'include_detailed_records': options['detailed'],
+        }
+        jobs = enqueue_batch(user, base, options['departments'], options['formats'])
+        cached = [job for job in jobs if job.status == 'completed']
+        # Claim here so a run_report_worker polling the same queue does not render them too.
+        claimed = [job.id for job in jobs if job.status == 'queued' and claim_job(job.id)]
+        self.stdout.write(
+            f"{len(jobs)} report(s): {len(cached)} from cache, rendering {len(claimed)} "
+            f"on {min(options['workers'] or default_workers(), len(claimed) or 1)} process(es)"
+        )
+
+        failed = 0
+        for job_id, status in run_jobs_parallel(claimed, options['workers'] or None):
+            failed += status != 'completed'
+            self.stdout.write(f"Job {job_id}: {status}")
+        style = self.style.ERROR if failed else self.style.SUCCESS
+        self.stdout.write(style(f"{len(jobs) - failed} report(s) ready, {failed} failed"))
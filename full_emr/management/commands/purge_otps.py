@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from full_emr.otp import purge_otp_rows
+
+
+class Command(BaseCommand):
+    help = ("Delete OTP audit rows that expired more than OTP_AUDIT_RETENTION_DAYS ago. "
+            "Live codes are in the cache and expire on their own.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true',
+                            help="Delete every expired row regardless of age, e.g. to clear rows from before the cache store.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now()
+        if not options['all']:
+            cutoff -= timedelta(days=settings.OTP_AUDIT_RETENTION_DAYS)
+        deleted = purge_otp_rows(cutoff, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} OTP row(s)"))
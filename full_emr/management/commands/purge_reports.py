@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from full_emr.reports.retention import purge_reports
+
+
+class Command(BaseCommand):
+    help = ("Delete reports past their retention period, Report rows whose file is missing, "
+            "and report files no Report row refers to.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be deleted without deleting.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--grace-minutes', type=int, default=60,
+                            help="Leave unreferenced files younger than this; they may belong to a running job.")
+
+    def handle(self, *args, **options):
+        stats = purge_reports(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            grace=timedelta(minutes=options['grace_minutes']),
+        )
+        prefix = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(f"{prefix} {stats['expired_rows']} expired report(s)")
+        self.stdout.write(f"{prefix} {stats['missing_file_rows']} report row(s) with no file")
+        self.stdout.write(f"{prefix} {stats['orphan_files']} orphan file(s)")
+        self.stdout.write(self.style.SUCCESS(f"Bytes reclaimed: {stats['bytes_reclaimed']:,}"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from full_emr.revocation import purge_revoked_tokens
+
+
+class Command(BaseCommand):
+    help = "Delete revoked-token rows whose tokens have expired; they can no longer be used anyway."
+
+    def handle(self, *args, **options):
+        deleted = purge_revoked_tokens()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired revoked token(s)"))
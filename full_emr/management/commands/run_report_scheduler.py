@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from full_emr.mailing import deliver_outbox
+from full_emr.reports.jobs import work
+from full_emr.reports.scheduler import enqueue_due_schedules
+
+
+class Command(BaseCommand):
+    help = "Queue scheduled reports that are due (inside REPORT_SCHEDULER_WINDOW) and send the outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run a single pass and exit.")
+        parser.add_argument('--poll-interval', type=float, default=60.0, help="Seconds between passes.")
+        parser.add_argument('--render', action='store_true',
+                            help="Also render queued jobs in this process, for local runs without run_report_worker.")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            jobs = enqueue_due_schedules()
+            if options['render']:
+                work(burst=True)
+            sent, failed = deliver_outbox()
+            if jobs or sent or failed:
+                self.stdout.write(f"Queued {len(jobs)} scheduled report(s); emailed {sent}, {failed} failed")
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from full_emr.reports.jobs import default_workers, work
+
+
+class Command(BaseCommand):
+    help = "Render queued report jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty.")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds between polls when idle.")
+        parser.add_argument('--stale-after', type=int, default=30,
+                            help="Requeue running jobs that have reported no progress for this many minutes (dead worker).")
+        parser.add_argument('--workers', type=int, default=0,
+                            help="Render this many jobs at once in separate processes (default: one per CPU core).")
+
+    def handle(self, *args, **options):
+        processed = work(
+            burst=options['burst'],
+            poll_interval=options['poll_interval'],
+            stale_after=timedelta(minutes=options['stale_after']),
+            workers=options['workers'] or default_workers(),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} report job(s)"))
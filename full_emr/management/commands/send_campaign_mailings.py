@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from full_emr.mailing import run_mailing
+from full_emr.models import CampaignMailing
+
+
+class Command(BaseCommand):
+    help = "Send queued health campaign mailings, resuming interrupted ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mailing', type=int, help="Only send this mailing id.")
+        parser.add_argument('--resume', action='store_true',
+                            help="Also pick up failed mailings, and 'sending' ones whose run stopped recording "
+                                 "progress more than CAMPAIGN_MAIL_CLAIM_TIMEOUT_MINUTES ago.")
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--rate', type=float, default=None, help="Maximum emails per second.")
+
+    def handle(self, *args, **options):
+        statuses = ['queued']
+        if options['resume'] or options['mailing']:
+            statuses += ['sending', 'failed']
+
+        mailings = CampaignMailing.objects.filter(status__in=statuses).select_related('campaign').order_by('id')
+        if options['mailing']:
+            mailings = mailings.filter(pk=options['mailing'])
+            if not mailings.exists():
+                raise CommandError(f"No pending mailing with id {options['mailing']}")
+
+        for mailing in mailings:
+            # run_mailing claims the mailing first, so concurrent runs do not send it twice.
+            self.stdout.write(f"Sending mailing {mailing.id} for campaign '{mailing.campaign.title}'")
+            try:
+                sent = run_mailing(mailing, batch_size=options['batch_size'], rate=options['rate'])
+            except Exception as e:
+                self.stderr.write(f"Mailing {mailing.id} failed: {e}")
+                continue
+            if sent is None:
+                self.stdout.write(f"Mailing {mailing.id} is being sent by another run; skipped")
+                continue
+            mailing = sent
+            self.stdout.write(self.style.SUCCESS(
+                f"Mailing {mailing.id}: {mailing.sent_count} sent, {mailing.failed_count} failed"
+            ))
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('full_emr', '0022_reportcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='allergy',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='immunization',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='allergy',
+            index=models.Index(fields=['patient', 'allergy_type', 'status'], name='allergy_patient_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='immunization',
+            index=models.Index(fields=['patient', 'administered_date'], name='immun_patient_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalhistory',
+            index=models.Index(fields=['patient', 'status', 'severity'], name='medhist_patient_status_idx'),
+        ),
+    ]
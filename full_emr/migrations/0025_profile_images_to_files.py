@@ -0,0 +1,110 @@
+import base64
+import binascii
+import hashlib
+import logging
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import migrations, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+
+# Copied from full_emr.profile_images as it was when this migration was written, so later changes
+# to that module cannot change what this migration does.
+PROFILE_IMAGE_SIZES = (64, 256)
+DEFAULT_SIZE = 256
+MAX_UPLOAD_BYTES = 2 * 1024 * 1024
+MAX_PIXELS = 40_000_000
+ACCEPTED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+
+
+class ProfileImageError(ValueError):
+    pass
+
+
+def decode_base64_image(value):
+    if value.startswith('data:'):
+        value = value.partition(',')[2]
+    if len(value) * 3 // 4 > MAX_UPLOAD_BYTES:
+        raise ProfileImageError("Image is too large. Maximum size is 2MB.")
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        raise ProfileImageError("Profile image must be base64-encoded image data.")
+
+
+def store_profile_image(data):
+    """Write square JPEG variants named by a hash of `data` and return the default one's URL."""
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise ProfileImageError("Image is too large. Maximum size is 2MB.")
+    try:
+        image = Image.open(BytesIO(data))
+        if image.format not in ACCEPTED_FORMATS:
+            raise ProfileImageError("Profile image must be a JPEG, PNG, GIF or WebP image.")
+        if image.width * image.height > MAX_PIXELS:
+            raise ProfileImageError("Image dimensions are too large.")
+        image.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise ProfileImageError("Uploaded data is not a valid image.")
+
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    names = {size: f"profile_images/{digest}_{size}.jpg" for size in PROFILE_IMAGE_SIZES}
+    if not all(default_storage.exists(name) for name in names.values()):
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+        for size, name in names.items():
+            if default_storage.exists(name):
+                continue
+            buffer = BytesIO()
+            ImageOps.fit(image, (size, size), Image.LANCZOS).save(buffer, 'JPEG', quality=85, optimize=True)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+    return default_storage.url(names[DEFAULT_SIZE])
+
+
+def convert_profile_images(apps, schema_editor):
+    """Replace base64 profile images with resized files, storing their URL on the row."""
+    User = apps.get_model('full_emr', 'User')
+    users = User.objects.exclude(profile_image__isnull=True).exclude(profile_image='').order_by('id')
+    last_id = converted = dropped = 0
+    while True:
+        batch = list(users.filter(id__gt=last_id).values_list('id', 'profile_image')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        # Each batch commits on its own, so a large table is not converted in one transaction.
+        with transaction.atomic():
+            for user_id, value in batch:
+                if value.startswith(('http://', 'https://', '/')) and len(value) <= 255:
+                    continue  # already a URL
+                try:
+                    url = store_profile_image(decode_base64_image(value))
+                    converted += 1
+                except ProfileImageError as e:
+                    logger.warning(f"Dropping unreadable profile image of user {user_id}: {e}")
+                    url = None
+                    dropped += 1
+                User.objects.filter(id=user_id).update(profile_image=url)
+    if converted or dropped:
+        logger.info(f"Converted {converted} profile images to files, dropped {dropped}")
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('full_emr', '0024_outboxemail_reportschedule'),
+    ]
+
+    operations = [
+        migrations.RunPython(convert_profile_images, migrations.RunPython.noop),
+    ]
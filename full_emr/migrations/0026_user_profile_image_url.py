@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('full_emr', '0025_profile_images_to_files'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='profile_image',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('full_emr', '0027_token_revocation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='otp',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='otp',
+            name='otp_code',
+            field=models.CharField(blank=True, default='', max_length=6),
+        ),
+    ]
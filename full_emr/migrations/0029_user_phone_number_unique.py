@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:55
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_phone_numbers(apps, schema_editor):
+    """Stop with a readable list instead of an IntegrityError if accounts already share a phone number."""
+    User = apps.get_model('full_emr', 'User')
+    duplicates = list(
+        User.objects.exclude(phone_number='').values('phone_number')
+        .annotate(accounts=Count('id')).filter(accounts__gt=1).values_list('phone_number', 'accounts')[:20]
+    )
+    if duplicates:
+        listing = ', '.join(f"{phone} ({accounts} accounts)" for phone, accounts in duplicates)
+        raise RuntimeError(f"Resolve duplicate phone numbers before adding the unique constraint: {listing}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('full_emr', '0028_otp_audit_trail'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_phone_numbers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(condition=models.Q(('phone_number', ''), _negated=True), fields=('phone_number',), name='user_phone_number_unique'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('full_emr', '0030_outboxemail_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaignmailing',
+            name='claim_token',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='campaignmailing',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('full_emr', '0031_campaignmailing_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='progress_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
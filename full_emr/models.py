@@ -1,6 +1,3 @@
-import random
-from datetime import timedelta
-
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
@@ -23,11 +20,20 @@ class User(AbstractUser):
     phone_number = models.CharField(max_length=30)
     country_code = models.CharField(max_length=5)
     license_number = models.CharField(max_length=50, blank=True, null=True)
-    profile_image = models.TextField(blank=True, null=True)
+    profile_image = models.CharField(max_length=255, blank=True, null=True)  # URL, see full_emr.profile_images
     email = models.EmailField(unique=True)
 
     last_login_ip = models.GenericIPAddressField(blank=True,null=True)
     last_login_at = models.DateTimeField(blank=True,null=True)
+    # Tokens issued before this are revoked (logout everywhere, password reset). See full_emr.revocation.
+    tokens_valid_after = models.DateTimeField(blank=True, null=True, db_index=True)
+
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            # Accounts made without a phone (e.g. by createsuperuser) store ''; only real numbers must be unique.
+            models.UniqueConstraint(fields=['phone_number'], condition=~models.Q(phone_number=''),
+                                    name='user_phone_number_unique'),
+        ]
 
 
 def __str__(self):
@@ -35,10 +41,11 @@ def __str__(self):
 
 
 class OTP(models.Model):
+    """Audit trail of issued one-time passwords; the live codes are in the cache (see full_emr.otp)."""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='otps')
-    otp_code = models.CharField(max_length=6)
+    otp_code = models.CharField(max_length=6, blank=True, default='')  # legacy rows only; codes are no longer stored
     created_at = models.DateTimeField(auto_now_add=True)
-    expires_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
     is_used = models.BooleanField(default=False)
     purpose = models.CharField(max_length=20, default='password_reset')
 
@@ -46,27 +53,23 @@ class OTP(models.Model):
         ordering = ['-created_at']
 
     def __str__(self):
-        return f"OTP for {self.user.email} - {self.otp_code}"
+        return f"OTP for {self.user.email} ({self.purpose})"
 
     def is_valid(self):
         return not self.is_used and timezone.now() < self.expires_at
 
-    @classmethod
-    def generate_otp(cls, user, purpose='password_reset', expiry_minutes=10):
-        # Generate 4-digit random number
-        otp_code = str(random.randint(1000, 9999))
-
-        # Invalidate previous OTPs for the same purpose
-        cls.objects.filter(user=user, purpose=purpose, is_used=False).update(is_used=True)
-
-        # Create new OTP
-        expires_at = timezone.now() + timedelta(minutes=expiry_minutes)
-        return cls.objects.create(
-            user=user,
-            otp_code=otp_code,
-            expires_at=expires_at,
-            purpose=purpose
-        )
+
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, related_name='revoked_tokens')
+    token_type = models.CharField(max_length=10)
+    expires_at = models.DateTimeField(db_index=True)  # rows can be purged once the token would have expired anyway
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)  # revocation filters sync on this
+
+    def __str__(self):
+        return f"Revoked {self.token_type} token {self.jti}"
+
+
 class AddPatients(models.Model):
     CATEGORY_CHOICES = [
         ("General", "General"),
@@ -106,6 +109,91 @@ class Report(models.Model):
     def __str__(self):
         return f"{self.name} - {self.generated_date}"
 
+class ReportCacheEntry(models.Model):
+    key = models.CharField(max_length=64, unique=True)  # sha256 of parameters + data watermark
+    file_path = models.FileField(upload_to='report_cache/')
+    format = models.CharField(max_length=10)
+    size = models.PositiveBigIntegerField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_accessed_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Cached {self.format} report {self.key[:12]}"
+
+class ReportJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='report_jobs')
+    parameters = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    progress = models.PositiveSmallIntegerField(default=0)  # percent
+    report = models.ForeignKey(Report, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # Heartbeat: set on claim and on every progress callback, so a long render is not mistaken for a dead worker.
+    progress_updated_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"Report job {self.id} ({self.status})"
+
+class ReportSchedule(models.Model):
+    name = models.CharField(max_length=100)
+    cron_expression = models.CharField(max_length=100)  # evaluated in TIME_ZONE
+    parameters = models.JSONField()  # GenerateReportSerializer input, as stored on ReportJob
+    recipients = models.JSONField(default=list, blank=True)  # email addresses sent the finished report
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='report_schedules')
+    is_active = models.BooleanField(default=True)
+    next_run_at = models.DateTimeField(blank=True, null=True)
+    last_run_at = models.DateTimeField(blank=True, null=True)
+    last_job = models.ForeignKey(ReportJob, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['next_run_at']
+        indexes = [models.Index(fields=['is_active', 'next_run_at'])]
+
+    def __str__(self):
+        return f"{self.name} ({self.cron_expression})"
+
+class OutboxEmail(models.Model):
+    STATUS_CHOICES = [
+        ('waiting', 'Waiting for report'),
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    recipients = models.JSONField()
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    # When set, the email waits for the job and goes out with its report attached.
+    report_job = models.ForeignKey(ReportJob, on_delete=models.SET_NULL, null=True, blank=True, related_name='emails')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)  # when a sender set status='sending'
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
+
 class Appointment(models.Model):
     STATUS_CHOICES = [
         ('Scheduled', 'Scheduled'),
@@ -214,6 +302,10 @@ class MedicalHistory(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Patient first: cohort EXISTS clauses probe by patient, then narrow on status/severity.
+        indexes = [models.Index(fields=['patient', 'status', 'severity'], name='medhist_patient_status_idx')]
+
 class VitalSigns(models.Model):
     patient = models.ForeignKey(AddPatients, on_delete=models.CASCADE, related_name='vital_signs')
     recorded_at = models.DateTimeField()
@@ -253,6 +345,10 @@ class Allergy(models.Model):
     ], default='active')
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['patient', 'allergy_type', 'status'], name='allergy_patient_type_idx')]
 
 class Immunization(models.Model):
     patient = models.ForeignKey(AddPatients, on_delete=models.CASCADE, related_name='immunizations')
@@ -268,6 +364,10 @@ class Immunization(models.Model):
     site = models.CharField(max_length=50, blank=True)
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['patient', 'administered_date'], name='immun_patient_date_idx')]
 
 class FamilyHistory(models.Model):
     patient = models.ForeignKey(AddPatients, on_delete=models.CASCADE, related_name='family_history')
@@ -352,6 +452,37 @@ class HealthCampaign(models.Model):
         return self.title
 
 
+class CampaignMailing(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    campaign = models.ForeignKey(HealthCampaign, on_delete=models.CASCADE, related_name='mailings')
+    subject = models.CharField(max_length=200)
+    body = models.TextField()  # Django template source, rendered per patient
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    last_patient_id = models.PositiveBigIntegerField(default=0)  # resume cursor
+    # The run sending this mailing, and when it last recorded progress (see full_emr.mailing.claim_mailing).
+    claim_token = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Mailing for {self.campaign.title} ({self.status})"
+
+
 class EducationalResource(models.Model):
     RESOURCE_TYPES = [
         ('article', 'Article'),
@@ -0,0 +1,95 @@
+"""One-time passwords kept in a cache with a native TTL.
+
+Each (user, purpose) has at most one live code: issuing a new one overwrites
+the old. Only an HMAC of the code is stored, checked in constant time, and a
+code is burned after OTP_MAX_ATTEMPTS wrong guesses. With OTP_AUDIT_TRAIL on,
+issue and use are also recorded in the OTP table (without the code).
+"""
+import hashlib
+import hmac
+import logging
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .models import OTP
+
+logger = logging.getLogger(__name__)
+
+
+class CacheOTPStore:
+    def __init__(self, alias, digits, max_attempts, audit=False):
+        self.alias = alias
+        self.digits = digits
+        self.max_attempts = max_attempts
+        self.audit = audit
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _key(self, user_id, purpose):
+        return f"otp:{purpose}:{user_id}"
+
+    def _digest(self, user_id, purpose, code):
+        message = f"{purpose}:{user_id}:{code}".encode('utf-8')
+        return hmac.new(settings.SECRET_KEY.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+    def issue(self, user, purpose, ttl):
+        """Create a code for `user`, replacing any live one, and return it. `ttl` is in seconds."""
+        code = f"{secrets.randbelow(10 ** self.digits):0{self.digits}d}"
+        audit_id = None
+        if self.audit:
+            audit_id = OTP.objects.create(
+                user=user, purpose=purpose, expires_at=timezone.now() + timedelta(seconds=ttl),
+            ).pk
+        key = self._key(user.pk, purpose)
+        self.cache.set(key, {'digest': self._digest(user.pk, purpose, code), 'audit_id': audit_id}, timeout=ttl)
+        self.cache.set(f"{key}:attempts", 0, timeout=ttl)
+        return code
+
+    def verify(self, user, purpose, code, consume=False):
+        """True if `code` is the live code. With consume=True a correct code is used up;
+        of concurrent requests consuming the same code only one succeeds."""
+        key = self._key(user.pk, purpose)
+        entry = self.cache.get(key)
+        if entry is None:
+            return False
+        if not hmac.compare_digest(entry['digest'], self._digest(user.pk, purpose, str(code))):
+            try:
+                attempts = self.cache.incr(f"{key}:attempts")
+            except ValueError:  # the counter expired with the code
+                return False
+            if attempts >= self.max_attempts:
+                logger.warning(f"OTP for user {user.pk} ({purpose}) burned after {attempts} wrong attempts")
+                self.cache.delete_many([key, f"{key}:attempts"])
+            return False
+        if consume:
+            if not self.cache.delete(key):
+                return False
+            self.cache.delete(f"{key}:attempts")
+            if entry.get('audit_id'):
+                OTP.objects.filter(pk=entry['audit_id']).update(is_used=True)
+        return True
+
+
+otp_store = CacheOTPStore(
+    settings.OTP_CACHE_ALIAS,
+    settings.OTP_DIGITS,
+    settings.OTP_MAX_ATTEMPTS,
+    audit=settings.OTP_AUDIT_TRAIL,
+)
+
+
+def purge_otp_rows(older_than, batch_size=1000):
+    """Delete OTP rows that expired before `older_than`, in batches. Returns the number deleted."""
+    total = 0
+    while True:
+        ids = list(OTP.objects.filter(expires_at__lt=older_than).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return total
+        deleted, _ = OTP.objects.filter(pk__in=ids).delete()
+        total += deleted
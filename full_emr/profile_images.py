@@ -0,0 +1,99 @@
+import base64
+import binascii
+import hashlib
+import logging
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+PROFILE_IMAGE_DIR = 'profile_images'
+# Square JPEG variants written for every upload; the user row stores the DEFAULT_SIZE URL.
+PROFILE_IMAGE_SIZES = (64, 256)
+DEFAULT_SIZE = 256
+MAX_UPLOAD_BYTES = 2 * 1024 * 1024
+MAX_PIXELS = 40_000_000  # refuse decompression bombs before decoding
+ACCEPTED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+
+
+class ProfileImageError(ValueError):
+    pass
+
+
+def decode_base64_image(value):
+    """Bytes from a base64 string, with or without a `data:image/...;base64,` prefix."""
+    if value.startswith('data:'):
+        value = value.partition(',')[2]
+    # Each 4 base64 characters hold 3 bytes; reject oversize uploads before decoding them.
+    if len(value) * 3 // 4 > MAX_UPLOAD_BYTES:
+        raise ProfileImageError("Image is too large. Maximum size is 2MB.")
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        raise ProfileImageError("Profile image must be base64-encoded image data.")
+
+
+def _variant_name(digest, size):
+    return f"{PROFILE_IMAGE_DIR}/{digest}_{size}.jpg"
+
+
+class ProfileImage:
+    """A validated upload. Its resized files are only written by save()."""
+
+    def __init__(self, data, image):
+        self.digest = hashlib.sha256(data).hexdigest()[:32]
+        self.image = image
+
+    def save(self):
+        """Write square JPEG variants and return the URL of the default one.
+
+        Files are named by a hash of the upload, so re-uploading the same picture
+        reuses its files and a URL never changes content (it can be cached forever).
+        """
+        if not all(default_storage.exists(_variant_name(self.digest, size)) for size in PROFILE_IMAGE_SIZES):
+            image = ImageOps.exif_transpose(self.image)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # JPEG has no alpha channel: flatten transparent areas onto white.
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            else:
+                image = image.convert('RGB')
+            for size in PROFILE_IMAGE_SIZES:
+                name = _variant_name(self.digest, size)
+                if default_storage.exists(name):
+                    continue
+                buffer = BytesIO()
+                ImageOps.fit(image, (size, size), Image.LANCZOS).save(buffer, 'JPEG', quality=85, optimize=True)
+                default_storage.save(name, ContentFile(buffer.getvalue()))
+            logger.debug(f"Stored profile image variants for {self.digest}")
+        return default_storage.url(_variant_name(self.digest, DEFAULT_SIZE))
+
+
+def open_profile_image(data):
+    """Check uploaded bytes are an acceptable image and return it as a ProfileImage, without writing files."""
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise ProfileImageError("Image is too large. Maximum size is 2MB.")
+    try:
+        image = Image.open(BytesIO(data))
+        if image.format not in ACCEPTED_FORMATS:
+            raise ProfileImageError("Profile image must be a JPEG, PNG, GIF or WebP image.")
+        if image.width * image.height > MAX_PIXELS:
+            raise ProfileImageError("Image dimensions are too large.")
+        image.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise ProfileImageError("Uploaded data is not a valid image.")
+    return ProfileImage(data, image)
+
+
+def profile_image_variants(url):
+    """{size: url} for a stored profile image URL, or {} if the user has none."""
+    suffix = f"_{DEFAULT_SIZE}.jpg"
+    if not url or not url.endswith(suffix):
+        return {}
+    stem = url[:-len(suffix)]
+    return {size: f"{stem}_{size}.jpg" for size in PROFILE_IMAGE_SIZES}
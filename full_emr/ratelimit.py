@@ -0,0 +1,231 @@
+"""Token-bucket rate limits for the unauthenticated account endpoints.
+
+A view opts in with `throttle_classes = [TokenBucketThrottle]` and a
+`throttle_scope`; settings.RATE_LIMITS maps each scope to rules such as
+'ip:20/m' or 'email:5/15m' (key, then bucket size per period). Every rule
+is its own bucket, refilled continuously at size/period tokens per second,
+and a request needs one token from each. If any rule rejects a request, the
+tokens it already took from the other rules are given back.
+
+'ip' rules key on REMOTE_ADDR. Behind RATE_LIMIT_PROXY_HOPS trusted proxies
+they key on the address the outermost proxy appended to X-Forwarded-For;
+entries a client adds itself sit further left and are ignored.
+
+DRF runs throttles in APIView.initial(), so a rejected request is answered
+429 with Retry-After before its serializer hashes a password or queries the
+database.
+"""
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+KEY_TYPES = ('ip', 'email', 'username', 'user')
+
+_RULE_RE = re.compile(r'^(ip|email|username|user):(\d+)/(\d*)([smhd])$')
+
+# Refill, then take `cost` tokens if there are enough. Uses the Redis clock so
+# every app server agrees on elapsed time. Returns {allowed, seconds to wait}.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(wait)}
+"""
+
+# Give back `cost` tokens taken by TOKEN_BUCKET_LUA, never above capacity.
+REFUND_LUA = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(math.min(tonumber(ARGV[1]), tokens + tonumber(ARGV[2]))))
+end
+return 1
+"""
+
+
+class Rule:
+    def __init__(self, text):
+        match = _RULE_RE.match(text.replace(' ', ''))
+        if not match:
+            raise ImproperlyConfigured(
+                f"Invalid rate limit rule {text!r}; expected e.g. 'ip:20/m' or 'email:5/15m'")
+        self.key_type, capacity, multiplier, unit = match.groups()
+        self.capacity = int(capacity)
+        self.period = int(multiplier or 1) * PERIODS[unit]
+        if not self.capacity:
+            raise ImproperlyConfigured(f"Rate limit rule {text!r} allows no requests")
+        self.rate = self.capacity / self.period
+        self.text = text
+
+
+class MemoryBucketBackend:
+    """Buckets in a process-local dict. For tests and single-process local runs."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost=1):
+        with self._lock:
+            now = time.monotonic()
+            tokens, ts = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - ts) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return True, 0
+            self._buckets[key] = (tokens, now)
+            return False, (cost - tokens) / rate
+
+    def refund(self, key, capacity, cost=1):
+        with self._lock:
+            if key in self._buckets:
+                tokens, ts = self._buckets[key]
+                self._buckets[key] = (min(capacity, tokens + cost), ts)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBucketBackend:
+    """Buckets shared by every process, updated atomically by a Lua script."""
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.script = self.client.register_script(TOKEN_BUCKET_LUA)
+        self.refund_script = self.client.register_script(REFUND_LUA)
+
+    def take(self, key, capacity, rate, cost=1):
+        allowed, wait = self.script(keys=[key], args=[capacity, rate, cost])
+        return bool(allowed), float(wait)
+
+    def refund(self, key, capacity, cost=1):
+        self.refund_script(keys=[key], args=[capacity, cost])
+
+    def clear(self):
+        for key in self.client.scan_iter(match='rl:*', count=1000):
+            self.client.delete(key)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = settings.RATE_LIMIT_BACKEND
+                if name == 'redis':
+                    _backend = RedisBucketBackend(settings.REDIS_URL)
+                elif name == 'memory':
+                    _backend = MemoryBucketBackend()
+                else:
+                    raise ImproperlyConfigured(f"RATE_LIMIT_BACKEND must be 'redis' or 'memory', not {name!r}")
+    return _backend
+
+
+def rules_for(scope):
+    return [Rule(text) for text in settings.RATE_LIMITS.get(scope, ())]
+
+
+def client_ip(request):
+    """The client's address, trusting only the last RATE_LIMIT_PROXY_HOPS X-Forwarded-For entries."""
+    hops = settings.RATE_LIMIT_PROXY_HOPS
+    if hops:
+        forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+        forwarded = [part for part in forwarded if part]
+        if len(forwarded) >= hops:
+            return forwarded[-hops]
+    return request.META.get('REMOTE_ADDR')
+
+
+def _hashed(value):
+    # Keep addresses out of the rate limit store.
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:24]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Applies settings.RATE_LIMITS[view.throttle_scope]; views without a scope are not limited."""
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        scope = getattr(view, 'throttle_scope', None)
+        if not scope or not settings.RATE_LIMIT_ENABLED:
+            return True
+
+        backend = get_backend()
+        taken = []
+        for rule in rules_for(scope):
+            ident = self.get_key_value(request, rule.key_type)
+            if ident is None:
+                continue
+            key = f"rl:{scope}:{rule.key_type}:{_hashed(ident)}:{rule.capacity}/{rule.period}"
+            try:
+                allowed, wait = backend.take(key, rule.capacity, rule.rate)
+            except Exception as e:
+                # Fail open: an outage of the limiter must not lock everyone out of their accounts.
+                logger.error(f"Rate limiter unavailable, allowing {scope} request: {e}")
+                return True
+            if not allowed:
+                self.wait_seconds = wait
+                logger.warning(f"Rate limit {rule.text} exceeded for {scope} "
+                               f"from {client_ip(request)}; retry in {math.ceil(wait)}s")
+                self.refund(backend, taken)
+                return False
+            taken.append((key, rule.capacity))
+        return True
+
+    @staticmethod
+    def refund(backend, taken):
+        # A rejected request should not use up the budgets of the rules that let it through.
+        for key, capacity in taken:
+            try:
+                backend.refund(key, capacity)
+            except Exception as e:
+                logger.error(f"Rate limiter refund failed for {key}: {e}")
+
+    def get_key_value(self, request, key_type):
+        if key_type == 'ip':
+            return client_ip(request)
+        if key_type == 'user':
+            user = getattr(request, 'user', None)
+            return str(user.pk) if user is not None and user.is_authenticated else None
+        # Read from the parsed body; invalid bodies raise ParseError just as the view would.
+        data = request.data
+        value = data.get(key_type) if hasattr(data, 'get') else None
+        if not isinstance(value, str) or not value.strip():
+            return None
+        # Emails match case-insensitively at login; usernames do not.
+        return value.strip().lower() if key_type == 'email' else value.strip()
+
+    def wait(self):
+        return self.wait_seconds
@@ -0,0 +1,27 @@
+from ..models import AddPatients
+from .jobs import enqueue_report, reuse_cached_report
+
+BATCH_FORMATS = ['pdf', 'excel']
+
+
+def department_choices():
+    return [value for value, _ in AddPatients.CATEGORY_CHOICES]
+
+
+def batch_parameters(base, departments=None, formats=None):
+    """One report parameter set per (department, format) pair, sharing `base`'s filters."""
+    departments = departments or department_choices()
+    formats = formats or BATCH_FORMATS
+    return [
+        {**base, 'name': f"{base['name']} - {department}", 'department': department, 'format': file_format}
+        for department in departments
+        for file_format in formats
+    ]
+
+
+def enqueue_batch(user, base, departments=None, formats=None):
+    """Queue a job per (department, format); those already in the report cache complete immediately."""
+    return [
+        reuse_cached_report(user, params) or enqueue_report(user, params)
+        for params in batch_parameters(base, departments, formats)
+    ]
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from ..models import AddPatients, Allergy, Appointment, Diagnostic, Immunization, MedicalHistory, ReportCacheEntry
+from .queries import normalize_department
+from .renderers import FILE_EXTENSIONS, reserve_report_path
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = 'report_cache'
+
+# Tables whose contents can appear in a rendered report.
+WATERMARK_MODELS = [AddPatients, Appointment, Diagnostic, MedicalHistory, Allergy, Immunization]
+WATERMARK_CACHE_KEY = 'reports:data_watermark'
+
+
+def normalize_params(params):
+    """Reduce stored report parameters to the values that change the rendered output."""
+    return {
+        'name': ' '.join(params['name'].split()),
+        'format': params['format'],
+        'date_range_start': params.get('date_range_start') or None,
+        'date_range_end': params.get('date_range_end') or None,
+        'department': normalize_department(params.get('department')),
+        'include_demographics': bool(params.get('include_demographics', True)),
+        'include_statistics': bool(params.get('include_statistics', True)),
+        'include_detailed_records': bool(params.get('include_detailed_records', False)),
+        'cohort': params.get('cohort') or None,
+    }
+
+
+def data_watermark():
+    """Changes whenever a row that could appear in a report is added, edited or deleted.
+
+    Counting every watched table is not cheap, so the result is kept in this
+    process for REPORT_CACHE_WATERMARK_SECONDS. Saves and deletes made through
+    the ORM in this process reset it at once (see full_emr.signals); other
+    writes can be served a cached report up to that many seconds old.
+    """
+    watermark = caches['default'].get(WATERMARK_CACHE_KEY)
+    if watermark is None:
+        watermark = []
+        for model in WATERMARK_MODELS:
+            stats = model.objects.aggregate(count=Count('id'), latest=Max('updated_at'))
+            watermark.append([model._meta.label, stats['count'], stats['latest']])
+        caches['default'].set(WATERMARK_CACHE_KEY, watermark, timeout=settings.REPORT_CACHE_WATERMARK_SECONDS)
+    return watermark
+
+
+def invalidate_watermark():
+    caches['default'].delete(WATERMARK_CACHE_KEY)
+
+
+def cache_key(params):
+    payload = json.dumps(
+        {'params': normalize_params(params), 'watermark': data_watermark()},
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _absolute(name):
+    return os.path.join(settings.MEDIA_ROOT, name)
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Different filesystem, or hard links unsupported.
+        shutil.copyfile(src, dst)
+
+
+def lookup(key):
+    """Return the live cache entry for `key`, recording the hit, or None."""
+    entry = ReportCacheEntry.objects.filter(key=key).first()
+    if entry is None:
+        return None
+    if not os.path.exists(_absolute(entry.file_path.name)):
+        logger.warning(f"Report cache file missing for {key[:12]}, dropping entry")
+        entry.delete()
+        return None
+    entry.hits += 1
+    entry.last_accessed_at = timezone.now()
+    ReportCacheEntry.objects.filter(pk=entry.pk).update(hits=entry.hits, last_accessed_at=entry.last_accessed_at)
+    return entry
+
+
+def materialize(entry, name):
+    """Give a new report its own file, sharing the cached bytes, and return its storage path.
+
+    Reports get a hard link rather than pointing at the cache file so cache
+    eviction never removes a file a Report row still refers to.
+    """
+    relative, absolute = reserve_report_path(name, FILE_EXTENSIONS[entry.format])
+    temporary = f"{absolute}.{os.getpid()}.tmp"
+    _link_or_copy(_absolute(entry.file_path.name), temporary)
+    os.replace(temporary, absolute)
+    return relative
+
+
+def store(key, file_format, report_path):
+    """Add a freshly rendered report file to the cache under `key`."""
+    os.makedirs(_absolute(CACHE_DIR), exist_ok=True)
+    relative = f"{CACHE_DIR}/{key}.{FILE_EXTENSIONS[file_format]}"
+    absolute = _absolute(relative)
+    if not os.path.exists(absolute):
+        _link_or_copy(_absolute(report_path), absolute)
+    try:
+        entry = ReportCacheEntry.objects.create(
+            key=key, file_path=relative, format=file_format, size=os.path.getsize(absolute),
+            last_accessed_at=timezone.now(),
+        )
+    except IntegrityError:
+        # Another worker rendered the same report concurrently.
+        return ReportCacheEntry.objects.filter(key=key).first()
+    evict()
+    return entry
+
+
+def evict(max_bytes=None, max_entries=None):
+    """Drop least-recently-used entries until the cache fits its size and count limits."""
+    max_bytes = settings.REPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_entries = settings.REPORT_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    totals = ReportCacheEntry.objects.aggregate(size=Sum('size'), count=Count('id'))
+    total_size, count = totals['size'] or 0, totals['count']
+    if total_size <= max_bytes and count <= max_entries:
+        return 0
+
+    evicted = 0
+    oldest = ReportCacheEntry.objects.order_by('last_accessed_at').values_list('id', 'file_path', 'size')
+    for entry_id, name, size in oldest.iterator(chunk_size=100):
+        if total_size <= max_bytes and count <= max_entries:
+            break
+        try:
+            os.remove(_absolute(name))
+        except FileNotFoundError:
+            pass
+        ReportCacheEntry.objects.filter(pk=entry_id).delete()
+        total_size -= size
+        count -= 1
+        evicted += 1
+    logger.info(f"Evicted {evicted} report cache entr{'y' if evicted == 1 else 'ies'}")
+    return evicted
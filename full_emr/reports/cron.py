@@ -0,0 +1,89 @@
+"""Five-field cron expressions: minute hour day-of-month month day-of-week.
+
+Fields accept `*`, numbers, ranges (`1-5`), lists (`1,15`) and steps (`*/15`,
+`9-17/2`). Day of week runs 0-6 from Sunday (7 is also Sunday). As in
+cron, when both day fields are restricted a day matching either one fires.
+"""
+from datetime import timedelta
+
+FIELDS = [
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day of month', 1, 31),
+    ('month', 1, 12),
+    ('day of week', 0, 7),
+]
+
+# Give up looking for a match after this long, e.g. for "0 0 31 2 *".
+SEARCH_LIMIT = timedelta(days=366 * 5)
+
+
+class CronError(ValueError):
+    pass
+
+
+def _parse_field(text, name, low, high):
+    values = set()
+    for part in text.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            if not step_text.isdigit() or int(step_text) == 0:
+                raise CronError(f"Invalid step in {name} field: {text}")
+            step = int(step_text)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start_text, end_text = part.split('-', 1)
+            if not (start_text.isdigit() and end_text.isdigit()):
+                raise CronError(f"Invalid range in {name} field: {text}")
+            start, end = int(start_text), int(end_text)
+        elif part.isdigit():
+            start = end = int(part)
+            if step != 1:
+                end = high
+        else:
+            raise CronError(f"Invalid {name} field: {text}")
+        if not low <= start <= end <= high:
+            raise CronError(f"{name.capitalize()} values must be between {low} and {high}: {text}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise CronError("A cron expression needs five fields: minute hour day-of-month month day-of-week")
+        self.expression = expression
+        fields = [_parse_field(part, *spec) for part, spec in zip(parts, FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        self.weekdays = {day % 7 for day in weekdays}
+        self._any_day = parts[2] == '*'
+        self._any_weekday = parts[4] == '*'
+
+    def _day_matches(self, moment):
+        day_ok = moment.day in self.days
+        # Python: Monday=0; cron: Sunday=0.
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment):
+        """First time strictly after `moment` (to the minute) that the schedule fires."""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + SEARCH_LIMIT
+        while candidate <= limit:
+            if candidate.month not in self.months:
+                # Jump to the first minute of next month.
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise CronError(f"'{self.expression}' never fires")
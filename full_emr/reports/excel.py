@@ -0,0 +1,33 @@
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+HEADER_FONT = Font(bold=True)
+INVALID_TITLE_CHARS = str.maketrans({c: ' ' for c in '[]:*?/\\'})
+
+
+def sheet_title(title):
+    """Excel sheet names are capped at 31 characters and may not contain []:*?/\\."""
+    return title.translate(INVALID_TITLE_CHARS).strip()[:31] or 'Sheet'
+
+
+def render_xlsx(file_path, sheets):
+    """Write an .xlsx workbook from `sheets`: [(title, headers, rows), ...].
+
+    Uses openpyxl's write-only mode: each row is serialised to a temporary
+    file as soon as it is appended, so peak memory is one row plus a fixed
+    overhead per sheet instead of a Cell object for every value written.
+    """
+    wb = Workbook(write_only=True)
+    for title, headers, rows in sheets:
+        ws = wb.create_sheet(title=sheet_title(title))
+        ws.freeze_panes = 'A2'
+        header_cells = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.font = HEADER_FONT
+            header_cells.append(cell)
+        ws.append(header_cells)
+        for row in rows:
+            ws.append(row)
+    wb.save(file_path)
@@ -0,0 +1,194 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+
+from django.db import close_old_connections, connections
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import Report, ReportJob
+from . import cache, pool
+from .queries import patient_queryset
+from .renderers import generate_file
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_report(user, params):
+    job = ReportJob.objects.create(requested_by=user, parameters=params)
+    logger.info(f"Report job {job.id} queued by user {user.id}: {params['name']}")
+    return job
+
+
+def reuse_cached_report(user, params):
+    """Complete a job immediately from the report cache, or return None on a miss."""
+    entry = cache.lookup(cache.cache_key(params))
+    if entry is None:
+        return None
+    now = timezone.now()
+    report = _create_report(user, params, cache.materialize(entry, params['name']))
+    job = ReportJob.objects.create(
+        requested_by=user, parameters=params, status='completed', progress=100,
+        report=report, started_at=now, finished_at=now,
+    )
+    logger.info(f"Report job {job.id} served from cache entry {entry.key[:12]}")
+    return job
+
+
+def _create_report(user, params, file_path):
+    return Report.objects.create(
+        name=params['name'],
+        generated_by=user,
+        file_path=file_path,
+        parameters=params,
+        format=params['format']
+    )
+
+
+def claim_job(job_id):
+    """Atomically move a queued job to 'running' and return it, or None if another worker got it."""
+    # The conditional UPDATE is the lock: only one worker sees a row count of 1.
+    now = timezone.now()
+    claimed = ReportJob.objects.filter(pk=job_id, status='queued').update(
+        status='running', started_at=now, progress_updated_at=now, progress=0
+    )
+    if claimed:
+        return ReportJob.objects.select_related('requested_by').get(pk=job_id)
+    return None
+
+
+def claim_next_job():
+    """Claim the oldest queued job, or return None if the queue is empty."""
+    candidates = ReportJob.objects.filter(status='queued').order_by('created_at').values_list('id', flat=True)[:10]
+    for job_id in candidates:
+        job = claim_job(job_id)
+        if job:
+            return job
+    return None
+
+
+def requeue_stale_jobs(older_than):
+    """Put back jobs whose worker died mid-render, i.e. that have reported no progress for `older_than`."""
+    cutoff = timezone.now() - older_than
+    stale = Q(progress_updated_at__lt=cutoff) | Q(progress_updated_at__isnull=True, started_at__lt=cutoff)
+    count = ReportJob.objects.filter(stale, status='running').update(status='queued', progress=0)
+    if count:
+        logger.warning(f"Requeued {count} stale report job(s) with no progress since {cutoff.isoformat()}")
+    return count
+
+
+def run_job(job):
+    """Render the report for a claimed job and attach the resulting Report row."""
+    params = job.parameters
+
+    def progress(percent):
+        ReportJob.objects.filter(pk=job.pk).update(progress=percent, progress_updated_at=timezone.now())
+
+    try:
+        # Keyed before rendering so rows written mid-render invalidate the entry.
+        key = cache.cache_key(params)
+        entry = cache.lookup(key)
+        if entry:
+            file_path = cache.materialize(entry, params['name'])
+        else:
+            patients = patient_queryset(params)
+            file_path = generate_file(params['name'], params['format'], patients, params, progress=progress)
+            cache.store(key, params['format'], file_path)
+        report = _create_report(job.requested_by, params, file_path)
+    except Exception as e:
+        logger.error(f"Report job {job.id} failed: {e}", exc_info=True)
+        ReportJob.objects.filter(pk=job.pk).update(status='failed', error=str(e), finished_at=timezone.now())
+        job.refresh_from_db()
+        return job
+
+    ReportJob.objects.filter(pk=job.pk).update(
+        status='completed', progress=100, report=report, finished_at=timezone.now()
+    )
+    job.refresh_from_db()
+    logger.info(f"Report job {job.id} completed: report {report.id}")
+    return job
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def report_pool(workers):
+    # The parent's connections are useless to the children; do not hold them open across the pool's life.
+    connections.close_all()
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=pool.init_worker
+    )
+
+
+def _mark_crashed(job_id, error):
+    # The child died (or failed to start) before run_job could record the failure itself.
+    logger.error(f"Report job {job_id} crashed its worker: {error}", exc_info=True)
+    ReportJob.objects.filter(pk=job_id).update(status='failed', error=str(error), finished_at=timezone.now())
+
+
+def run_jobs_parallel(job_ids, workers=None):
+    """Render already-claimed jobs across a process pool, yielding (job_id, status) as each finishes."""
+    if not job_ids:
+        return
+    workers = min(workers or default_workers(), len(job_ids)) or 1
+    with report_pool(workers) as executor:
+        futures = {executor.submit(pool.render_job, job_id): job_id for job_id in job_ids}
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                job_id = futures.pop(future)
+                try:
+                    yield future.result()
+                except Exception as e:
+                    _mark_crashed(job_id, e)
+                    yield job_id, 'failed'
+
+
+def work(burst=False, poll_interval=2.0, stale_after=timedelta(minutes=30), workers=1):
+    """Process queued jobs until the queue is empty (burst) or forever."""
+    if workers > 1:
+        return _work_parallel(burst, poll_interval, stale_after, workers)
+    processed = 0
+    requeue_stale_jobs(stale_after)
+    while True:
+        close_old_connections()
+        job = claim_next_job()
+        if job is None:
+            if burst:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
+
+
+def _work_parallel(burst, poll_interval, stale_after, workers):
+    """Like work(), keeping up to `workers` jobs rendering at once in child processes."""
+    processed = 0
+    requeue_stale_jobs(stale_after)
+    running = {}
+    with report_pool(workers) as executor:
+        while True:
+            close_old_connections()
+            while len(running) < workers:
+                job = claim_next_job()
+                if job is None:
+                    break
+                running[executor.submit(pool.render_job, job.id)] = job.id
+            if not running:
+                if burst:
+                    return processed
+                time.sleep(poll_interval)
+                continue
+            done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                job_id = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    _mark_crashed(job_id, e)
+                processed += 1
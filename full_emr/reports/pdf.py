@@ -0,0 +1,123 @@
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+FONT = 'Helvetica'
+FONT_BOLD = 'Helvetica-Bold'
+MARGIN = 40
+ROW_HEIGHT = 14
+FONT_SIZE = 8
+CELL_PADDING = 3
+
+
+class PDFReportWriter:
+    """Draws a report straight onto a canvas, page by page.
+
+    Rows are drawn as they arrive from the iterator and never collected, so the
+    only thing that grows with report size is the finished page content that
+    reportlab keeps until save() (roughly 20KB per page of table rows).
+    """
+
+    def __init__(self, file_path, title, pagesize=letter):
+        self.canvas = canvas.Canvas(file_path, pagesize=pagesize, pageCompression=1)
+        self.canvas.setTitle(title)
+        self.title = title
+        self.width, self.height = pagesize
+        self.page_number = 0
+        self._table_header = None
+        self._new_page()
+
+    def _new_page(self):
+        if self.page_number:
+            self.canvas.showPage()
+        self.page_number += 1
+        self.canvas.setFont(FONT, FONT_SIZE)
+        self.canvas.setFillColor(colors.grey)
+        self.canvas.drawString(MARGIN, MARGIN / 2, self.title)
+        self.canvas.drawRightString(self.width - MARGIN, MARGIN / 2, f"Page {self.page_number}")
+        self.canvas.setFillColor(colors.black)
+        self.y = self.height - MARGIN
+
+    def _ensure_space(self, height):
+        if self.y - height < MARGIN:
+            self._new_page()
+            if self._table_header:
+                self._draw_table_header(*self._table_header)
+
+    def heading(self, text, size=14):
+        # Keep a heading on the same page as the first rows beneath it.
+        self._ensure_space(size + 10 + ROW_HEIGHT * 3)
+        self.y -= size + 4
+        self.canvas.setFont(FONT_BOLD, size)
+        self.canvas.drawString(MARGIN, self.y, text)
+        self.y -= 6
+
+    def line(self, text, indent=0):
+        self._ensure_space(ROW_HEIGHT)
+        self.y -= ROW_HEIGHT
+        self.canvas.setFont(FONT, FONT_SIZE + 1)
+        self.canvas.drawString(MARGIN + indent, self.y, text)
+
+    def spacer(self, height=ROW_HEIGHT):
+        self.y -= height
+
+    def _draw_table_header(self, headers, widths):
+        self.y -= ROW_HEIGHT
+        self.canvas.setFillColor(colors.lightgrey)
+        self.canvas.rect(MARGIN, self.y - 4, sum(widths), ROW_HEIGHT, stroke=0, fill=1)
+        self.canvas.setFillColor(colors.black)
+        self.canvas.setFont(FONT_BOLD, FONT_SIZE)
+        x = MARGIN
+        for header, width in zip(headers, widths):
+            self.canvas.drawString(x + CELL_PADDING, self.y, _fit(header, width, FONT_BOLD))
+            x += width
+
+    def table(self, columns, rows, on_row=None):
+        """Draw `rows` under a header of `columns` ([(header, relative_width), ...]).
+
+        The header is repeated at the top of every page the table spans.
+        """
+        available = self.width - 2 * MARGIN
+        total = sum(weight for _, weight in columns)
+        widths = [available * weight / total for _, weight in columns]
+        headers = [header for header, _ in columns]
+
+        self._ensure_space(ROW_HEIGHT * 2)
+        self._table_header = (headers, widths)
+        self._draw_table_header(headers, widths)
+        for row in rows:
+            self._ensure_space(ROW_HEIGHT)
+            self.y -= ROW_HEIGHT
+            self.canvas.setFont(FONT, FONT_SIZE)
+            x = MARGIN
+            for value, width in zip(row, widths):
+                self.canvas.drawString(x + CELL_PADDING, self.y, _fit(_format(value), width, FONT))
+                x += width
+            if on_row:
+                on_row()
+        self._table_header = None
+        self.spacer(ROW_HEIGHT / 2)
+
+    def save(self):
+        self.canvas.showPage()
+        self.canvas.save()
+
+
+def _format(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    return str(value)
+
+
+def _fit(text, width, font):
+    """Clip `text` so it fits in a cell of `width` points."""
+    room = width - 2 * CELL_PADDING
+    # No Helvetica glyph used in reports is wider than 1.02em, so short strings skip measuring.
+    if len(text) * FONT_SIZE * 1.02 <= room or stringWidth(text, font, FONT_SIZE) <= room:
+        return text
+    while text and stringWidth(text + '…', font, FONT_SIZE) > room:
+        text = text[:-1]
+    return text + '…'
@@ -0,0 +1,24 @@
+"""Entry points run inside report worker processes.
+
+Spawned children unpickle these functions before Django is configured, so
+this module must not import models at module level.
+"""
+import django
+
+
+def init_worker():
+    # Spawn rather than fork: a forked child would share the parent's database sockets
+    # and channel-layer clients.
+    django.setup()
+
+
+def render_job(job_id):
+    """Render one claimed job. The child gets only the id and queries its own rows."""
+    from django.db import connections
+
+    from ..models import ReportJob
+    from .jobs import run_job
+
+    job = run_job(ReportJob.objects.select_related('requested_by').get(pk=job_id))
+    connections.close_all()
+    return job.id, job.status
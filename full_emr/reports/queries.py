@@ -0,0 +1,126 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Avg, Count, Max, Min
+from django.utils import timezone
+
+from ..models import AddPatients, Appointment, Diagnostic
+from .cohort import apply_cohort
+
+# (field, header) pairs for tabular patient exports
+PATIENT_COLUMNS = [
+    ('id', 'Patient ID'),
+    ('first_name', 'First Name'),
+    ('last_name', 'Last Name'),
+    ('age', 'Age'),
+    ('gender', 'Gender'),
+]
+
+# Columns RetrieveReportDataView can project; 'name' is derived from first/last name.
+REPORT_DATA_FIELDS = ['id', 'first_name', 'last_name', 'name', 'age', 'gender', 'category', 'created_at']
+
+
+def normalize_department(value):
+    """'all' for no department filter, otherwise the matching category spelled as stored."""
+    department = (value or 'all').strip()
+    if department.lower() == 'all':
+        return 'all'
+    categories = {category.lower(): category for category, _ in AddPatients.CATEGORY_CHOICES}
+    return categories.get(department.lower(), department)
+
+
+def serialize_report_params(validated_data):
+    """Turn GenerateReportSerializer output into the JSON stored on Report/ReportJob.
+
+    The name and department are normalized here so the cache key, the query
+    and the rendered file all see the same values.
+    """
+    params = dict(validated_data)
+    params['name'] = ' '.join(params['name'].split())
+    if 'department' in params:
+        params['department'] = normalize_department(params['department'])
+    if params.get('date_range_start'):
+        params['date_range_start'] = params['date_range_start'].isoformat()
+    if params.get('date_range_end'):
+        params['date_range_end'] = params['date_range_end'].isoformat()
+    return params
+
+
+def patient_queryset(params):
+    """AddPatients matching a report's stored parameters.
+
+    Raises ValueError if a stored date or cohort is malformed.
+    """
+    patients = AddPatients.objects.all()
+    if params.get('date_range_start'):
+        start_date = datetime.strptime(params['date_range_start'], '%Y-%m-%d')
+        start_date = timezone.make_aware(start_date)
+        patients = patients.filter(created_at__gte=start_date)
+    if params.get('date_range_end'):
+        end_date = datetime.strptime(params['date_range_end'], '%Y-%m-%d')
+        end_date = timezone.make_aware(end_date)
+        patients = patients.filter(created_at__lte=end_date)
+    department = normalize_department(params.get('department'))
+    if department != 'all':
+        patients = patients.filter(category=department)
+    return apply_cohort(patients, params.get('cohort'))
+
+
+def iter_rows(queryset, fields, chunk_size=None):
+    """Stream tuples of `fields` in id order without building model instances."""
+    chunk_size = chunk_size or settings.REPORT_EXPORT_CHUNK_SIZE
+    return queryset.order_by('id').values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def iter_patient_rows(patients, fields, chunk_size=None):
+    return iter_rows(patients, fields, chunk_size)
+
+
+def report_data_rows(patients, fields, after=0, limit=None, chunk_size=None):
+    """Patient dicts with only `fields`, in id order after the keyset cursor `after`.
+
+    With a `limit` this is one page of rows; without one the whole result is
+    streamed from a server-side cursor.
+    """
+    columns = set(fields) | {'id'}
+    if 'name' in columns:
+        columns |= {'first_name', 'last_name'}
+    columns.discard('name')
+
+    rows = patients.filter(id__gt=after).order_by('id').values(*columns)
+    if limit is not None:
+        rows = rows[:limit]
+    else:
+        rows = rows.iterator(chunk_size=chunk_size or settings.REPORT_EXPORT_CHUNK_SIZE)
+
+    for row in rows:
+        if 'name' in fields:
+            row['name'] = f"{row['first_name'] or 'Unknown'} {row['last_name'] or 'Unknown'}".strip()
+        for name_field in ('first_name', 'last_name'):
+            if name_field in fields:
+                row[name_field] = row[name_field] or 'Unknown'
+        if row.get('created_at') is not None:
+            row['created_at'] = row['created_at'].isoformat()
+        yield {field: row[field] for field in fields}
+
+
+def patient_statistics(patients):
+    """Aggregate counts for a report's statistics section, computed in the database."""
+    stats = patients.aggregate(
+        total=Count('id'), average_age=Avg('age'), youngest=Min('age'), oldest=Max('age')
+    )
+    stats['by_gender'] = list(
+        patients.order_by().values_list('gender').annotate(count=Count('id')).order_by('gender')
+    )
+    stats['by_category'] = list(
+        patients.order_by().values_list('category').annotate(count=Count('id')).order_by('category')
+    )
+    return stats
+
+
+def appointments_for(patients):
+    return Appointment.objects.filter(patient__in=patients.values('id'))
+
+
+def diagnostics_for(patients):
+    return Diagnostic.objects.filter(patient__in=patients.values('id'))
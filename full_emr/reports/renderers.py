@@ -0,0 +1,209 @@
+import itertools
+import logging
+import os
+import re
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from .excel import render_xlsx
+from .pdf import PDFReportWriter
+from .queries import PATIENT_COLUMNS, iter_rows, iter_patient_rows, appointments_for, diagnostics_for, \
+    patient_statistics
+from .streaming import csv_stream
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_EVERY = 500  # rows between progress callbacks
+
+FILE_EXTENSIONS = {'pdf': 'pdf', 'excel': 'xlsx', 'csv': 'csv'}
+
+DEMOGRAPHIC_FIELDS = ['id', 'first_name', 'last_name', 'age', 'gender']
+DEMOGRAPHIC_COLUMNS = [('Patient ID', 1), ('Name', 3.5), ('Age', 0.8), ('Gender', 1.2)]
+
+DETAIL_FIELDS = ['id', 'first_name', 'last_name', 'age', 'gender', 'category', 'phone', 'email', 'city', 'created_at']
+DETAIL_COLUMNS = [
+    ('ID', 0.8), ('Name', 2.4), ('Age', 0.6), ('Gender', 0.9), ('Category', 1.1), ('Phone', 1.4),
+    ('Email', 2.6), ('City', 1.3), ('Registered', 1.3),
+]
+
+
+PATIENT_SHEET_FIELDS = [
+    'id', 'first_name', 'last_name', 'age', 'gender', 'category', 'phone', 'email', 'city', 'created_at'
+]
+PATIENT_SHEET_HEADERS = [
+    'Patient ID', 'First Name', 'Last Name', 'Age', 'Gender', 'Category', 'Phone', 'Email', 'City', 'Registered'
+]
+APPOINTMENT_SHEET_FIELDS = [
+    'id', 'patient_id', 'patient__first_name', 'patient__last_name', 'doctor__first_name', 'doctor__last_name',
+    'date', 'time', 'duration', 'type', 'status'
+]
+APPOINTMENT_SHEET_HEADERS = [
+    'Appointment ID', 'Patient ID', 'Patient First Name', 'Patient Last Name', 'Doctor First Name',
+    'Doctor Last Name', 'Date', 'Time', 'Duration (min)', 'Type', 'Status'
+]
+DIAGNOSTIC_SHEET_FIELDS = [
+    'id', 'patient_id', 'patient__first_name', 'patient__last_name', 'test_type', 'date', 'status', 'result'
+]
+DIAGNOSTIC_SHEET_HEADERS = [
+    'Diagnostic ID', 'Patient ID', 'Patient First Name', 'Patient Last Name', 'Test Type', 'Date', 'Status',
+    'Result'
+]
+
+
+class Progress:
+    """Turns processed-row counts into throttled percent callbacks."""
+
+    def __init__(self, callback, total):
+        self.callback = callback
+        self.total = total
+        self.done = 0
+        if callback:
+            callback(0)
+
+    def step(self):
+        self.done += 1
+        if self.callback and self.total and self.done % PROGRESS_EVERY == 0:
+            self.callback(min(99, self.done * 100 // self.total))
+
+
+def _track_rows(rows, tracker):
+    for row in rows:
+        yield row
+        tracker.step()
+
+
+def _with_full_name(rows):
+    """Collapse (id, first, last, ...) tuples into (id, "first last", ...)."""
+    for row in rows:
+        yield (row[0], f"{row[1] or ''} {row[2] or ''}".strip()) + tuple(row[3:])
+
+
+def _local_date(rows, index):
+    for row in rows:
+        value = row[index]
+        if value is not None:
+            value = timezone.localtime(value).date()
+        yield row[:index] + (value,) + row[index + 1:]
+
+
+def _naive_local(rows, index):
+    """Excel has no time zones, so aware datetimes are written as local wall-clock time."""
+    for row in rows:
+        value = row[index]
+        if value is not None:
+            value = timezone.localtime(value).replace(tzinfo=None)
+        yield row[:index] + (value,) + row[index + 1:]
+
+
+def render_pdf(file_path, name, params, statistics=None, demographic_rows=None, detail_rows=None, on_row=None):
+    """Write a paginated PDF report. Row arguments are iterables of display tuples."""
+    pdf = PDFReportWriter(file_path, f"Report: {name}")
+    pdf.heading(f"Report: {name}", size=16)
+    pdf.line(f"Generated: {timezone.localtime().strftime('%Y-%m-%d %H:%M')}")
+    date_range = f"{params.get('date_range_start') or 'beginning'} to {params.get('date_range_end') or 'today'}"
+    pdf.line(f"Period: {date_range}    Department: {params.get('department') or 'all'}")
+    pdf.spacer()
+
+    if statistics is not None:
+        pdf.heading("Summary Statistics", size=12)
+        pdf.line(f"Total patients: {statistics['total']}")
+        if statistics['average_age'] is not None:
+            pdf.line(
+                f"Age: average {statistics['average_age']:.1f}, "
+                f"youngest {statistics['youngest']}, oldest {statistics['oldest']}"
+            )
+        pdf.spacer(6)
+        pdf.table([('Gender', 3), ('Patients', 1)], statistics['by_gender'])
+        pdf.table([('Category', 3), ('Patients', 1)], statistics['by_category'])
+
+    if demographic_rows is not None:
+        pdf.heading("Patient Demographics", size=12)
+        pdf.table(DEMOGRAPHIC_COLUMNS, demographic_rows, on_row=on_row)
+
+    if detail_rows is not None:
+        pdf.heading("Detailed Patient Records", size=12)
+        pdf.table(DETAIL_COLUMNS, detail_rows, on_row=on_row)
+
+    pdf.save()
+    return pdf.page_number
+
+
+def _generate_pdf(file_path, name, patients, params, progress):
+    sections = [params.get('include_demographics'), params.get('include_detailed_records')]
+    tracker = Progress(progress, patients.count() * sum(1 for included in sections if included))
+
+    demographic_rows = detail_rows = None
+    if params.get('include_demographics'):
+        demographic_rows = _with_full_name(iter_patient_rows(patients, DEMOGRAPHIC_FIELDS))
+    if params.get('include_detailed_records'):
+        detail_rows = _local_date(
+            _with_full_name(iter_patient_rows(patients, DETAIL_FIELDS)), len(DETAIL_COLUMNS) - 1
+        )
+    statistics = patient_statistics(patients) if params.get('include_statistics') else None
+
+    pages = render_pdf(file_path, name, params, statistics, demographic_rows, detail_rows, on_row=tracker.step)
+    logger.debug(f"Rendered {pages} PDF page(s) for report '{name}'")
+
+
+def _generate_xlsx(file_path, name, patients, params, progress):
+    appointments = appointments_for(patients)
+    diagnostics = diagnostics_for(patients)
+    tracker = Progress(progress, patients.count() + appointments.count() + diagnostics.count())
+
+    patient_rows = _naive_local(iter_patient_rows(patients, PATIENT_SHEET_FIELDS), len(PATIENT_SHEET_FIELDS) - 1)
+    render_xlsx(file_path, [
+        ('Patients', PATIENT_SHEET_HEADERS, _track_rows(patient_rows, tracker)),
+        ('Appointments', APPOINTMENT_SHEET_HEADERS,
+         _track_rows(iter_rows(appointments, APPOINTMENT_SHEET_FIELDS), tracker)),
+        ('Diagnostics', DIAGNOSTIC_SHEET_HEADERS,
+         _track_rows(iter_rows(diagnostics, DIAGNOSTIC_SHEET_FIELDS), tracker)),
+    ])
+
+
+def report_file_name(name, extension):
+    """Timestamped file name for a report; `name` is user input, so keep only safe characters."""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    stem = re.sub(r'[^\w.-]', '', name.strip().replace(' ', '_')).lstrip('.') or 'report'
+    return f"{stem}_{timestamp}.{extension}"
+
+
+def reserve_report_path(name, extension):
+    """Create an empty, uniquely named file in MEDIA_ROOT/reports and return (relative, absolute) paths.
+
+    Names only have one-second resolution, so parallel workers (or cache hits)
+    for the same report name would otherwise overwrite each other's files.
+    """
+    base_path = os.path.join(settings.MEDIA_ROOT, 'reports')
+    os.makedirs(base_path, exist_ok=True)
+    stem, extension = report_file_name(name, extension).rsplit('.', 1)
+    for attempt in itertools.count():
+        file_name = f"{stem}_{attempt}.{extension}" if attempt else f"{stem}.{extension}"
+        file_path = os.path.join(base_path, file_name)
+        try:
+            os.close(os.open(file_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            continue
+        return f"reports/{file_name}", file_path
+
+
+def generate_file(name, file_format, patients, params, progress=None):
+    """Render a report to MEDIA_ROOT/reports and return its storage-relative path."""
+    relative_path, file_path = reserve_report_path(name, FILE_EXTENSIONS[file_format])
+
+    if file_format == 'pdf':
+        _generate_pdf(file_path, name, patients, params, progress)
+    elif file_format == 'excel':
+        _generate_xlsx(file_path, name, patients, params, progress)
+    elif file_format == 'csv':
+        tracker = Progress(progress, patients.count())
+        fields = [field for field, _ in PATIENT_COLUMNS]
+        with open(file_path, 'w', newline='') as f:
+            f.writelines(csv_stream(
+                _track_rows(iter_patient_rows(patients, fields), tracker),
+                [header for _, header in PATIENT_COLUMNS],
+            ))
+
+    logger.debug(f"Generated report file: {file_path}")
+    return relative_path
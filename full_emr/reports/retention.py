@@ -0,0 +1,116 @@
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import Report
+
+logger = logging.getLogger(__name__)
+
+REPORTS_DIR = 'reports'
+
+
+def new_stats():
+    return {'expired_rows': 0, 'missing_file_rows': 0, 'orphan_files': 0, 'bytes_reclaimed': 0}
+
+
+def _file_size(name):
+    try:
+        return os.path.getsize(os.path.join(settings.MEDIA_ROOT, name))
+    except OSError:
+        return 0
+
+
+def _batches(queryset, batch_size):
+    """Yield lists of (id, file_path) in id order, one keyset page at a time."""
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', 'file_path')[:batch_size])
+        if not batch:
+            return
+        last_id = batch[-1][0]
+        yield batch
+
+
+def _delete_rows(batch, dry_run):
+    # post_delete on Report removes each file after the commit.
+    if not dry_run:
+        Report.objects.filter(id__in=[report_id for report_id, _ in batch]).delete()
+
+
+def purge_expired(stats, batch_size=500, dry_run=False, now=None):
+    """Delete reports older than their format's REPORT_RETENTION_DAYS."""
+    now = now or timezone.now()
+    for file_format, days in settings.REPORT_RETENTION_DAYS.items():
+        if not days:
+            continue
+        expired = Report.objects.filter(format=file_format, generated_date__lt=now - timedelta(days=days))
+        for batch in _batches(expired, batch_size):
+            stats['expired_rows'] += len(batch)
+            stats['bytes_reclaimed'] += sum(_file_size(name) for _, name in batch)
+            _delete_rows(batch, dry_run)
+
+
+def purge_missing_files(stats, batch_size=500, dry_run=False):
+    """Delete Report rows whose file is gone, so they stop appearing in listings and exports."""
+    for batch in _batches(Report.objects.all(), batch_size):
+        missing = [
+            (report_id, name) for report_id, name in batch
+            if not name or not os.path.isfile(os.path.join(settings.MEDIA_ROOT, name))
+        ]
+        stats['missing_file_rows'] += len(missing)
+        if missing:
+            _delete_rows(missing, dry_run)
+
+
+def purge_orphan_files(stats, batch_size=500, dry_run=False, grace=timedelta(hours=1)):
+    """Delete files in MEDIA_ROOT/reports that no Report row points at.
+
+    Files younger than `grace` are left alone: a worker writes the file
+    before it creates the Report row.
+    """
+    directory = os.path.join(settings.MEDIA_ROOT, REPORTS_DIR)
+    if not os.path.isdir(directory):
+        return
+    cutoff = (timezone.now() - grace).timestamp()
+
+    def check(entries):
+        names = {f"{REPORTS_DIR}/{entry.name}": entry for entry in entries}
+        referenced = set(Report.objects.filter(file_path__in=names).values_list('file_path', flat=True))
+        for name, entry in names.items():
+            if name in referenced:
+                continue
+            stats['orphan_files'] += 1
+            stats['bytes_reclaimed'] += entry.stat().st_size
+            if not dry_run:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    with os.scandir(directory) as entries:
+        pending = []
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False) or entry.stat().st_mtime >= cutoff:
+                continue
+            pending.append(entry)
+            if len(pending) >= batch_size:
+                check(pending)
+                pending = []
+        if pending:
+            check(pending)
+
+
+def purge_reports(batch_size=500, dry_run=False, grace=timedelta(hours=1)):
+    stats = new_stats()
+    purge_expired(stats, batch_size, dry_run)
+    purge_missing_files(stats, batch_size, dry_run)
+    purge_orphan_files(stats, batch_size, dry_run, grace)
+    logger.info(
+        f"{'Would purge' if dry_run else 'Purged'} {stats['expired_rows']} expired reports, "
+        f"{stats['missing_file_rows']} rows without files, {stats['orphan_files']} orphan files "
+        f"({stats['bytes_reclaimed']} bytes)"
+    )
+    return stats
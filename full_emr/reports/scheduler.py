@@ -0,0 +1,71 @@
+import logging
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..mailing import SCHEDULED_REPORT_BODY, SCHEDULED_REPORT_SUBJECT, render_email
+from ..models import OutboxEmail, ReportSchedule
+from .cron import CronSchedule
+from .jobs import enqueue_report, reuse_cached_report
+
+logger = logging.getLogger(__name__)
+
+
+def next_run(cron_expression, after=None):
+    """Next firing time after `after` (default now), evaluated in the local TIME_ZONE."""
+    return CronSchedule(cron_expression).next_after(timezone.localtime(after or timezone.now()))
+
+
+def in_off_peak_window(moment=None, window=None):
+    window = settings.REPORT_SCHEDULER_WINDOW if window is None else window
+    if not window:
+        return True
+    start_text, end_text = window.split('-')
+    start = datetime.strptime(start_text.strip(), '%H:%M').time()
+    end = datetime.strptime(end_text.strip(), '%H:%M').time()
+    now = timezone.localtime(moment or timezone.now()).time()
+    if start <= end:
+        return start <= now < end
+    return now >= start or now < end  # the window wraps midnight
+
+
+def enqueue_due_schedules(now=None):
+    """Queue a report for every active schedule that has fallen due. Returns the jobs created.
+
+    Outside the off-peak window nothing is queued; due schedules keep their
+    past next_run_at and fire as soon as the window opens.
+    """
+    now = now or timezone.now()
+    if not in_off_peak_window(now):
+        return []
+
+    jobs = []
+    due = ReportSchedule.objects.filter(is_active=True, next_run_at__lte=now).select_related('created_by', 'last_job')
+    for schedule in due:
+        # Advancing next_run_at conditionally is the lock against a second scheduler process.
+        claimed = ReportSchedule.objects.filter(pk=schedule.pk, next_run_at=schedule.next_run_at).update(
+            next_run_at=next_run(schedule.cron_expression, now), last_run_at=now
+        )
+        if not claimed:
+            continue
+        if schedule.last_job and schedule.last_job.status in ('queued', 'running'):
+            logger.warning(f"Schedule {schedule.id} skipped: job {schedule.last_job.id} has not finished")
+            continue
+
+        # Unchanged data since the last run means the cached file is sent again without rendering.
+        job = (reuse_cached_report(schedule.created_by, schedule.parameters)
+               or enqueue_report(schedule.created_by, schedule.parameters))
+        ReportSchedule.objects.filter(pk=schedule.pk).update(last_job=job)
+        if schedule.recipients:
+            context = {'schedule': schedule, 'generated': timezone.localtime(now)}
+            OutboxEmail.objects.create(
+                recipients=schedule.recipients,
+                subject=render_email(SCHEDULED_REPORT_SUBJECT, **context),
+                body=render_email(SCHEDULED_REPORT_BODY, **context),
+                report_job=job,
+                status='waiting',
+            )
+        logger.info(f"Schedule {schedule.id} queued report job {job.id}")
+        jobs.append(job)
+    return jobs
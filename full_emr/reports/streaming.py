@@ -0,0 +1,60 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+BUFFER_SIZE = 64 * 1024  # bytes of text per chunk handed to the WSGI server
+
+
+class Echo:
+    """File-like object whose write() hands the formatted line straight back."""
+
+    def write(self, value):
+        return value
+
+
+def buffered(lines, size=BUFFER_SIZE, first_alone=False):
+    """Join small strings into ~`size` chunks so each write to the socket is worthwhile.
+
+    With first_alone the first string is sent by itself, so the client gets its
+    first byte as soon as it exists rather than after a full chunk.
+    """
+    lines = iter(lines)
+    if first_alone:
+        for line in lines:
+            yield line
+            break
+    parts, length = [], 0
+    for line in lines:
+        parts.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(parts)
+            parts, length = [], 0
+    if parts:
+        yield ''.join(parts)
+
+
+def csv_stream(rows, headers):
+    writer = csv.writer(Echo())
+    # The header goes out on its own so the client gets its first byte before the query returns.
+    yield writer.writerow(headers)
+    yield from buffered(writer.writerow(row) for row in rows)
+
+
+def ndjson_stream(rows, fields):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    # The first record goes out on its own, like the CSV header.
+    yield from buffered((encoder.encode(dict(zip(fields, row))) + '\n' for row in rows), first_alone=True)
+
+
+def json_array_stream(objects):
+    """Encode `objects` as a single JSON array, one element at a time."""
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+
+    def elements():
+        yield '['
+        for index, obj in enumerate(objects):
+            yield (',' if index else '') + encoder.encode(obj)
+        yield ']'
+
+    return buffered(elements(), first_alone=True)
@@ -0,0 +1,65 @@
+import os
+import zipfile
+
+CHUNK_SIZE = 64 * 1024
+
+# Formats that are already deflate-compressed; deflating them again costs CPU for no gain.
+STORED_EXTENSIONS = {'.pdf', '.xlsx', '.zip', '.png', '.jpg', '.jpeg', '.gif', '.webp'}
+
+
+class _Sink:
+    """Write-only, unseekable target for ZipFile that hands bytes back to the generator.
+
+    Because it has no tell()/seek(), zipfile switches to streaming mode and writes
+    sizes and CRCs in data descriptors after each entry instead of seeking back.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        if self._chunks:
+            data = b''.join(self._chunks)
+            self._chunks = []
+            yield data
+
+
+def zip_stream(entries, chunk_size=CHUNK_SIZE):
+    """Yield a ZIP archive of `entries` ([(path, arcname), ...]) one chunk at a time."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+        for path, arcname in entries:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            extension = os.path.splitext(arcname)[1].lower()
+            info.compress_type = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+            force_zip64 = info.file_size > zipfile.ZIP64_LIMIT
+            with open(path, 'rb') as src, archive.open(info, 'w', force_zip64=force_zip64) as dest:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    # Closing the archive writes the central directory.
+    yield from sink.drain()
+
+
+def unique_arcnames(paths):
+    """Pair each path with its basename, suffixing duplicates so no entry is shadowed."""
+    seen = set()
+    for path in paths:
+        stem, extension = os.path.splitext(os.path.basename(path))
+        arcname, n = f"{stem}{extension}", 1
+        while arcname in seen:
+            n += 1
+            arcname = f"{stem}_{n}{extension}"
+        seen.add(arcname)
+        yield path, arcname
@@ -0,0 +1,172 @@
+"""Revocation of JWTs.
+
+Two mechanisms, both cheap on the request path:
+
+* A single token (logout, a rotated refresh token) gets a RevokedToken row.
+  Every process keeps a Bloom filter of revoked JTIs, synced from that table
+  every TOKEN_REVOCATION_SYNC_SECONDS. A JTI not in the filter is certainly
+  not revoked; only filter hits (real or false positive) query the table.
+* All of a user's tokens (logout everywhere, password reset) are revoked by
+  setting User.tokens_valid_after. It is part of the cached slim user row, so
+  checking it costs nothing, and the sync drops cached rows of users whose
+  timestamp changed so other processes see it within a sync interval.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken, User
+
+logger = logging.getLogger(__name__)
+
+# Rows are read back from slightly before the previous sync, so a transaction that
+# committed late (with an earlier created_at) is still picked up.
+SYNC_OVERLAP = timedelta(seconds=30)
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest.
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    """Process-local view of RevokedToken, refreshed lazily on lookup."""
+
+    def __init__(self, capacity, error_rate, sync_interval, rebuild_interval):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self._filter = None
+        self._synced_at = 0.0  # monotonic
+        self._built_at = 0.0
+        self._synced_since = None  # wall clock of the last successful sync
+        self._lock = threading.Lock()
+
+    def _rebuild(self):
+        # Starting over drops expired JTIs and resizes the filter for the current number of revocations.
+        live = RevokedToken.objects.filter(expires_at__gt=timezone.now())
+        bloom = BloomFilter(max(self.capacity, live.count() * 2), self.error_rate)
+        for jti in live.values_list('jti', flat=True).iterator(chunk_size=5000):
+            bloom.add(jti)
+        self._filter = bloom
+        self._built_at = time.monotonic()
+        logger.debug(f"Rebuilt token revocation filter with {bloom.count} JTIs")
+
+    def _sync(self):
+        from .authentication import user_cache
+
+        now = timezone.now()
+        since = self._synced_since
+        if since is None or time.monotonic() - self._built_at > self.rebuild_interval \
+                or self._filter.count > self._filter.capacity:
+            self._rebuild()
+        else:
+            recent = RevokedToken.objects.filter(created_at__gte=since - SYNC_OVERLAP).values_list('jti', flat=True)
+            for jti in recent:
+                if jti not in self._filter:
+                    self._filter.add(jti)
+        if since is not None:
+            changed = User.objects.filter(tokens_valid_after__gte=since - SYNC_OVERLAP).values_list('id', flat=True)
+            for user_id in changed:
+                user_cache.invalidate(user_id)
+        self._synced_since = now
+        self._synced_at = time.monotonic()
+
+    def refresh(self, force=False):
+        if not force and time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        with self._lock:
+            if force or time.monotonic() - self._synced_at >= self.sync_interval:
+                self._sync()
+
+    def add(self, jti):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+
+    def is_revoked(self, jti):
+        self.refresh()
+        if jti in self._filter:
+            return RevokedToken.objects.filter(jti=jti).exists()
+        return False
+
+    def reset(self):
+        with self._lock:
+            self._filter = None
+            self._synced_at = self._built_at = 0.0
+            self._synced_since = None
+
+
+revocation_list = RevocationList(
+    settings.TOKEN_REVOCATION_CAPACITY,
+    settings.TOKEN_REVOCATION_ERROR_RATE,
+    settings.TOKEN_REVOCATION_SYNC_SECONDS,
+    settings.TOKEN_REVOCATION_REBUILD_SECONDS,
+)
+
+
+def is_token_revoked(token, user):
+    """True if `token` was revoked on its own or by a revoke-all on `user`."""
+    valid_after = user.tokens_valid_after
+    # iat has whole-second precision and tokens_valid_after is stored floored to the second, so a token
+    # issued in the second of the revocation (e.g. the login right after a password reset) stays valid.
+    if valid_after is not None and token.get('iat', 0) < int(valid_after.timestamp()):
+        return True
+    jti = token.get(api_settings.JTI_CLAIM)
+    return jti is not None and revocation_list.is_revoked(jti)
+
+
+def revoke_token(token):
+    """Revoke one access or refresh token until it expires."""
+    jti = token.get(api_settings.JTI_CLAIM)
+    if not jti:
+        return
+    RevokedToken.objects.bulk_create([RevokedToken(
+        jti=jti,
+        user_id=token.get(api_settings.USER_ID_CLAIM),
+        token_type=token.get(api_settings.TOKEN_TYPE_CLAIM, ''),
+        expires_at=datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc),
+    )], ignore_conflicts=True)
+    revocation_list.add(jti)
+
+
+def revoke_user_tokens(user, save=True):
+    """Revoke every token issued to `user` so far. With save=False the caller saves the user."""
+    user.tokens_valid_after = timezone.now().replace(microsecond=0)
+    if save:
+        # post_save clears this process's cached row; other processes pick it up on their next sync.
+        user.save(update_fields=['tokens_valid_after'])
+    logger.info(f"Revoked all tokens for user {user.pk}")
+
+
+def purge_revoked_tokens():
+    """Delete rows for tokens that have expired anyway. Returns the number deleted."""
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -1,21 +1,85 @@
 import re
 from datetime import timedelta
 import logging
+from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth import get_user_model, authenticate
 from django.contrib.auth.password_validation import validate_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.template import TemplateSyntaxError
+from django.urls import reverse
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from .models import User, AddPatients, Report, Appointment, Invitation, Diagnostic, LabReport, SocialHistory, \
     FamilyHistory, Immunization, Allergy, VitalSigns, MedicalHistory, SupportRequest, SupportResponse, FeedbackResponse, \
-    Feedback, HealthCampaign, EducationalResource, OTP
+    Feedback, HealthCampaign, EducationalResource, CampaignMailing, ReportJob, ReportSchedule
+from .mailing import compile_template
+from .otp import otp_store
+from .profile_images import ProfileImage, ProfileImageError, decode_base64_image, open_profile_image, \
+    profile_image_variants
+from .revocation import is_token_revoked, revoke_token
+from .reports.cohort import CohortError, compile_cohort
+from .reports.cron import CronError, CronSchedule
+from .reports.queries import REPORT_DATA_FIELDS, serialize_report_params
 
 logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
-class CreateAccountSerializer(serializers.ModelSerializer):
-    profile_image = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+class ProfileImageField(serializers.Field):
+    """Accepts a base64 image (optionally a data URL) and yields its URL once saved.
+
+    Sending back a stored image URL (the value the client read) keeps the
+    current image. Files are written by ProfileImageSaveMixin.save, so a request
+    that fails validation leaves nothing on disk.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('required', False)
+        kwargs.setdefault('allow_null', True)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if not data:
+            return None
+        if not isinstance(data, str):
+            raise serializers.ValidationError("Profile image must be a base64-encoded string.")
+        current = getattr(self.parent.instance, 'profile_image', None) if self.parent else None
+        if data == current or data.startswith(settings.MEDIA_URL):
+            raise serializers.SkipField()
+        try:
+            return open_profile_image(decode_base64_image(data))
+        except ProfileImageError as e:
+            raise serializers.ValidationError(str(e))
+
+    def to_representation(self, value):
+        return value
+
+
+class ProfileImageSaveMixin:
+    """Writes a validated ProfileImageField upload to storage when the serializer is saved."""
+
+    def save(self, **kwargs):
+        image = self.validated_data.get('profile_image')
+        if isinstance(image, ProfileImage):
+            kwargs['profile_image'] = image.save()
+        return super().save(**kwargs)
+
+# Account fields that must be unique, with the error shown when a value is taken.
+UNIQUE_ACCOUNT_FIELDS = {
+    'email': "Email is already registered.",
+    'username': "Username already taken.",
+    'phone_number': "Phone number already registered.",
+}
+
+
+class CreateAccountSerializer(ProfileImageSaveMixin, serializers.ModelSerializer):
+    profile_image = ProfileImageField()
     password = serializers.CharField(
         write_only=True,
         required=True,
@@ -34,27 +98,16 @@ class CreateAccountSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'first_name': {'required': True},
             'last_name': {'required': True},
-            'email': {'required': True},
-            'username': {'required': True},
-            'phone_number': {'required': True},
+            # Uniqueness is checked in validate() with one query instead of a UniqueValidator per field.
+            'email': {'required': True, 'validators': []},
+            'username': {'required': True, 'validators': [UnicodeUsernameValidator()]},
+            'phone_number': {'required': True, 'validators': []},
             'role': {'required': True},
         }
 
-    def validate_email(self, value):
-        if User.objects.filter(email=value).exists():
-            raise serializers.ValidationError("Email is already registered.")
-        return value
-
-    def validate_username(self, value):
-        if User.objects.filter(username=value).exists():
-            raise serializers.ValidationError("Username already taken.")
-        return value
-
     def validate_phone_number(self, value):
         if not re.match(r'^\d{7,15}$', value):
             raise serializers.ValidationError("Enter a valid phone number (7–15 digits).")
-        if User.objects.filter(phone_number=value).exists():
-            raise serializers.ValidationError("Phone number already registered.")
         return value
 
     def validate_license_number(self, value):
@@ -66,11 +119,37 @@ class CreateAccountSerializer(serializers.ModelSerializer):
     def validate(self, data):
         if data['password'] != data['password2']:
             raise serializers.ValidationError({"password": "Passwords don't match."})
+        errors = self.duplicate_errors(data)
+        if errors:
+            raise serializers.ValidationError(errors)
         return data
 
+    @staticmethod
+    def duplicate_errors(data):
+        """Field errors for email, username and phone number already in use, found with one query."""
+        values = {field: data.get(field) for field in UNIQUE_ACCOUNT_FIELDS}
+        # Each field is unique, so at most one row matches per field.
+        rows = User.objects.filter(
+            Q(email=values['email']) | Q(username=values['username']) | Q(phone_number=values['phone_number'])
+        ).values_list(*UNIQUE_ACCOUNT_FIELDS)[:len(UNIQUE_ACCOUNT_FIELDS)]
+        errors = {}
+        for row in rows:
+            for field, taken in zip(UNIQUE_ACCOUNT_FIELDS, row):
+                if taken == values[field]:
+                    errors[field] = [UNIQUE_ACCOUNT_FIELDS[field]]
+        return errors
+
     def create(self, validated_data):
         validated_data.pop('password2')
-        user = User.objects.create_user(**validated_data)
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(**validated_data)
+        except IntegrityError:
+            # A concurrent signup took a value between validation and insert.
+            errors = self.duplicate_errors(validated_data)
+            if not errors:
+                raise
+            raise serializers.ValidationError(errors)
         logger.info(f"User created: {user.email} (ID: {user.id})")
         return user
 
@@ -120,6 +199,39 @@ class LoginSerializer(serializers.Serializer):
         }
 
 
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses revoked refresh tokens and revokes the old one when rotating."""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        try:
+            user = User.objects.only('id', 'tokens_valid_after').get(pk=refresh.get(api_settings.USER_ID_CLAIM))
+        except (User.DoesNotExist, TypeError, ValueError):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        if is_token_revoked(refresh, user):
+            raise AuthenticationFailed("Token has been revoked", 'token_revoked')
+
+        # The parent rotates its own copy of the token; `refresh` keeps the old jti.
+        data = super().validate(attrs)
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION:
+            revoke_token(refresh)
+        return data
+
+
+class LogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField(required=False)
+    all_devices = serializers.BooleanField(default=False)
+
+    def validate_refresh(self, value):
+        try:
+            token = RefreshToken(value)
+        except TokenError:
+            raise serializers.ValidationError("Invalid or expired refresh token.")
+        if str(token.get(api_settings.USER_ID_CLAIM)) != str(self.context['request'].user.pk):
+            raise serializers.ValidationError("Refresh token belongs to another user.")
+        return token
+
+
 class ForgotPasswordSerializer(serializers.Serializer):
     email = serializers.EmailField(required=True)
 
@@ -132,55 +244,31 @@ class ForgotPasswordSerializer(serializers.Serializer):
 class VerifyOTPSerializer(serializers.Serializer):
     email = serializers.EmailField(required=True)
     otp_code = serializers.CharField(max_length=6, required=True)
+    # Checking a code leaves it valid for the reset that follows; the reset uses it up.
+    consume_otp = False
 
     def validate(self, data):
-        email = data.get('email')
-        otp_code = data.get('otp_code')
-
         try:
-            user = User.objects.get(email=email)
-            otp = OTP.objects.filter(
-                user=user,
-                otp_code=otp_code,
-                purpose='password_reset',
-                is_used=False
-            ).first()
-
-            if not otp or not otp.is_valid():
-                raise serializers.ValidationError("Invalid or expired OTP.")
-
-            data['user'] = user
-            data['otp'] = otp
-
+            user = User.objects.get(email=data.get('email'))
         except User.DoesNotExist:
             raise serializers.ValidationError("User not found.")
 
+        if not otp_store.verify(user, 'password_reset', data.get('otp_code'), consume=self.consume_otp):
+            raise serializers.ValidationError("Invalid or expired OTP.")
+
+        data['user'] = user
         return data
 
 
-class ResetPasswordSerializer(serializers.Serializer):
-    email = serializers.EmailField(required=True)
-    otp_code = serializers.CharField(max_length=6, required=True)
+class ResetPasswordSerializer(VerifyOTPSerializer):
     new_password = serializers.CharField(required=True, write_only=True)
     confirm_password = serializers.CharField(required=True, write_only=True)
+    consume_otp = True
 
     def validate(self, data):
         if data['new_password'] != data['confirm_password']:
             raise serializers.ValidationError("Passwords don't match.")
-
-        # Verify OTP first
-        otp_serializer = VerifyOTPSerializer(data={
-            'email': data['email'],
-            'otp_code': data['otp_code']
-        })
-
-        if not otp_serializer.is_valid():
-            raise serializers.ValidationError(otp_serializer.errors)
-
-        data['user'] = otp_serializer.validated_data['user']
-        data['otp'] = otp_serializer.validated_data['otp']
-
-        return data
+        return super().validate(data)
 
 
 class AddPatientSerializer(serializers.ModelSerializer):
@@ -239,14 +327,25 @@ class AddPatientSerializer(serializers.ModelSerializer):
         logger.info(f"Patient created: {patient.first_name} {patient.last_name} (ID: {patient.id})")
         return patient
 
+def checked_file_url(serializer, view_name, pk):
+    """URL of the view that checks access before serving a protected file; absolute when a request is known."""
+    url = reverse(view_name, kwargs={'pk': pk})
+    request = serializer.context.get('request')
+    return request.build_absolute_uri(url) if request else url
+
 class ReportSerializer(serializers.ModelSerializer):
     generated_by = serializers.StringRelatedField()
+    # reports/ is not served from MEDIA_URL, so hand out the owner-checked download view instead.
+    file_path = serializers.SerializerMethodField()
 
     class Meta:
         model = Report
         fields = ['id', 'name', 'generated_by', 'generated_date', 'file_path', 'format']
         read_only_fields = ['id', 'generated_by', 'generated_date']
 
+    def get_file_path(self, obj):
+        return checked_file_url(self, 'view-report', obj.pk) if obj.file_path else None
+
 class GenerateReportSerializer(serializers.Serializer):
     name = serializers.CharField(max_length=100, required=True)
     date_range_start = serializers.DateField(required=False, allow_null=True)
@@ -256,6 +355,103 @@ class GenerateReportSerializer(serializers.Serializer):
     include_demographics = serializers.BooleanField(default=True)
     include_statistics = serializers.BooleanField(default=True)
     include_detailed_records = serializers.BooleanField(default=False)
+    cohort = serializers.JSONField(required=False, allow_null=True)
+
+    def validate_cohort(self, value):
+        return validate_cohort_spec(value)
+
+def validate_cohort_spec(value):
+    if value:
+        try:
+            compile_cohort(value)
+        except CohortError as e:
+            raise serializers.ValidationError(str(e))
+    return value or None
+
+class CohortSerializer(serializers.Serializer):
+    cohort = serializers.JSONField()
+
+    def validate_cohort(self, value):
+        if not value:
+            raise serializers.ValidationError("A cohort is required")
+        return validate_cohort_spec(value)
+
+class GenerateReportBatchSerializer(serializers.Serializer):
+    # One report per (department, format); every department when none are given.
+    name = serializers.CharField(max_length=80, required=True)
+    date_range_start = serializers.DateField(required=False, allow_null=True)
+    date_range_end = serializers.DateField(required=False, allow_null=True)
+    departments = serializers.ListField(
+        child=serializers.ChoiceField(choices=AddPatients.CATEGORY_CHOICES), required=False, allow_empty=False
+    )
+    formats = serializers.ListField(
+        child=serializers.ChoiceField(choices=['pdf', 'excel']), required=False, allow_empty=False
+    )
+    include_demographics = serializers.BooleanField(default=True)
+    include_statistics = serializers.BooleanField(default=True)
+    include_detailed_records = serializers.BooleanField(default=False)
+    cohort = serializers.JSONField(required=False, allow_null=True)
+
+    def validate_cohort(self, value):
+        return validate_cohort_spec(value)
+
+class ReportExportSerializer(serializers.Serializer):
+    # Named export_format because DRF reserves ?format= for renderer selection.
+    name = serializers.CharField(max_length=100, required=False, default='Patient Export')
+    date_range_start = serializers.DateField(required=False, allow_null=True)
+    date_range_end = serializers.DateField(required=False, allow_null=True)
+    department = serializers.CharField(max_length=50, required=False, default='all')
+    export_format = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+
+class ReportDataQuerySerializer(serializers.Serializer):
+    after = serializers.IntegerField(min_value=0, required=False, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, required=False, default=100)
+    fields = serializers.CharField(required=False, allow_blank=True)
+    stream = serializers.BooleanField(required=False, default=False)
+
+    def validate_fields(self, value):
+        fields = [field.strip() for field in value.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in REPORT_DATA_FIELDS]
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unknown field(s): {', '.join(unknown)}. Choose from: {', '.join(REPORT_DATA_FIELDS)}"
+            )
+        return fields or REPORT_DATA_FIELDS
+
+    def validate(self, data):
+        data.setdefault('fields', REPORT_DATA_FIELDS)
+        return data
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    report = ReportSerializer(read_only=True)
+
+    class Meta:
+        model = ReportJob
+        fields = ['id', 'status', 'progress', 'parameters', 'report', 'error', 'created_at', 'started_at',
+                  'finished_at']
+        read_only_fields = fields
+
+class ReportScheduleSerializer(serializers.ModelSerializer):
+    recipients = serializers.ListField(child=serializers.EmailField(), required=False, default=list)
+
+    class Meta:
+        model = ReportSchedule
+        fields = ['id', 'name', 'cron_expression', 'parameters', 'recipients', 'is_active', 'next_run_at',
+                  'last_run_at', 'last_job', 'created_at']
+        read_only_fields = ['id', 'next_run_at', 'last_run_at', 'last_job', 'created_at']
+
+    def validate_cron_expression(self, value):
+        try:
+            CronSchedule(value).next_after(timezone.now())
+        except CronError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
+    def validate_parameters(self, value):
+        report = GenerateReportSerializer(data=value)
+        if not report.is_valid():
+            raise serializers.ValidationError(report.errors)
+        return serialize_report_params(report.validated_data)
 
 class AppointmentSerializer(serializers.ModelSerializer):
     patient = AddPatientSerializer(read_only=True)
@@ -365,20 +561,20 @@ class DiagnosticSerializer(serializers.ModelSerializer):
     def get_created_by_name(self, obj):
         return obj.created_by.username if obj.created_by else 'Unknown'
 
-class UserProfileSerializer(serializers.ModelSerializer):
-    profile_image = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+class UserProfileSerializer(ProfileImageSaveMixin, serializers.ModelSerializer):
+    profile_image = ProfileImageField()
+    profile_image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = User
         fields = [
             'id', 'username', 'email', 'first_name', 'last_name', 'role',
-            'speciality', 'phone_number', 'license_number', 'profile_image'
+            'speciality', 'phone_number', 'license_number', 'profile_image', 'profile_image_variants'
         ]
         read_only_fields = ['id', 'username', 'role']
 
-        def validate_profile_image(self, value):
-            if value and len(value) > 2 * 1024 * 1024:  # ~2MB limit for base64
-                raise serializers.ValidationError("Image is too large. Maximum size is 2MB.")
-            return value
+    def get_profile_image_variants(self, obj):
+        return profile_image_variants(obj.profile_image)
 
 class LabReportSerializer(serializers.ModelSerializer):
     patient_name = serializers.SerializerMethodField()
@@ -401,6 +597,8 @@ class LabReportSerializer(serializers.ModelSerializer):
             'id', 'patient_name', 'created_by', 'created_at',
             'updated_at', 'file_url', 'created_by_name'
         ]
+        # The stored path is under the protected lab_reports/ prefix; clients download through file_url.
+        extra_kwargs = {'file': {'write_only': True}}
 
     def get_patient_name(self, obj):
         return f"{obj.patient.first_name} {obj.patient.last_name}"
@@ -409,9 +607,7 @@ class LabReportSerializer(serializers.ModelSerializer):
         return obj.created_by.get_full_name() if obj.created_by else 'Unknown'
 
     def get_file_url(self, obj):
-        if obj.file and hasattr(obj.file, 'url'):
-            return obj.file.url
-        return None
+        return checked_file_url(self, 'lab-report-file', obj.pk) if obj.file else None
 
 
 class MedicalHistorySerializer(serializers.ModelSerializer):
@@ -482,6 +678,31 @@ class HealthCampaignSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at', 'created_by_name']
 
 
+class CampaignMailingSerializer(serializers.ModelSerializer):
+    subject = serializers.CharField(max_length=200, required=False)
+    body = serializers.CharField(required=False)
+
+    class Meta:
+        model = CampaignMailing
+        fields = [
+            'id', 'campaign', 'subject', 'body', 'status', 'last_patient_id', 'sent_count', 'failed_count',
+            'last_error', 'created_at', 'started_at', 'completed_at'
+        ]
+        read_only_fields = [
+            'id', 'campaign', 'status', 'last_patient_id', 'sent_count', 'failed_count', 'last_error',
+            'created_at', 'started_at', 'completed_at'
+        ]
+
+    def validate(self, data):
+        for field in ('subject', 'body'):
+            if field in data:
+                try:
+                    compile_template(data[field])
+                except TemplateSyntaxError as e:
+                    raise serializers.ValidationError({field: f"Invalid template: {e}"})
+        return data
+
+
 class EducationalResourceSerializer(serializers.ModelSerializer):
     author_name = serializers.CharField(source='author.get_full_name', read_only=True)
     file_url = serializers.SerializerMethodField()
@@ -0,0 +1,44 @@
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import user_cache
+from .models import Report, User
+from .reports.cache import WATERMARK_MODELS, invalidate_watermark
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_delete, sender=Report)
+def delete_report_file(sender, instance, **kwargs):
+    """Remove a report's file once the row deleting it has been committed."""
+    if not instance.file_path:
+        return
+    storage, name = instance.file_path.storage, instance.file_path.name
+
+    def remove():
+        try:
+            storage.delete(name)
+        except OSError as e:
+            logger.warning(f"Could not delete report file {name}: {e}")
+
+    transaction.on_commit(remove)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Covers profile edits, password changes (set_password + save) and deactivation.
+    user_cache.invalidate(instance.pk)
+
+
+def reset_report_watermark(sender, **kwargs):
+    invalidate_watermark()
+
+
+for model in WATERMARK_MODELS:
+    post_save.connect(reset_report_watermark, sender=model, dispatch_uid=f"report_watermark_save_{model._meta.label}")
+    post_delete.connect(reset_report_watermark, sender=model,
+                        dispatch_uid=f"report_watermark_delete_{model._meta.label}")
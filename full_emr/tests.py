@@ -1,3 +1,313 @@
-from django.test import TestCase
+import base64
+import os
+import tempfile
+from datetime import date, timedelta
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from . import ratelimit
+from .authentication import get_cached_user
+from .file_delivery import serve_media
+from .mailing import MailWorker, deliver_outbox, run_mailing
+from .models import AddPatients, CampaignMailing, HealthCampaign, LabReport, OutboxEmail, Report, ReportJob, User
+from .reports import cache as report_cache
+from .reports.cohort import SAMPLE_COHORT, TABLES, explain_clauses
+from .reports.jobs import requeue_stale_jobs
+from .reports.queries import patient_queryset, serialize_report_params
+from .reports.streaming import ndjson_stream
+from .revocation import is_token_revoked, revoke_user_tokens
+from .serializer import LabReportSerializer, ReportSerializer, UserProfileSerializer
+
+
+class CampaignMailingTests(TestCase):
+    def setUp(self):
+        self.creator = User.objects.create_user(
+            username='creator', email='creator@example.com', password='Secret-pass-1', role=User.DOCTOR,
+        )
+        self.campaign = HealthCampaign.objects.create(
+            title='Flu shots', description='Get vaccinated.', category='Prevention', target_audience='All',
+            start_date=date(2026, 1, 1), end_date=date(2026, 2, 1), created_by=self.creator,
+        )
+        self.patients = [
+            AddPatients.objects.create(first_name=f"P{i}", last_name='Test', email=f"p{i}@example.com")
+            for i in range(3)
+        ]
+
+    def mailing(self, body):
+        return CampaignMailing.objects.create(campaign=self.campaign, subject='{{ campaign.title }}', body=body)
+
+    def test_templates_cannot_reach_campaign_relations(self):
+        mailing = self.mailing('Hi {{ patient.first_name }} [{{ campaign.created_by.password }}]')
+        run_mailing(mailing, rate=0)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].subject, 'Flu shots')
+        self.assertEqual(mail.outbox[0].body, 'Hi P0 []')
+
+    def test_failure_part_way_keeps_progress(self):
+        mailing = self.mailing('Hello')
+        with mock.patch.object(MailWorker, 'send', side_effect=[(1, 0), (1, 0), RuntimeError('SMTP down')]):
+            with self.assertRaises(RuntimeError):
+                run_mailing(mailing, rate=0)
+        mailing.refresh_from_db()
+        self.assertEqual(mailing.status, 'failed')
+        self.assertEqual(mailing.last_patient_id, self.patients[1].id)
+        self.assertEqual(mailing.sent_count, 2)
+
+        run_mailing(mailing, rate=0)
+        self.assertEqual([message.to for message in mail.outbox], [['p2@example.com']])
+
+    def test_overlapping_runs_send_each_email_once(self):
+        mailing = self.mailing('Hello')
+        overlapping = []
+        send = MailWorker.send
+
+        def send_and_start_another_run(worker, messages):
+            if not overlapping:
+                # A second run (e.g. send_campaign_mailings --resume) starts while the first is sending.
+                overlapping.append(run_mailing(CampaignMailing.objects.get(pk=mailing.pk), rate=0))
+            return send(worker, messages)
+
+        with mock.patch.object(MailWorker, 'send', autospec=True, side_effect=send_and_start_another_run):
+            run_mailing(mailing, rate=0)
+        self.assertEqual(overlapping, [None])
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['p0@example.com', 'p1@example.com', 'p2@example.com'])
+
+    def test_stale_claim_is_taken_over(self):
+        mailing = self.mailing('Hello')
+        CampaignMailing.objects.filter(pk=mailing.pk).update(
+            status='sending', claim_token='dead', claimed_at=timezone.now() - timedelta(hours=1),
+        )
+        self.assertEqual(run_mailing(mailing, rate=0).sent_count, 3)
+
+
+class ProfileImageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username='pic', email='pic@example.com', password='Secret-pass-1')
+
+    def stored_files(self):
+        return sorted(name for _, _, names in os.walk(self.media_root) for name in names)
+
+    def update(self, profile_image, **fields):
+        serializer = UserProfileSerializer(self.user, data={'profile_image': profile_image, **fields}, partial=True)
+        return serializer, serializer.is_valid() and serializer.save()
+
+    def test_upload_is_written_on_save_and_its_url_can_be_sent_back(self):
+        buffer = BytesIO()
+        Image.new('RGB', (300, 200), 'red').save(buffer, 'PNG')
+        self.update(base64.b64encode(buffer.getvalue()).decode())
+        url = self.user.profile_image
+        self.assertTrue(url.startswith('/media/profile_images/'))
+        self.assertEqual(len(self.stored_files()), 2)
+
+        serializer, _ = self.update(url, first_name='Renamed')
+        self.assertEqual(serializer.errors, {})
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.profile_image, self.user.first_name), (url, 'Renamed'))
+
+    def test_failed_validation_writes_no_files(self):
+        buffer = BytesIO()
+        Image.new('RGB', (10, 10), 'blue').save(buffer, 'PNG')
+        serializer, _ = self.update(base64.b64encode(buffer.getvalue()).decode(), phone_number='x' * 40)
+        self.assertIn('phone_number', serializer.errors)
+        self.assertEqual(self.stored_files(), [])
+
+
+class UserProfileViewTests(TestCase):
+    def test_profile_loads_the_user_row_once(self):
+        user = User.objects.create_user(username='doc', email='doc@example.com', password='Secret-pass-1',
+                                        speciality='Cardiology', phone_number='5550002')
+        client = APIClient()
+        client.force_authenticate(get_cached_user(user.pk))  # slim, as CachedJWTAuthentication builds it
+        with self.assertNumQueries(1):
+            response = client.get('/api/profile/')
+        self.assertEqual((response.data['speciality'], response.data['phone_number']), ('Cardiology', '5550002'))
+
+class TokenRevocationTests(TestCase):
+    def test_revoke_all_spares_tokens_issued_in_the_same_second_after_it(self):
+        user = User.objects.create_user(username='rev', email='rev@example.com', password='Secret-pass-1')
+        revoke_user_tokens(user)
+        revoked_at = int(user.tokens_valid_after.timestamp())
+        self.assertFalse(is_token_revoked({'iat': revoked_at}, user))
+        self.assertTrue(is_token_revoked({'iat': revoked_at - 1}, user))
+    def email(self, **fields):
+        return OutboxEmail.objects.create(recipients=['admin@example.com'], subject='Report', body='Attached', **fields)
+
+    def test_email_claimed_by_a_dead_sender_is_sent_after_the_timeout(self):
+        stale = self.email(status='sending', claimed_at=timezone.now() - timedelta(hours=1))
+        recent = self.email(status='sending', claimed_at=timezone.now())
+        self.assertEqual(deliver_outbox(rate=0), (1, 0))
+        stale.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual((stale.status, recent.status), ('sent', 'sending'))
+
+    def test_waiting_email_fails_when_its_report_job_is_deleted(self):
+        user = User.objects.create_user(username='admin', email='admin@example.com', password='Secret-pass-1')
+        job = ReportJob.objects.create(requested_by=user, parameters={'name': 'Monthly', 'format': 'pdf'})
+        email = self.email(status='waiting', report_job=job)
+        self.assertEqual(deliver_outbox(rate=0), (0, 0))
+        job.delete()
+        self.assertEqual(deliver_outbox(rate=0), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'failed')
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class ReportJobRequeueTests(TestCase):
+    def test_only_jobs_without_recent_progress_are_requeued(self):
+        long_ago = timezone.now() - timedelta(hours=2)
+        rendering = ReportJob.objects.create(parameters={}, status='running', started_at=long_ago,
+                                             progress_updated_at=timezone.now())
+        dead = ReportJob.objects.create(parameters={}, status='running', started_at=long_ago,
+                                        progress_updated_at=long_ago)
+        self.assertEqual(requeue_stale_jobs(timedelta(minutes=30)), 1)
+        rendering.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual((rendering.status, dead.status), ('running', 'queued'))
+
+
+class ReportCacheKeyTests(TestCase):
+    def setUp(self):
+        AddPatients.objects.create(first_name='A', last_name='Test', category='OPD')
+        AddPatients.objects.create(first_name='B', last_name='Test', category='General')
+
+    def test_department_spelling_shares_key_and_result(self):
+        for spelling, expected in [('All', 2), ('all', 2), (' opd ', 1), ('OPD', 1)]:
+            params = serialize_report_params({'name': 'Monthly', 'format': 'pdf', 'department': spelling})
+            self.assertEqual(patient_queryset(params).count(), expected, spelling)
+        self.assertEqual(
+            report_cache.normalize_params({'name': 'Monthly', 'format': 'pdf', 'department': 'All'}),
+            report_cache.normalize_params({'name': 'Monthly', 'format': 'pdf', 'department': 'all'}),
+        )
+
+    @override_settings(REPORT_CACHE_WATERMARK_SECONDS=60)
+    def test_watermark_is_reused_until_a_watched_row_changes(self):
+        report_cache.invalidate_watermark()
+        with self.assertNumQueries(len(report_cache.WATERMARK_MODELS)):
+            first = report_cache.data_watermark()
+        with self.assertNumQueries(0):
+            self.assertEqual(report_cache.data_watermark(), first)
+        AddPatients.objects.create(first_name='C', last_name='Test')
+        self.assertNotEqual(report_cache.data_watermark(), first)
+
+
+class ServeMediaTests(SimpleTestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        for name in ('reports/summary.pdf', 'resources/leaflet.pdf'):
+            os.makedirs(os.path.join(media_root.name, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(media_root.name, name), 'wb') as f:
+                f.write(b'%PDF')
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, FILE_DELIVERY_BACKEND='python')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def serve(self, path):
+        return serve_media(RequestFactory().get(f"/media/{path}"), path)
+
+    def test_public_file_is_served(self):
+        self.assertEqual(self.serve('resources/leaflet.pdf').status_code, 200)
+
+    def test_protected_prefix_cannot_be_reached_by_another_spelling(self):
+        for path in ('reports/summary.pdf', './reports/summary.pdf', 'resources/../reports/summary.pdf',
+                     'resources/./../reports/summary.pdf', '../media/reports/summary.pdf'):
+            with self.subTest(path=path), self.assertRaises(Http404):
+                self.serve(path)
+
+
+class ProtectedFileUrlTests(TestCase):
+    def test_serializers_link_to_the_checked_views_not_media(self):
+        user = User.objects.create_user(username='owner', email='owner@example.com', password='Secret-pass-1')
+        patient = AddPatients.objects.create(first_name='A', last_name='Test')
+        lab_report = LabReport.objects.create(patient=patient, test_type='CBC', date=date(2026, 1, 1),
+                                              file='lab_reports/cbc.pdf', created_by=user)
+        report = Report.objects.create(name='Monthly', generated_by=user, file_path='reports/monthly.pdf')
+        context = {'request': RequestFactory().get('/api/reports/')}
+        data = LabReportSerializer(lab_report, context=context).data
+        self.assertNotIn('file', data)
+        self.assertEqual(data['file_url'], f"http://testserver/api/lab-reports/{lab_report.pk}/file/")
+        self.assertEqual(ReportSerializer(report, context=context).data['file_path'],
+                         f"http://testserver/api/reports/{report.pk}/view/")
+
+
+class StreamingTests(SimpleTestCase):
+    def test_ndjson_sends_the_first_record_before_buffering(self):
+        rows = ((i, 'x' * 100) for i in range(2000))
+        chunks = ndjson_stream(rows, ['id', 'note'])
+        self.assertEqual(next(chunks), '{"id":0,"note":"%s"}\n' % ('x' * 100))
+        self.assertEqual(sum(chunk.count('\n') for chunk in chunks), 1999)
+
+
+class CohortIndexTests(TestCase):
+    def test_every_table_clause_is_served_by_an_index(self):
+        checked = set()
+        for table, model, plan, uses_index in explain_clauses(SAMPLE_COHORT):
+            checked.add(table)
+            self.assertTrue(uses_index, f"{table} is not reached through an index of {model._meta.db_table}:\n{plan}")
+        self.assertEqual(checked, set(TABLES))
+
+
+@override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMIT_PROXY_HOPS=0,
+                   RATE_LIMITS={'login': ['ip:3/m', 'email:2/m']})
+class TokenBucketThrottleTests(SimpleTestCase):
+    def setUp(self):
+        backend = mock.patch.object(ratelimit, '_backend', ratelimit.MemoryBucketBackend())
+        backend.start()
+        self.addCleanup(backend.stop)
+        self.view = mock.Mock(throttle_scope='login')
+
+    def allowed(self, email, **meta):
+        request = RequestFactory().post('/api/login/', {'email': email}, content_type='application/json', **meta)
+        return ratelimit.TokenBucketThrottle().allow_request(Request(request, parsers=[JSONParser()]), self.view)
+
+    def test_forwarded_for_header_does_not_give_a_new_ip_bucket(self):
+        results = [self.allowed(f"user{i}@example.com", HTTP_X_FORWARDED_FOR=f"10.0.0.{i}") for i in range(4)]
+        self.assertEqual(results, [True, True, True, False])
+
+    @override_settings(RATE_LIMIT_PROXY_HOPS=1)
+    def test_only_the_address_the_proxy_appended_is_trusted(self):
+        results = [self.allowed(f"user{i}@example.com", HTTP_X_FORWARDED_FOR=f"10.0.0.{i}, 203.0.113.7")
+                   for i in range(4)]
+        self.assertEqual(results, [True, True, True, False])
+        self.assertTrue(self.allowed('other@example.com', HTTP_X_FORWARDED_FOR='203.0.113.8'))
+
+    def test_rejected_request_does_not_drain_other_rules(self):
+        self.assertEqual([self.allowed('victim@example.com') for _ in range(3)], [True, True, False])
+        # The rejected third request gave back its ip token, so one more address-wide request fits.
+        self.assertTrue(self.allowed('someone@example.com'))
+        self.assertFalse(self.allowed('someone-else@example.com'))
+
+
+@override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMIT_PROXY_HOPS=0,
+                   RATE_LIMITS={'login': ['ip:4/m', 'username:2/m'], 'token_refresh': ['ip:1/m']})
+class TokenEndpointThrottleTests(TestCase):
+    def setUp(self):
+        backend = mock.patch.object(ratelimit, '_backend', ratelimit.MemoryBucketBackend())
+        backend.start()
+        self.addCleanup(backend.stop)
+        self.client = APIClient()
+
+    def test_token_endpoints_cannot_bypass_the_login_limits(self):
+        self.client.post('/api/login/', {'email': 'a@example.com', 'password': 'wrong'}, format='json')
+        statuses = [self.client.post('/api/token/', {'username': name, 'password': 'wrong'}, format='json').status_code
+                    for name in ('victim', 'victim', 'victim', 'other', 'other')]
+        self.assertEqual(statuses, [401, 401, 429, 401, 429])
+        statuses = [self.client.post('/api/token/refresh/', {'refresh': 'junk'}, format='json').status_code
+                    for _ in range(2)]
+        self.assertEqual(statuses, [401, 429])
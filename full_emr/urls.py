@@ -12,11 +12,14 @@ from .views import CreateAccountView, LoginView, AddPatientsView, PatientDetailV
     SocialHistoryDetailView, FeedbackListCreateView, FeedbackDetailView, FeedbackResponseListCreateView, \
     SupportRequestListCreateView, SupportRequestDetailView, SupportResponseListCreateView, health_promotion_stats, \
     EducationalResourceDetailView, EducationalResourceListCreateView, HealthCampaignDetailView, \
-    HealthCampaignListCreateView, ForgotPasswordView, VerifyOTPView, ResetPasswordView
+    HealthCampaignListCreateView, ForgotPasswordView, VerifyOTPView, ResetPasswordView, CampaignMailingListCreateView, \
+    ReportJobDetailView, StreamReportExportView, LabReportFileView, EducationalResourceFileView, \
+    GenerateReportBatchView, cohort_analytics, ReportScheduleListCreateView, ReportScheduleDetailView, LogoutView
 
 urlpatterns = [
     path('register/', CreateAccountView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
+    path('logout/', LogoutView.as_view(), name='logout'),
     path('add-patient/', AddPatientsView.as_view(), name='add-patient'),
     path('patients/<int:pk>/', PatientDetailView.as_view(), name='patient-detail'),
     path('patients/<int:pk>/delete/', DeletePatientView.as_view(), name='delete-patient'),
@@ -24,6 +27,11 @@ urlpatterns = [
     path('patients/<int:pk>/update/', UpdatePatientView.as_view(), name='update-patient'),
     path('reports/', ListReportsView.as_view(), name='list-reports'),
     path('reports/generate/', GenerateReportView.as_view(), name='generate-report'),
+    path('reports/generate/batch/', GenerateReportBatchView.as_view(), name='generate-report-batch'),
+    path('reports/export/', StreamReportExportView.as_view(), name='stream-report-export'),
+    path('reports/jobs/<int:pk>/', ReportJobDetailView.as_view(), name='report-job-detail'),
+    path('reports/schedules/', ReportScheduleListCreateView.as_view(), name='report-schedule-list'),
+    path('reports/schedules/<int:pk>/', ReportScheduleDetailView.as_view(), name='report-schedule-detail'),
     path('reports/<int:pk>/view/', ViewReportView.as_view(), name='view-report'),
     path('reports/<int:pk>/data/', RetrieveReportDataView.as_view(), name='retrieve-report-data'),
     path('reports/export-all/', ExportAllReportsView.as_view(), name='export-all-reports'),
@@ -40,8 +48,10 @@ urlpatterns = [
     path('profile/', UserProfileView.as_view(), name='user-profile'),
     path('lab-reports/', LabReportListCreateView.as_view(), name='lab-report-list-create'),
     path('lab-reports/<int:pk>/', LabReportDetailView.as_view(), name='lab-report-detail'),
+    path('lab-reports/<int:pk>/file/', LabReportFileView.as_view(), name='lab-report-file'),
     path('workspace/dashboard/', workspace_dashboard, name='workspace_dashboard'),
     path('analytics/dashboard/', analytics_dashboard, name='analytics_dashboard'),
+    path('analytics/cohort/', cohort_analytics, name='cohort_analytics'),
     path('ehr/medical-history/', MedicalHistoryListCreateView.as_view(), name='medical_history_list'),
     path('ehr/medical-history/<int:pk>/', MedicalHistoryDetailView.as_view(), name='medical_history_detail'),
     path('ehr/vital-signs/', VitalSignsListCreateView.as_view(), name='vital_signs_list'),
@@ -56,8 +66,12 @@ urlpatterns = [
     path('ehr/social-history/<int:pk>/', SocialHistoryDetailView.as_view(), name='social_history_detail'),
     path('health-promotion/campaigns/', HealthCampaignListCreateView.as_view(), name='health_campaigns_list'),
     path('health-promotion/campaigns/<int:pk>/', HealthCampaignDetailView.as_view(), name='health_campaign_detail'),
+    path('health-promotion/campaigns/<int:campaign_id>/mailings/', CampaignMailingListCreateView.as_view(),
+         name='campaign_mailings'),
     path('health-promotion/resources/', EducationalResourceListCreateView.as_view(), name='educational_resources_list'),
     path('health-promotion/resources/<int:pk>/', EducationalResourceDetailView.as_view(), name='educational_resource_detail'),
+    path('health-promotion/resources/<int:pk>/file/', EducationalResourceFileView.as_view(),
+         name='educational_resource_file'),
     path('feedback/', FeedbackListCreateView.as_view(), name='feedback_list'),
     path('feedback/<int:pk>/', FeedbackDetailView.as_view(), name='feedback_detail'),
     path('feedback/<int:feedback_id>/responses/', FeedbackResponseListCreateView.as_view(), name='feedback_responses'),
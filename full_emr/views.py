@@ -1,11 +1,8 @@
 import os
-import csv
-import zipfile
-from io import BytesIO
 from datetime import datetime, date, timedelta
 
 from django.core.mail import send_mail, message
-from django.http import FileResponse, Http404
+from django.http import Http404, StreamingHttpResponse
 from django.conf import settings
 from django.utils import timezone
 from django.db.models import Q
@@ -14,22 +11,37 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework.views import APIView
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from openpyxl import Workbook
 import logging
 
 from .models import AddPatients, Report, User, Appointment, Invitation, Diagnostic, LabReport, SocialHistory, \
     FamilyHistory, Immunization, Allergy, VitalSigns, MedicalHistory, HealthCampaign, EducationalResource, Feedback, \
-    SupportRequest, FeedbackResponse, SupportResponse, OTP
+    SupportRequest, FeedbackResponse, SupportResponse, CampaignMailing, ReportJob, ReportSchedule
+from .file_delivery import serve_file
+from .otp import otp_store
+from .ratelimit import TokenBucketThrottle
+from .revocation import revoke_token, revoke_user_tokens
+from .mailing import render_email, OTP_EMAIL_SUBJECT, OTP_EMAIL_TEMPLATE, INVITATION_EMAIL_TEMPLATE, \
+    DEFAULT_CAMPAIGN_SUBJECT, DEFAULT_CAMPAIGN_BODY
+from .reports.batch import enqueue_batch
+from .reports.jobs import enqueue_report, claim_job, reuse_cached_report, run_job
+from .reports.cohort import apply_cohort
+from .reports.scheduler import next_run
+from .reports.queries import serialize_report_params, patient_queryset, iter_patient_rows, report_data_rows, \
+    patient_statistics, PATIENT_COLUMNS
+from .reports.renderers import report_file_name
+from .reports.streaming import csv_stream, ndjson_stream, json_array_stream
+from .reports.zipstream import zip_stream, unique_arcnames
 from .serializer import (
     CreateAccountSerializer, LoginSerializer, AddPatientSerializer, ReportSerializer,
     GenerateReportSerializer, AppointmentSerializer, InvitationSerializer, DiagnosticSerializer, UserProfileSerializer,
     LabReportSerializer, SocialHistorySerializer, FamilyHistorySerializer, ImmunizationSerializer, AllergySerializer,
     MedicalHistorySerializer, VitalSignsSerializer, HealthCampaignSerializer, EducationalResourceSerializer,
     FeedbackSerializer, FeedbackResponseSerializer, SupportRequestSerializer, SupportResponseSerializer,
-    ForgotPasswordSerializer, VerifyOTPSerializer, ResetPasswordSerializer
+    ForgotPasswordSerializer, VerifyOTPSerializer, ResetPasswordSerializer, CampaignMailingSerializer,
+    ReportJobSerializer, ReportExportSerializer, ReportDataQuerySerializer, GenerateReportBatchSerializer, \
+    CohortSerializer, ReportScheduleSerializer, LogoutSerializer
 )
 
 logger = logging.getLogger(__name__)
@@ -364,6 +376,8 @@ def analytics_dashboard(request):
     })
 class CreateAccountView(generics.CreateAPIView):
     serializer_class = CreateAccountSerializer
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'register'
 
     def create(self, request, *args, **kwargs):
         try:
@@ -397,6 +411,8 @@ class CreateAccountView(generics.CreateAPIView):
 
 class LoginView(generics.GenericAPIView):
     serializer_class = LoginSerializer
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'login'
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -405,8 +421,38 @@ class LoginView(generics.GenericAPIView):
         return Response(serializer.validated_data, status=status.HTTP_200_OK)
 
 
+class ThrottledTokenObtainPairView(TokenObtainPairView):
+    """simplejwt's username/password login, limited by the same buckets as LoginView."""
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'login'
+
+
+class ThrottledTokenRefreshView(TokenRefreshView):
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'token_refresh'
+
+
+class LogoutView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = LogoutSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        if serializer.validated_data['all_devices']:
+            revoke_user_tokens(request.user)
+        else:
+            if request.auth is not None:
+                revoke_token(request.auth)
+            if serializer.validated_data.get('refresh'):
+                revoke_token(serializer.validated_data['refresh'])
+        logger.info(f"User {request.user.id} logged out (all devices: {serializer.validated_data['all_devices']})")
+        return Response({'message': 'Logged out successfully.'}, status=status.HTTP_200_OK)
+
+
 class ForgotPasswordView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'otp_request'
 
     def post(self, request):
         serializer = ForgotPasswordSerializer(data=request.data)
@@ -428,10 +474,10 @@ class ForgotPasswordView(APIView):
                 }, status=status.HTTP_200_OK)
 
             # Generate OTP
-            otp = OTP.generate_otp(user, purpose='password_reset')
+            otp_code = otp_store.issue(user, 'password_reset', ttl=settings.OTP_TTL_MINUTES * 60)
 
             # Send OTP via email
-            self.send_otp_email(user, otp.otp_code)
+            self.send_otp_email(user, otp_code)
 
             logger.info(f"OTP sent to {email} for password reset")
 
@@ -442,28 +488,16 @@ class ForgotPasswordView(APIView):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     def send_otp_email(self, user, otp_code):
-        subject = "Password Reset Request - S10 Clinic"
-
-        message = f"""
-   Dear {user.get_full_name() or 'Valued Patient'},
-
-   We received a request to reset your password for your S10 Clinic account.
-
-   Here is your One-Time Password (OTP):
-
-   • {otp_code}
-
-   This OTP is valid for 10 minutes. Please do not share it with anyone for your account security.
-
-   If you did not request a password reset, you can safely ignore this email and your account will remain secure.
-
-   Best regards,
-   S10 Clinic Support Team
-       """
+        message = render_email(
+            OTP_EMAIL_TEMPLATE,
+            name=user.get_full_name() or 'Valued Patient',
+            otp_code=otp_code,
+            expiry_minutes=settings.OTP_TTL_MINUTES,
+        )
 
         send_mail(
-            subject,
-            message.strip(),
+            OTP_EMAIL_SUBJECT,
+            message,
             settings.DEFAULT_FROM_EMAIL,
             [user.email],
             fail_silently=False,
@@ -494,6 +528,8 @@ class AddPatientsView(generics.CreateAPIView):
 
 class VerifyOTPView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'otp_verify'
 
     def post(self, request):
         serializer = VerifyOTPSerializer(data=request.data)
@@ -508,22 +544,20 @@ class VerifyOTPView(APIView):
 
 class ResetPasswordView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'password_reset'
 
     def post(self, request):
         serializer = ResetPasswordSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.validated_data['user']
-            otp = serializer.validated_data['otp']
             new_password = serializer.validated_data['new_password']
 
-            # Set new password
+            # Set new password and sign out every existing session
             user.set_password(new_password)
+            revoke_user_tokens(user, save=False)
             user.save()
 
-            # Mark OTP as used
-            otp.is_used = True
-            otp.save()
-
             logger.info(f"Password reset successfully for user: {user.email}")
 
             return Response({
@@ -558,6 +592,25 @@ class HealthCampaignDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = HealthCampaign.objects.all()
 
 
+class CampaignMailingListCreateView(generics.ListCreateAPIView):
+    """Queue a campaign announcement mailing; `send_campaign_mailings` delivers it."""
+    serializer_class = CampaignMailingSerializer
+    permission_classes = [IsAuthenticated, IsDoctorOrNurse]
+
+    def get_queryset(self):
+        return CampaignMailing.objects.filter(campaign_id=self.kwargs.get('campaign_id'))
+
+    def perform_create(self, serializer):
+        campaign = generics.get_object_or_404(HealthCampaign, pk=self.kwargs.get('campaign_id'))
+        mailing = serializer.save(
+            campaign=campaign,
+            created_by=self.request.user,
+            subject=serializer.validated_data.get('subject') or DEFAULT_CAMPAIGN_SUBJECT,
+            body=serializer.validated_data.get('body') or DEFAULT_CAMPAIGN_BODY,
+        )
+        logger.info(f"Mailing {mailing.id} queued for campaign {campaign.id} by user {self.request.user.id}")
+
+
 class EducationalResourceListCreateView(generics.ListCreateAPIView):
     serializer_class = EducationalResourceSerializer
     permission_classes = [IsAuthenticated]
@@ -583,6 +636,16 @@ class EducationalResourceDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
     queryset = EducationalResource.objects.all()
 
+class EducationalResourceFileView(generics.RetrieveAPIView):
+    permission_classes = [IsAuthenticated]
+    queryset = EducationalResource.objects.all()
+
+    def retrieve(self, request, *args, **kwargs):
+        resource = self.get_object()
+        if not resource.file:
+            raise Http404("Resource has no file")
+        return serve_file(request, resource.file.name, private=False)
+
 
 # Feedback Views
 class FeedbackListCreateView(generics.ListCreateAPIView):
@@ -768,84 +831,106 @@ class GenerateReportView(generics.CreateAPIView):
     serializer_class = GenerateReportSerializer
     permission_classes = [IsAuthenticated, IsAuthorizedForReports]
 
-    def generate_file(self, name, file_format, patients, params):
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        base_path = os.path.join(settings.MEDIA_ROOT, 'reports')
-        os.makedirs(base_path, exist_ok=True)
-        file_name = f"{name.replace(' ', '_')}_{timestamp}.{file_format}"
-        file_path = os.path.join(base_path, file_name)
-
-        if file_format == 'pdf':
-            buffer = BytesIO()
-            p = canvas.Canvas(buffer, pagesize=letter)
-            p.drawString(100, 750, f"Report: {name}")
-            y = 700
-            if params.get('include_demographics'):
-                p.drawString(100, y, "Patient Demographics:")
-                y -= 20
-                for patient in patients:
-                    p.drawString(120, y, f"{patient.first_name} {patient.last_name} - Age: {patient.age}, Gender: {patient.gender}")
-                    y -= 20
-            p.showPage()
-            p.save()
-            with open(file_path, 'wb') as f:
-                f.write(buffer.getvalue())
-        elif file_format == 'excel':
-            wb = Workbook()
-            ws = wb.active
-            ws.title = name
-            ws.append(['Patient ID', 'First Name', 'Last Name', 'Age', 'Gender'])
-            for patient in patients:
-                ws.append([patient.id, patient.first_name, patient.last_name, patient.age, patient.gender])
-            wb.save(file_path)
-        elif file_format == 'csv':
-            with open(file_path, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['Patient ID', 'First Name', 'Last Name', 'Age', 'Gender'])
-                for patient in patients:
-                    writer.writerow([patient.id, patient.first_name, patient.last_name, patient.age, patient.gender])
-
-        logger.debug(f"Generated report file: {file_path}")
-        return f"reports/{file_name}"
-
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        params = serializer.validated_data.copy()
-
-        if 'date_range_start' in params and params['date_range_start']:
-            params['date_range_start'] = params['date_range_start'].isoformat()
-        if 'date_range_end' in params and params['date_range_end']:
-            params['date_range_end'] = params['date_range_end'].isoformat()
-
-        patients = AddPatients.objects.all()
-        if params.get('date_range_start'):
-            start_date = datetime.strptime(params['date_range_start'], '%Y-%m-%d')
-            start_date = timezone.make_aware(start_date)
-            patients = patients.filter(created_at__gte=start_date)
-        if params.get('date_range_end'):
-            end_date = datetime.strptime(params['date_range_end'], '%Y-%m-%d')
-            end_date = timezone.make_aware(end_date)
-            patients = patients.filter(created_at__lte=end_date)
-        if params.get('department') and params['department'] != 'all':
-            patients = patients.filter(category=params['department'])
-
-        file_path = self.generate_file(
-            params['name'],
-            params['format'],
-            patients,
-            params
-        )
+        params = serialize_report_params(serializer.validated_data)
+
+        # Identical parameters over unchanged data reuse the stored file without queueing.
+        job = reuse_cached_report(request.user, params)
+        if job:
+            return Response(ReportJobSerializer(job, context={'request': request}).data, status=status.HTTP_200_OK)
+
+        job = enqueue_report(request.user, params)
+        if settings.REPORT_JOBS_EAGER:
+            job = run_job(claim_job(job.id))
+        return Response(ReportJobSerializer(job, context={'request': request}).data, status=status.HTTP_202_ACCEPTED)
 
-        report = Report.objects.create(
-            name=params['name'],
-            generated_by=request.user,
-            file_path=file_path,
-            parameters=params,
-            format=params['format']
+class GenerateReportBatchView(APIView):
+    """Queue one report per department and format; run_report_worker --workers renders them in parallel."""
+    permission_classes = [IsAuthenticated, IsAuthorizedForReports]
+
+    def post(self, request):
+        serializer = GenerateReportBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = dict(serializer.validated_data)
+        departments, formats = data.pop('departments', None), data.pop('formats', None)
+
+        jobs = enqueue_batch(request.user, serialize_report_params(data), departments, formats)
+        if settings.REPORT_JOBS_EAGER:
+            jobs = [run_job(claim_job(job.id)) if job.status == 'queued' else job for job in jobs]
+        logger.info(f"User {request.user.id} queued a batch of {len(jobs)} reports: {data['name']}")
+        return Response(ReportJobSerializer(jobs, many=True, context={'request': request}).data, status=status.HTTP_202_ACCEPTED)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAuthorizedForReports])
+def cohort_analytics(request):
+    """Size and demographic breakdown of a cohort (see full_emr.reports.cohort for the language)"""
+    serializer = CohortSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    patients = apply_cohort(AddPatients.objects.all(), serializer.validated_data['cohort'])
+    stats = patient_statistics(patients)
+    return Response({
+        'total': stats['total'],
+        'average_age': round(stats['average_age'], 1) if stats['average_age'] is not None else None,
+        'by_gender': [{'gender': gender, 'count': count} for gender, count in stats['by_gender']],
+        'by_category': [{'category': category, 'count': count} for category, count in stats['by_category']],
+    })
+
+class ReportScheduleListCreateView(generics.ListCreateAPIView):
+    """Recurring reports; `run_report_scheduler` queues them off-peak and emails the recipients."""
+    serializer_class = ReportScheduleSerializer
+    permission_classes = [IsAuthenticated, IsAuthorizedForReports]
+
+    def get_queryset(self):
+        return ReportSchedule.objects.filter(created_by=self.request.user)
+
+    def perform_create(self, serializer):
+        schedule = serializer.save(
+            created_by=self.request.user, next_run_at=next_run(serializer.validated_data['cron_expression'])
         )
-        logger.info(f"Report {report.id} created by user {request.user.id}: {params['name']}")
-        return Response(ReportSerializer(report).data, status=status.HTTP_201_CREATED)
+        logger.info(f"Report schedule {schedule.id} created by user {self.request.user.id}: {schedule.cron_expression}")
+
+class ReportScheduleDetailView(generics.RetrieveUpdateDestroyAPIView):
+    serializer_class = ReportScheduleSerializer
+    permission_classes = [IsAuthenticated, IsAuthorizedForReports]
+
+    def get_queryset(self):
+        return ReportSchedule.objects.filter(created_by=self.request.user)
+
+    def perform_update(self, serializer):
+        cron_expression = serializer.validated_data.get('cron_expression', serializer.instance.cron_expression)
+        serializer.save(next_run_at=next_run(cron_expression))
+
+class ReportJobDetailView(generics.RetrieveAPIView):
+    serializer_class = ReportJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return ReportJob.objects.filter(requested_by=self.request.user).select_related('report')
+
+class StreamReportExportView(APIView):
+    """Stream matching patients as CSV or NDJSON straight from the database, without a temp file."""
+    permission_classes = [IsAuthenticated, IsAuthorizedForReports]
+
+    def get(self, request):
+        serializer = ReportExportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serialize_report_params(serializer.validated_data)
+
+        fields = [field for field, _ in PATIENT_COLUMNS]
+        rows = iter_patient_rows(patient_queryset(params), fields)
+
+        if params['export_format'] == 'ndjson':
+            response = StreamingHttpResponse(ndjson_stream(rows, fields), content_type='application/x-ndjson')
+        else:
+            response = StreamingHttpResponse(
+                csv_stream(rows, [header for _, header in PATIENT_COLUMNS]), content_type='text/csv'
+            )
+        file_name = report_file_name(params['name'], params['export_format'])
+        response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+        logger.info(f"Streaming {params['export_format']} export for user {request.user.id}")
+        return response
 
 class ViewReportView(generics.RetrieveAPIView):
     queryset = Report.objects.all()
@@ -857,12 +942,8 @@ class ViewReportView(generics.RetrieveAPIView):
         if report.generated_by != request.user:
             logger.error(f"User {request.user.id} attempted to access report {report.id} not owned")
             raise Http404("Report not found")
-        file_path = os.path.join(settings.MEDIA_ROOT, report.file_path.name)
-        if not os.path.exists(file_path):
-            logger.error(f"Report file missing: {file_path}")
-            raise Http404("File not found")
-        logger.debug(f"Serving report file: {file_path} to user {request.user.id}")
-        return FileResponse(open(file_path, 'rb'), as_attachment=True, filename=report.file_path.name)
+        logger.debug(f"Serving report file: {report.file_path.name} to user {request.user.id}")
+        return serve_file(request, report.file_path.name, as_attachment=True)
 
 class RetrieveReportDataView(generics.RetrieveAPIView):
     queryset = Report.objects.all()
@@ -876,46 +957,40 @@ class RetrieveReportDataView(generics.RetrieveAPIView):
             if report.generated_by != request.user:
                 logger.error(f"Report {report.id} not owned by user {request.user.id}")
                 raise Http404("Report not found")
-            params = report.parameters or {}
-            patients = AddPatients.objects.all()
-            if params.get('date_range_start'):
-                try:
-                    start_date = datetime.strptime(params['date_range_start'], '%Y-%m-%d')
-                    start_date = timezone.make_aware(start_date)
-                    patients = patients.filter(created_at__gte=start_date)
-                except ValueError as e:
-                    logger.error(f"Invalid date format: {params['date_range_start']}")
-                    raise Http404("Invalid date format")
-            if params.get('date_range_end'):
-                try:
-                    end_date = datetime.strptime(params['date_range_end'], '%Y-%m-%d')
-                    end_date = timezone.make_aware(end_date)
-                    patients = patients.filter(created_at__lte=end_date)
-                except ValueError as e:
-                    logger.error(f"Invalid date format: {params['date_range_end']}")
-                    raise Http404("Invalid date format")
-            if params.get('department') and params['department'] != 'all':
-                patients = patients.filter(category=params['department'])
-            patient_data = [
-                {
-                    'id': patient.id,
-                    'first_name': patient.first_name or "Unknown",
-                    'last_name': patient.last_name or "Unknown",
-                    'name': f"{patient.first_name or 'Unknown'} {patient.last_name or 'Unknown'}".strip(),
-                    'age': patient.age,
-                    'gender': patient.gender,
-                    'category': patient.category,
-                    'created_at': patient.created_at.isoformat(),
-                }
-                for patient in patients
-            ]
-            logger.debug(f"Found {len(patient_data)} patients for report {report.id}")
+            query = ReportDataQuerySerializer(data=request.query_params)
+            query.is_valid(raise_exception=True)
+            fields, after = query.validated_data['fields'], query.validated_data['after']
+
+            try:
+                patients = patient_queryset(report.parameters or {})
+            except ValueError:
+                logger.error(f"Invalid date format in parameters of report {report.id}")
+                raise Http404("Invalid date format")
+
+            if query.validated_data['stream']:
+                # Bulk consumers get every matching row as one JSON array, read through a server-side cursor.
+                rows = report_data_rows(patients, fields, after=after)
+                return StreamingHttpResponse(json_array_stream(rows), content_type='application/json')
+
+            limit = query.validated_data['limit']
+            # One extra row tells us whether another page exists without a COUNT(*).
+            patient_data = list(report_data_rows(patients, list(dict.fromkeys(fields + ['id'])), after=after,
+                                                 limit=limit + 1))
+            has_more = len(patient_data) > limit
+            patient_data = patient_data[:limit]
+            next_after = patient_data[-1]['id'] if has_more else None
+            if 'id' not in fields:
+                for row in patient_data:
+                    del row['id']
+            logger.debug(f"Returning {len(patient_data)} patients for report {report.id} after id {after}")
             return Response({
                 'report_name': report.name,
                 'generated_date': report.generated_date.isoformat(),
                 'generated_by': str(report.generated_by),
                 'format': report.format,
                 'patients': patient_data,
+                'next_after': next_after,
+                'has_more': has_more,
             }, status=status.HTTP_200_OK)
         except Report.DoesNotExist:
             logger.error(f"Report {self.kwargs['pk']} does not exist")
@@ -925,31 +1000,28 @@ class ExportAllReportsView(APIView):
     permission_classes = [IsAuthenticated, IsAuthorizedForReports]
 
     def get(self, request):
-        reports = Report.objects.filter(generated_by=request.user)
-        logger.debug(f"Found {reports.count()} reports for user {request.user.id}")
-        if not reports:
+        report_files = list(Report.objects.filter(generated_by=request.user).values_list('id', 'file_path'))
+        logger.debug(f"Found {len(report_files)} reports for user {request.user.id}")
+        if not report_files:
             logger.warning(f"No reports found for user {request.user.id}")
             return Response({"detail": "No reports found for this user."}, status=status.HTTP_404_NOT_FOUND)
 
-        zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for report in reports:
-                file_path = os.path.join(settings.MEDIA_ROOT, report.file_path.name)
-                if os.path.exists(file_path):
-                    zip_file.write(file_path, os.path.basename(report.file_path.name))
-                    logger.debug(f"Added report {report.id}: {file_path} to zip")
-                else:
-                    logger.warning(f"Report file missing for report {report.id}: {file_path}")
-            if not zip_file.namelist():
-                logger.warning(f"No valid report files found for user {request.user.id}")
-                return Response({"detail": "No valid report files available to export."}, status=status.HTTP_404_NOT_FOUND)
-        zip_buffer.seek(0)
-        logger.info(f"Exporting zip file for user {request.user.id}")
-        return FileResponse(
-            zip_buffer,
-            as_attachment=True,
-            filename=f"reports_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-        )
+        paths = []
+        for report_id, name in report_files:
+            file_path = os.path.join(settings.MEDIA_ROOT, name)
+            if os.path.exists(file_path):
+                paths.append(file_path)
+            else:
+                logger.warning(f"Report file missing for report {report_id}: {file_path}")
+        if not paths:
+            logger.warning(f"No valid report files found for user {request.user.id}")
+            return Response({"detail": "No valid report files available to export."}, status=status.HTTP_404_NOT_FOUND)
+
+        logger.info(f"Streaming zip of {len(paths)} report(s) for user {request.user.id}")
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        response = StreamingHttpResponse(zip_stream(unique_arcnames(paths)), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="reports_{timestamp}.zip"'
+        return response
 
 class ListAppointmentsView(generics.ListAPIView):
     serializer_class = AppointmentSerializer
@@ -1099,27 +1171,18 @@ class CreateInvitationView(generics.CreateAPIView):
             dates_list = "\n".join(
                 [f"• {date}" for date in formatted_dates]) if formatted_dates else "No specific dates suggested"
 
-            message = f"""
-Dear {invitation.patient.first_name or 'Patient'},
-
-You have been invited to schedule an appointment at our clinic.
-
-The following dates have been suggested for your appointment:
-{dates_list}
-
-Please log in to our patient portal to confirm your availability or suggest alternative dates.
-
-If you have any questions, please contact our office.
-
-Best regards,
-{request.user.get_full_name()}
-{request.user.role.title()}
-            """
+            message = render_email(
+                INVITATION_EMAIL_TEMPLATE,
+                patient_name=invitation.patient.first_name or 'Patient',
+                dates_list=dates_list,
+                sender_name=request.user.get_full_name(),
+                sender_role=request.user.role.title(),
+            )
 
             try:
                 send_mail(
                     subject,
-                    message.strip(),
+                    message,
                     settings.DEFAULT_FROM_EMAIL,
                     [patient_email],
                     fail_silently=False,
@@ -1162,13 +1225,17 @@ class DiagnosticListCreateView(APIView):
 class UserProfileView(APIView):
     permission_classes = [IsAuthenticated]
 
+    def get_user(self):
+        # request.user carries only SLIM_USER_FIELDS; load the whole row once rather than each deferred column.
+        return User.objects.get(pk=self.request.user.pk)
+
     def get(self, request):
-        serializer = UserProfileSerializer(request.user)
+        serializer = UserProfileSerializer(self.get_user())
         return Response(serializer.data)
 
     def put(self, request):
         serializer = UserProfileSerializer(
-            request.user,
+            self.get_user(),
             data=request.data,
             partial=True
         )
@@ -1210,6 +1277,19 @@ class LabReportDetailView(generics.RetrieveAPIView):
         logger.debug(f"Retrieving lab report {lab_report.id} for user {request.user.id}")
         return Response(self.get_serializer(lab_report).data)
 
+class LabReportFileView(generics.RetrieveAPIView):
+    queryset = LabReport.objects.all()
+    permission_classes = [IsAuthenticated]
+
+    def retrieve(self, request, *args, **kwargs):
+        lab_report = self.get_object()
+        if request.user.role != 'doctor' and lab_report.created_by != request.user:
+            logger.error(f"User {request.user.id} attempted to download lab report {lab_report.id} not owned")
+            raise Http404("Lab report not found")
+        if not lab_report.file:
+            raise Http404("Lab report has no file")
+        return serve_file(request, lab_report.file.name, as_attachment=True)
+
 
 class MedicalHistoryListCreateView(generics.ListCreateAPIView):
     serializer_class = MedicalHistorySerializer